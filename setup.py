@@ -78,8 +78,7 @@ setup(
     install_requires=[
         'tqdm>=4.56.0',
         'pandas>=1.2.0',
-        'xmltodict>=0.12.0',
-        'weightedstats>=0.4.1'
+        'numpy>=1.19.0'
     ],
     extras_require={},
     entry_points={
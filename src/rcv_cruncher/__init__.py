@@ -2,6 +2,7 @@ __version__ = '0.0.5'
 
 from rcv_cruncher.cvr.base import CastVoteRecord
 from rcv_cruncher.marks import BallotMarks
+from rcv_cruncher.matrix import BallotMatrix
 from rcv_cruncher.rcv.base import RCV
 
 from rcv_cruncher.rcv.variants import *
@@ -10,6 +10,8 @@ import pkg_resources
 import collections
 import datetime
 import abc
+import concurrent.futures
+import random
 
 import pandas as pd
 import tqdm
@@ -17,7 +19,10 @@ import tqdm
 from rcv_cruncher.cvr.base import CastVoteRecord
 from rcv_cruncher.rcv.base import RCV
 from rcv_cruncher.rcv.variants import get_rcv_dict
-from rcv_cruncher.parsers import get_parser_dict
+from rcv_cruncher.parsers import (get_parser_dict, get_multi_contest_parser)
+from rcv_cruncher.parse_cache import (cache_key, cached_parse, load_parsed_cvr, save_parsed_cvr)
+
+from rcv_cruncher.matrix import BallotMatrix
 
 import rcv_cruncher.util as util
 
@@ -27,11 +32,107 @@ rcv_dict = get_rcv_dict()
 parser_dict = get_parser_dict()
 
 
+# parsed cvrs for contest groups (contests read from the same CVR files), filled when the first contest of a group
+# is built and emptied as the rest are built. group key: {'remaining': Counter of offices, 'parsed': {office: cvr}}
+parsed_contest_groups = {}
+
+
+def parse_contest_group(contest_dict: Dict) -> Dict:
+    """
+    Parse every office in a contest group with the multi-contest parser, or load them all from the cvr cache
+    when each office was cached by an earlier run.
+    """
+    group_offices = sorted(set(contest_dict['contest_group'][1]))
+    parser_func = contest_dict['parser_func']
+    shared_args = {k: v for k, v in contest_dict['parser_args'].items() if k != 'office'}
+    cache_dir = contest_dict.get('cvr_cache_dir')
+
+    # entries are stored per office under the single contest parser, so cached results are shared with ungrouped runs
+    office_keys = {}
+    if cache_dir:
+        office_keys = {office: cache_key(parser_func, {**shared_args, 'office': office}) for office in group_offices}
+        cached = {office: load_parsed_cvr(cache_dir, key) for office, key in office_keys.items()}
+        if all(parsed_cvr is not None for parsed_cvr in cached.values()):
+            return cached
+
+    multi_parser = get_multi_contest_parser(parser_func)
+    parsed = multi_parser(offices=group_offices, **shared_args)
+
+    if cache_dir:
+        parsed = {office: save_parsed_cvr(cache_dir, office_keys[office], parsed_cvr)
+                  for office, parsed_cvr in parsed.items()}
+
+    return parsed
+
+
+def group_parsed_cvr(contest_dict: Dict) -> Dict:
+    """
+    Return the parsed cvr for a grouped contest, running the multi-contest parser for the whole group the first
+    time any contest in the group is requested. Returns None if the parser did not find the contest's office.
+    """
+    group_key, group_offices = contest_dict['contest_group']
+    office = contest_dict['parser_args']['office']
+
+    if group_key not in parsed_contest_groups:
+        parsed_contest_groups[group_key] = {
+            'remaining': collections.Counter(group_offices),
+            'parsed': parse_contest_group(contest_dict)
+        }
+
+    group = parsed_contest_groups[group_key]
+    group['remaining'][office] -= 1
+    if group['remaining'][office] > 0:
+        # another contest still needs these ballots, hand out a copy since the cvr constructor modifies its input
+        parsed_cvr = group['parsed'].get(office)
+        if parsed_cvr is not None:
+            parsed_cvr = {k: v.copy() if isinstance(v, BallotMatrix) else list(v) for k, v in parsed_cvr.items()}
+    else:
+        parsed_cvr = group['parsed'].pop(office, None)
+
+    if sum(group['remaining'].values()) <= 0:
+        del parsed_contest_groups[group_key]
+
+    return parsed_cvr
+
+
 def new_rcv_contest(contest_dict: Dict) -> Type[RCV]:
     """
     Pass in a dictionary and run the constructor function stored within it
     """
-    return contest_dict['rcv_type'](**{k: v for k, v in contest_dict.items() if k != 'rcv_type'})
+    constructor_args = {k: v for k, v in contest_dict.items()
+                        if k not in ['rcv_type', 'contest_group', 'cvr_cache_dir']}
+
+    parsed_cvr = None
+    if contest_dict.get('contest_group'):
+        parsed_cvr = group_parsed_cvr(contest_dict)
+    elif contest_dict.get('cvr_cache_dir') and contest_dict.get('parser_func'):
+        parsed_cvr = cached_parse(contest_dict['parser_func'], contest_dict['parser_args'], contest_dict['cvr_cache_dir'])
+
+    if parsed_cvr is not None:
+        del constructor_args['parser_func']
+        del constructor_args['parser_args']
+        constructor_args['parsed_cvr'] = parsed_cvr
+
+    return contest_dict['rcv_type'](**constructor_args)
+
+
+def group_contests(contest_set: List[Dict]) -> None:
+    """
+    Mark contests whose parser can read several contests at once and that share the same CVR files
+    (same parser and same parser arguments, other than office). Each marked contest gets a 'contest_group' entry
+    holding the group key and the list of offices in the group, so the CVR files are only parsed once per group.
+    """
+    groups = collections.defaultdict(list)
+    for contest in contest_set:
+        if get_multi_contest_parser(contest['parser_func']) and 'office' in contest['parser_args']:
+            shared_args = tuple(sorted((k, str(v)) for k, v in contest['parser_args'].items() if k != 'office'))
+            groups[(contest['parser_func'].__name__, shared_args)].append(contest)
+
+    for group_key, group in groups.items():
+        if len(group) > 1:
+            group_offices = [contest['parser_args']['office'] for contest in group]
+            for contest in group:
+                contest['contest_group'] = (group_key, group_offices)
 
 
 def flatten_rcv_stats(stats: List[pd.DataFrame]) -> pd.DataFrame:
@@ -56,7 +157,7 @@ def flatten_rcv_stats(stats: List[pd.DataFrame]) -> pd.DataFrame:
         'restrictive_rank_limit'
     ]
 
-    flat_df = stats[0]
+    flat_df = stats[0].copy()
     if len(stats) > 1:
         for other_tabulations in stats[1:]:
             for col in other_tabulations.columns:
@@ -126,20 +227,13 @@ def cast_func(s):
         return parser_dict[s]
 
 
-def read_contest_set(contest_set_path, override_cvr_root_dir=None):
+def read_contest_set(contest_set_path, override_cvr_root_dir=None, override_cvr_cache_dir=None):
 
     contest_set_path = pathlib.Path(contest_set_path)
 
     # assemble typecast funcs
-    global cast_str
-    global cast_int
-    global cast_dict
-    global cast_bool
-    global cast_func
-    global cast_list
-
-    cast_dict = {'str': cast_str, 'int': cast_int, 'dict': cast_dict,
-                 'bool': cast_bool, 'func': cast_func, 'list': cast_list}
+    cast_funcs = {'str': cast_str, 'int': cast_int, 'dict': cast_dict,
+                  'bool': cast_bool, 'func': cast_func, 'list': cast_list}
 
     # settings/defaults
     contest_set_settings_fpath = f'{os.path.dirname(__file__)}/contest_set_settings.json'
@@ -192,6 +286,10 @@ def read_contest_set(contest_set_path, override_cvr_root_dir=None):
 
     run_config['cvr_path_root'] = pathlib.Path(run_config['cvr_path_root'])
 
+    if override_cvr_cache_dir:
+        run_config['cvr_cache_dir'] = override_cvr_cache_dir
+    run_config['cvr_cache_dir'] = pathlib.Path(run_config['cvr_cache_dir']) if run_config['cvr_cache_dir'] else None
+
     # read contest_set.csv
     contest_set_fpath = contest_set_path / 'contest_set.csv'
     if os.path.isfile(contest_set_fpath) is False:
@@ -211,7 +309,7 @@ def read_contest_set(contest_set_path, override_cvr_root_dir=None):
             print(f'info -- "{col}" is an unrecognized column in contest_set.csv, it will be ignored.')
         else:
             contest_set_df[col] = contest_set_df[col].fillna(contest_set_settings[col]['default'])
-            contest_set_df[col] = [cast_dict[contest_set_settings[col]['type']](i) for i in contest_set_df[col].tolist()]
+            contest_set_df[col] = [cast_funcs[contest_set_settings[col]['type']](i) for i in contest_set_df[col].tolist()]
 
     # convert df to listOdicts, one dict per row
     competitions = contest_set_df.to_dict('records')
@@ -242,8 +340,15 @@ def read_contest_set(contest_set_path, override_cvr_root_dir=None):
         del copy_comp['extra_parser_args']
         del copy_comp['ignore_contest']
 
+        # parsed cvrs are stored and reused from here, if set
+        if run_config['cvr_cache_dir']:
+            copy_comp['cvr_cache_dir'] = run_config['cvr_cache_dir']
+
         valid_competitions.append(copy_comp)
 
+    # contests read from the same multi-contest CVR share one parse
+    group_contests(valid_competitions)
+
     # store file locations
     run_config['contest_set_file_path'] = contest_set_fpath
     run_config['run_config_file_path'] = run_config_fpath
@@ -330,7 +435,7 @@ def write_aggregated_stats(results_dir,
 
 class Steps(abc.ABC):
 
-    def __init__(self, contest, output_config, converted_cvr_dir, results_dir, pbar_desc):
+    def __init__(self, contest, output_config, converted_cvr_dir, results_dir, pbar_desc, quiet=False):
 
         self.contest = contest
         self.output_config = output_config
@@ -338,6 +443,7 @@ class Steps(abc.ABC):
         self.converted_cvr_cand_fmt_dir = converted_cvr_dir / 'candidate'
         self.results_dir = results_dir
         self.pbar_desc = pbar_desc
+        self.quiet = quiet
         self.error_log_writers = []
 
         self.state_data = {
@@ -367,9 +473,9 @@ class Steps(abc.ABC):
         self.steps = self.generate_steps()
 
         for k in self.steps:
-            for cache_key in cache_keys:
-                if cache_key in cache[k]:
-                    self.steps[k][cache_key] = cache[k][cache_key]
+            for k2 in cache_keys:
+                if k2 in cache[k]:
+                    self.steps[k][k2] = cache[k][k2]
 
     @abc.abstractmethod
     def generate_steps(self):
@@ -405,7 +511,8 @@ class Steps(abc.ABC):
 
         step_reached = 0
 
-        pbar = tqdm.tqdm(total=self.n_steps(), bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt}{postfix}', colour='GREEN')
+        pbar = tqdm.tqdm(total=self.n_steps(), bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt}{postfix}', colour='GREEN',
+                         disable=self.quiet)
         pbar.set_description(self.pbar_desc)
 
         next_step = self.next_step()
@@ -483,7 +590,7 @@ class CrunchSteps(Steps):
             ('tabulation_stats', {
                 'f': RCV.get_stats,
                 'args': [self.state_data['rcv_object']],
-                'condition': self.output_config.get('per_rcv_type_stats'),
+                'condition': self.output_config.get('per_rcv_type_stats') or self.output_config.get('per_rcv_group_stats'),
                 'depends_on': ['init_rcv'],
                 'fail_with': [],
                 'return_key': 'tabulation_stats_df'
@@ -500,7 +607,7 @@ class CrunchSteps(Steps):
                 'f': flatten_rcv_stats,
                 'args': [self.state_data.get('tabulation_stats_df')],
                 'condition': self.output_config.get('per_rcv_group_stats'),
-                'depends_on': ['init_rcv'],
+                'depends_on': ['tabulation_stats'],
                 'fail_with': [],
                 'return_key': 'contest_stats_df'
             }),
@@ -635,6 +742,50 @@ class CrunchSteps(Steps):
         ])
 
 
+# state returned from a crunched contest, everything else (including the rcv object) stays in the worker
+crunch_return_keys = [
+    'n_errors',
+    'variant',
+    'variant_group',
+    'candidate_details',
+    'tabulation_stats_df',
+    'contest_stats_df',
+    'winner_choice_position_df',
+    'candidate_rank_usage_df',
+    'split_stats'
+]
+
+error_log_header = ['contest', 'cruncher_step', 'message']
+
+
+def crunch_contest(contest, output_config, converted_cvr_dir, results_dir, pbar_desc='', quiet=False):
+    """
+    Run CrunchSteps for a single contest, with random tie breaks seeded from the contest.
+    Per-contest files are written directly to the output directories.
+    Returns only the small aggregated results, plus the error log rows, so that it can run in a worker process.
+    """
+    error_logger = util.ListLogger(error_log_header)
+
+    # tied losers are picked at random, seeding from the contest keeps the pick the same in any worker process
+    random.seed(f'{contest["jurisdiction"]}_{contest["date"]}_{contest["office"]}')
+
+    steps = CrunchSteps(contest, output_config, converted_cvr_dir, results_dir, pbar_desc, quiet=quiet)
+    steps.update_error_log_writers([error_logger])
+    steps.run_steps()
+
+    crunch_returns = steps.return_results()
+    results = {k: crunch_returns.get(k) for k in crunch_return_keys}
+    results['error_rows'] = error_logger.rows
+    return results
+
+
+def crunch_contests(contests, output_config, converted_cvr_dir, results_dir):
+    """
+    Crunch several contests in order in one (worker) process. Returns a list of crunch_contest results.
+    """
+    return [crunch_contest(contest, output_config, converted_cvr_dir, results_dir, quiet=True) for contest in contests]
+
+
 def write_input_dir(results_dir, output_config, start_time, end_time):
 
     # copy input files
@@ -656,7 +807,13 @@ def write_input_dir(results_dir, output_config, start_time, end_time):
     shutil.copy2(output_config['contest_set_file_path'], log_contest_set_fname)
 
 
-def crunch_contest_set(contest_set, output_config, path_to_output, fresh_output=False):
+def crunch_contest_set(contest_set, output_config, path_to_output, fresh_output=False, jobs=1):
+    """
+    Crunch each contest in the contest set and write out aggregated results.
+
+    With jobs > 1, contests are crunched in a pool of that many worker processes. Results and error log rows are
+    still collected in contest set order, so output files match a serial run.
+    """
 
     start_time = datetime.datetime.now()
 
@@ -693,27 +850,56 @@ def crunch_contest_set(contest_set, output_config, path_to_output, fresh_output=
     allsplit_rcv_group_stats_df_dict = {variant_group: [] for variant_group in ['single_winner', 'multi_winner']}
 
     # init logger
-    header_list = ['contest', 'cruncher_step', 'message']
     error_log_path = results_dir / 'error_log.csv'
-    error_logger = util.CSVLogger(error_log_path, header_list)
+    error_logger = util.CSVLogger(error_log_path, error_log_header)
 
     n_errors = 0
     #########################
     # LOOP TROUGH CONTESTS
 
-    for idx, contest in enumerate(contest_set):
+    def serial_crunch():
+        for idx, contest in enumerate(contest_set):
+            pbar_desc = f'{idx+1} of {len(contest_set)} contests: '
+            pbar_desc += f'{contest["jurisdiction"]} {contest["date"]} {contest["office"]}'
+            if n_errors:
+                pbar_desc = f'[{n_errors} ERRORS SO FAR] ' + pbar_desc
+            yield crunch_contest(contest, output_config, converted_cvr_dir, results_dir, pbar_desc)
+
+    def parallel_crunch(executor):
+
+        # contests sharing a parse (see group_contests) are crunched together by one worker
+        units = collections.OrderedDict()
+        for idx, contest in enumerate(contest_set):
+            unit_key = contest['contest_group'][0] if contest.get('contest_group') else idx
+            units.setdefault(unit_key, []).append(idx)
+
+        futures = {}
+        contest_unit = {}
+        for unit_key, unit_idxs in units.items():
+            futures[unit_key] = executor.submit(crunch_contests,
+                                                [contest_set[idx] for idx in unit_idxs],
+                                                output_config, converted_cvr_dir, results_dir)
+            contest_unit.update({idx: (unit_key, pos) for pos, idx in enumerate(unit_idxs)})
+
+        pbar = tqdm.tqdm(total=len(contest_set), bar_format='{l_bar}{bar}| {n_fmt}/{total_fmt}', colour='GREEN')
+        pbar.set_description(f'contests ({jobs} jobs)')
+
+        # yield results in contest set order, regardless of which worker finishes first
+        for idx in range(len(contest_set)):
+            unit_key, pos = contest_unit[idx]
+            yield futures[unit_key].result()[pos]
+            pbar.update(1)
+            if n_errors:
+                pbar.set_description(f'[{n_errors} ERRORS SO FAR] contests ({jobs} jobs)')
+        pbar.close()
 
-        # RUN OPERATIONS
-        pbar_desc = f'{idx+1} of {len(contest_set)} contests: '
-        pbar_desc += f'{contest["jurisdiction"]} {contest["date"]} {contest["office"]}'
-        if n_errors:
-            pbar_desc = f'[{n_errors} ERRORS SO FAR] ' + pbar_desc
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    crunched_contests = parallel_crunch(executor) if executor else serial_crunch()
 
-        steps = CrunchSteps(contest, output_config, converted_cvr_dir, results_dir, pbar_desc)
-        steps.update_error_log_writers([error_logger])
-        steps.run_steps()
+    for contest, crunch_returns in zip(contest_set, crunched_contests):
 
-        crunch_returns = steps.return_results()
+        for row in crunch_returns['error_rows']:
+            error_logger.write(row)
         n_errors += crunch_returns['n_errors']
 
         # STORE RESULTS
@@ -771,6 +957,9 @@ def crunch_contest_set(contest_set, output_config, path_to_output, fresh_output=
         if 'cvr' in contest:
             del contest['cvr']
 
+    if executor:
+        executor.shutdown()
+
     # close logs
     error_logger.close()
     if not error_logger.lines_added:
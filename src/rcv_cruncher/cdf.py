@@ -0,0 +1,127 @@
+from typing import (Dict, List, Optional)
+
+import array
+import concurrent.futures
+import pathlib
+import xml.etree.ElementTree as ET
+
+# selection codes for contest selections without a single candidate, others index the report positions
+SKIPPED = -2
+OVERVOTE = -1
+
+
+def _namespace(tag: str) -> str:
+    return tag[:tag.index('}') + 1] if tag.startswith('{') else ''
+
+
+def read_cvr_report(xml_path) -> Dict:
+    """
+    Stream a NIST Common Data Format (CDF) CastVoteRecordReport xml file, clearing each CVR element once it has
+    been read so memory use does not grow with the size of the report.
+
+    For every contest of the current snapshot of each CVR, the rank and selection of its CVRContestSelection
+    are recorded. A selection is SKIPPED when no votes were counted, OVERVOTE when it holds more than one
+    SelectionPosition and otherwise the index of its Position value in 'positions'.
+
+    :return: A dictionary with 'candidates' (candidate ObjectId to Name), 'positions' (list of Position values)
+        and 'contests' (ContestId to arrays 'rank' and 'selection', one entry per CVR in file order).
+    """
+    candidates = {}
+    positions = []
+    position_codes = {}
+    contests = {}
+
+    context = ET.iterparse(str(xml_path), events=('start', 'end'))
+    _, report = next(context)
+    ns = _namespace(report.tag)
+
+    cvr_tag = f'{ns}CVR'
+    candidate_tag = f'{ns}Candidate'
+
+    for event, elem in context:
+
+        if event != 'end':
+            continue
+
+        if elem.tag == cvr_tag:
+
+            snapshots = elem.findall(f'{ns}CVRSnapshot')
+            current_id = elem.findtext(f'{ns}CurrentSnapshotId')
+            snapshot = next((s for s in snapshots if s.get('ObjectId') == current_id), snapshots[0])
+
+            for contest in snapshot.iterfind(f'{ns}CVRContest'):
+
+                selection = contest.find(f'{ns}CVRContestSelection')
+                selection_positions = selection.findall(f'{ns}SelectionPosition')
+
+                if len(selection_positions) > 1:
+                    selection_code = OVERVOTE
+                elif selection_positions:
+                    position = selection_positions[0].findtext(f'{ns}Position')
+                    selection_code = position_codes.get(position)
+                    if selection_code is None:
+                        selection_code = position_codes[position] = len(positions)
+                        positions.append(position)
+                elif selection.findtext(f'{ns}TotalNumberVotes') == '0':
+                    selection_code = SKIPPED
+                else:
+                    raise RuntimeError(f'CVRContestSelection in {xml_path} has no SelectionPosition '
+                                       'and is not marked as zero votes.')
+
+                contest_id = contest.findtext(f'{ns}ContestId')
+                if contest_id not in contests:
+                    contests[contest_id] = {'rank': array.array('i'), 'selection': array.array('i')}
+                contests[contest_id]['rank'].append(int(selection.findtext(f'{ns}Rank')))
+                contests[contest_id]['selection'].append(selection_code)
+
+            # drop the finished CVR (and anything before it) from the tree
+            report.clear()
+
+        elif elem.tag == candidate_tag:
+            candidates[elem.get('ObjectId')] = elem.findtext(f'{ns}Name')
+
+    return {'candidates': candidates, 'positions': positions, 'contests': contests}
+
+
+def read_cvr_reports(xml_paths: List, n_workers: Optional[int] = 1) -> Dict:
+    """
+    Read several CDF report files (in worker processes if n_workers > 1) and combine them in the given order.
+    Positions are renumbered across files. Candidates found in more than one file take their last name.
+
+    :return: Same layout as :func:`read_cvr_report`.
+    """
+    xml_paths = [pathlib.Path(xml_path) for xml_path in xml_paths]
+    n_workers = int(n_workers or 1)
+
+    executor = None
+    if n_workers > 1 and len(xml_paths) > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(n_workers, len(xml_paths)))
+        reports = executor.map(read_cvr_report, xml_paths)
+    else:
+        reports = (read_cvr_report(xml_path) for xml_path in xml_paths)
+
+    combined = {'candidates': {}, 'positions': [], 'contests': {}}
+    position_codes = {}
+    try:
+        for report in reports:
+
+            combined['candidates'].update(report['candidates'])
+
+            # map the positions of this file onto the combined list, keeping SKIPPED and OVERVOTE
+            recode = {SKIPPED: SKIPPED, OVERVOTE: OVERVOTE}
+            for code, position in enumerate(report['positions']):
+                if position not in position_codes:
+                    position_codes[position] = len(combined['positions'])
+                    combined['positions'].append(position)
+                recode[code] = position_codes[position]
+
+            for contest_id, contest in report['contests'].items():
+                if contest_id not in combined['contests']:
+                    combined['contests'][contest_id] = {'rank': array.array('i'), 'selection': array.array('i')}
+                combined['contests'][contest_id]['rank'].extend(contest['rank'])
+                combined['contests'][contest_id]['selection'].extend(recode[code] for code in contest['selection'])
+    finally:
+        if executor:
+            executor.shutdown()
+
+    return combined
@@ -29,12 +29,18 @@ def main():
     p.add_argument('contest_set_path', help="Path to directory containing contest_set.csv and run_config.json.")
     p.add_argument('--fresh', action='store_true',
                    help='Delete existing results/ and converted_cvr/ directories located in contest set directory')
+    p.add_argument('--jobs', '-j', type=int, default=1,
+                   help='Number of worker processes used to crunch contests in parallel (default: 1).')
+    p.add_argument('--cvr-cache-dir',
+                   help='Directory where parsed CVRs are stored and reused by later runs with unchanged input files. '
+                        'Overrides cvr_cache_dir in run_config.txt.')
     # p.add_argument('--output_path', help='By default all output will be written to contest_set_path,'
     #                                      'provide this argument to specify an alternative.')
 
     args = p.parse_args()
     contest_set_path = args.contest_set_path
     fresh = args.fresh
+    jobs = args.jobs
     output_path = contest_set_path  # args.output_path if args.output_path else args.contest_set_path
 
     if not os.path.isabs(contest_set_path):
@@ -43,6 +49,9 @@ def main():
     if not os.path.isdir(contest_set_path):
         raise RuntimeError(f'invalid path [contest_set_path]: {contest_set_path}')
 
+    if jobs < 1:
+        raise RuntimeError(f'invalid number of jobs [--jobs]: {jobs}')
+
     # if not os.path.isabs(output_path):
     #     output_path = f'{os.getcwd()}/{output_path}'
 
@@ -50,9 +59,9 @@ def main():
     #     raise RuntimeError(f'invalid path [output_path]: {output_path}')
 
     # read in contest set info
-    contest_set, run_config = batch.read_contest_set(contest_set_path)
+    contest_set, run_config = batch.read_contest_set(contest_set_path, override_cvr_cache_dir=args.cvr_cache_dir)
 
     # analyze contests
-    batch.crunch_contest_set(contest_set, run_config, output_path, fresh_output=fresh)
+    batch.crunch_contest_set(contest_set, run_config, output_path, fresh_output=fresh, jobs=jobs)
 
     return(0)
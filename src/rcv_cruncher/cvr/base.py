@@ -2,13 +2,15 @@ from __future__ import annotations
 from typing import (Callable, Dict, Optional, List, Type, Union, Tuple)
 
 import decimal
-import collections
 import re
 import pathlib
 
+import numpy as np
 import pandas as pd
 
 from rcv_cruncher.marks import BallotMarks
+from rcv_cruncher.matrix import BallotMatrix
+from rcv_cruncher.numeric import get_numeric_backend
 from rcv_cruncher.cvr.tables import CastVoteRecord_tables
 from rcv_cruncher.cvr.stats import CastVoteRecord_stats
 
@@ -30,7 +32,7 @@ class CastVoteRecord(CastVoteRecord_stats, CastVoteRecord_tables):
     def write_cvr_table(cvr: Type[CastVoteRecord],
                         table_format: str = "rank",
                         save_dir: Union[str, pathlib.Path] = None) -> None:
-        uid = cvr.stats()[0]['unique_id'].item()
+        uid = cvr.get_id_info()['unique_id']
         save_path = pathlib.Path(save_dir) / f'{uid}.csv'
         cvr.cvr_table(table_format=table_format).to_csv(save_path, index=False)
 
@@ -42,7 +44,7 @@ class CastVoteRecord(CastVoteRecord_stats, CastVoteRecord_tables):
     def write_cumulative_ranking_tables(cvr: Type[CastVoteRecord],
                                         save_dir: Union[str, pathlib.Path] = None) -> None:
         count_df, percent_df = cvr.cumulative_ranking_tables()
-        uid = cvr.stats()[0]['unique_id'].item()
+        uid = cvr.get_id_info()['unique_id']
 
         save_path = pathlib.Path(save_dir) / 'cumulative_ranking'
         save_path.mkdir(exist_ok=True)
@@ -58,7 +60,7 @@ class CastVoteRecord(CastVoteRecord_stats, CastVoteRecord_tables):
     def write_first_second_tables(cvr: Type[CastVoteRecord],
                                   save_dir: Union[str, pathlib.Path] = None) -> None:
         count_df, percent_df, percent_no_exhaust_df = cvr.first_second_tables()
-        uid = cvr.stats()[0]['unique_id'].item()
+        uid = cvr.get_id_info()['unique_id']
 
         save_path = pathlib.Path(save_dir) / 'first_second_choices'
         save_path.mkdir(exist_ok=True)
@@ -75,7 +77,7 @@ class CastVoteRecord(CastVoteRecord_stats, CastVoteRecord_tables):
     def write_rank_usage_table(cvr: Type[CastVoteRecord],
                                save_dir: Union[str, pathlib.Path] = None) -> None:
         df = cvr.rank_usage_table()
-        uid = cvr.stats()[0]['unique_id'].item()
+        uid = cvr.get_id_info()['unique_id']
 
         save_path = pathlib.Path(save_dir) / 'rank_usage'
         save_path.mkdir(exist_ok=True)
@@ -90,7 +92,7 @@ class CastVoteRecord(CastVoteRecord_stats, CastVoteRecord_tables):
     def write_crossover_table(cvr: Type[CastVoteRecord],
                               save_dir: Union[str, pathlib.Path] = None) -> None:
         count_df, percent_df = cvr.crossover_tables()
-        uid = cvr.stats()[0]['unique_id'].item()
+        uid = cvr.get_id_info()['unique_id']
 
         save_path = pathlib.Path(save_dir) / 'opponent_crossover'
         save_path.mkdir(exist_ok=True)
@@ -106,7 +108,7 @@ class CastVoteRecord(CastVoteRecord_stats, CastVoteRecord_tables):
     def write_condorcet_tables(cvr: Type[CastVoteRecord],
                                save_dir: Union[str, pathlib.Path] = None) -> None:
         count_df, percent_df, condorcet_winner = cvr.condorcet_tables()
-        uid = cvr.stats()[0]['unique_id'].item()
+        uid = cvr.get_id_info()['unique_id']
 
         save_path = pathlib.Path(save_dir) / 'condorcet'
         save_path.mkdir(exist_ok=True)
@@ -124,7 +126,9 @@ class CastVoteRecord(CastVoteRecord_stats, CastVoteRecord_tables):
                  parser_func: Optional[Callable] = None,
                  parser_args: Optional[Dict] = None,
                  parsed_cvr: Optional[Dict] = None,
-                 split_fields: Optional[List] = None) -> None:
+                 split_fields: Optional[List] = None,
+                 numeric_backend: str = 'decimal',
+                 fixed_point_places: int = 6) -> None:
 
         # ID INFO
         self.jurisdiction = jurisdiction
@@ -146,11 +150,18 @@ class CastVoteRecord(CastVoteRecord_stats, CastVoteRecord_tables):
             'unique_id': [self.unique_id]
         })
 
+        # arithmetic used for weights during tabulation
+        self._numeric = get_numeric_backend(numeric_backend, fixed_point_places=fixed_point_places)
+
         self._parsed_cvr = self._prepare_parsed_cvr(parser_func=parser_func,
                                                     parser_args=parser_args,
                                                     parsed_cvr=parsed_cvr)
         self._modified_cvrs = {}
+        self._modified_matrices = {}
+        self._pairwise_matrices = {}
         self._candidate_sets = {}
+        self._stats_cache = {}
+        self._stat_tables = {}
         self._rule_sets = {}
 
         # make a default rule set that is just the parsed cvr
@@ -158,15 +169,7 @@ class CastVoteRecord(CastVoteRecord_stats, CastVoteRecord_tables):
         self.add_rule_set(self._default_rule_set_name, BallotMarks.new_rule_set())
 
         # STAT INFO
-
-        self._cvr_stat_table = None
-        self._compute_cvr_stat_table()
-
-        self._summary_cvr_stat_table = None
-        self._compute_summary_cvr_stat_table()
-
-        self._split_filter_dict = {}
-        self._summary_cvr_split_stat_table = None
+        # stat tables are computed on first use and kept in _stat_tables, see CastVoteRecord_stats
 
     # CVR MODS
     def _prepare_parsed_cvr(self,
@@ -199,13 +202,13 @@ class CastVoteRecord(CastVoteRecord_stats, CastVoteRecord_tables):
         if not isinstance(parsed_cvr['weight'][0], decimal.Decimal):
             parsed_cvr['weight'] = [decimal.Decimal(str(i)) for i in parsed_cvr['weight']]
 
-        parsed_cvr['ballot_marks'] = [BallotMarks(ranks) for ranks in parsed_cvr['ranks']]
+        # ranks are stored as a single integer-coded matrix, BallotMarks objects are only built on request
+        if isinstance(parsed_cvr['ranks'], BallotMatrix):
+            parsed_cvr['ballot_matrix'] = parsed_cvr['ranks']
+        else:
+            parsed_cvr['ballot_matrix'] = BallotMatrix.from_rank_lists(parsed_cvr['ranks'])
         del parsed_cvr['ranks']
 
-        ballot_lengths = collections.Counter(len(b.marks) for b in parsed_cvr['ballot_marks'])
-        if len(ballot_lengths) > 1:
-            raise RuntimeError(f'Parsed CVR contains ballots with unequal length rank lists. {str(ballot_lengths)}')
-
         field_lengths = {k: len(parsed_cvr[k]) for k in parsed_cvr}
         if len(set(field_lengths.values())) > 1:
             raise RuntimeError(f'Parsed CVR contains fields of unequal length. {str(field_lengths)}')
@@ -231,27 +234,61 @@ class CastVoteRecord(CastVoteRecord_stats, CastVoteRecord_tables):
         if rule_set_name not in self._rule_sets:
             raise RuntimeError(f'rule set {rule_set_name} has not yet been added using add_rule_set().')
 
-        cvr = {k: v for k, v in self._parsed_cvr.items()}
-        cvr['ballot_marks'] = [b.copy() for b in cvr['ballot_marks']]
+        # the copy shares the parsed ranks, only ballots changed by the rules are stored for the rule set
+        ballot_matrix = self._parsed_cvr['ballot_matrix'].copy()
+        ballot_matrix.apply_rules(**self._rule_sets[rule_set_name])
+
+        self._modified_matrices.update({rule_set_name: ballot_matrix})
+
+    def _make_pairwise_matrix(self, rule_set_name: str) -> None:
+
+        # only the first ranking of a candidate matters for head-to-head comparisons
+        ballot_matrix = BallotMatrix.remove_duplicate_candidate_codes(self.get_ballot_matrix(rule_set_name))
 
-        for ballot in cvr['ballot_marks']:
-            ballot.apply_rules(**self._rule_sets[rule_set_name])
+        # every candidate in the code table is included, even if no ballot ranks them under this rule set
+        candidates = ballot_matrix.codes[BallotMatrix.WRITEIN_CODE:]
+        n_candidates = len(candidates)
+        candidate_idx = ballot_matrix.ranks.astype(np.int64) - BallotMatrix.WRITEIN_CODE
+        weights = np.empty(len(ballot_matrix), dtype=object)
+        weights[:] = self.get_field('weight')
 
-        self._modified_cvrs.update({rule_set_name: cvr})
+        # weight of ballots ranking each candidate
+        ranked = np.full(n_candidates, decimal.Decimal('0'), dtype=object)
+        # weight of ballots ranking both, the row candidate before the column candidate
+        ranked_before = np.full((n_candidates, n_candidates), decimal.Decimal('0'), dtype=object)
+
+        for first_rank in range(ballot_matrix.n_ranks):
+            first_idx = candidate_idx[:, first_rank]
+            first_valid = first_idx >= 0
+            np.add.at(ranked, first_idx[first_valid], weights[first_valid])
+
+            for later_rank in range(first_rank + 1, ballot_matrix.n_ranks):
+                later_idx = candidate_idx[:, later_rank]
+                valid = first_valid & (later_idx >= 0)
+                np.add.at(ranked_before, (first_idx[valid], later_idx[valid]), weights[valid])
+
+        # row over column: ranked row, minus ballots that also ranked column earlier
+        preferred = ranked[:, np.newaxis] - ranked_before.T
+        ranked_either = ranked[:, np.newaxis] + ranked[np.newaxis, :] - ranked_before - ranked_before.T
+        np.fill_diagonal(preferred, decimal.Decimal('0'))
+        np.fill_diagonal(ranked_either, ranked)
+
+        self._pairwise_matrices.update({
+            rule_set_name: (pd.DataFrame(preferred, index=candidates, columns=candidates),
+                            pd.DataFrame(ranked_either, index=candidates, columns=candidates))
+        })
 
     def _make_candidate_set(self, rule_set_name: str) -> None:
 
         if rule_set_name not in self._rule_sets:
             raise RuntimeError(f'rule set {rule_set_name} has not yet been added using add_rule_set().')
 
-        cvr = self._parsed_cvr
-
         # unpack rules
         rule_set = self._rule_sets[rule_set_name]
         combine_writeins = rule_set['combine_writein_marks']
         exclude_writeins = rule_set['exclude_writein_marks']
 
-        candidate_ballot_marks = BallotMarks(set.union(*[b.unique_candidates for b in cvr['ballot_marks']]))
+        candidate_ballot_marks = BallotMarks(self._parsed_cvr['ballot_matrix'].unique_candidates())
         candidate_ballot_marks.apply_rules(combine_writein_marks=combine_writeins, exclude_writein_marks=exclude_writeins)
 
         self._candidate_sets.update({rule_set_name: candidate_ballot_marks})
@@ -264,18 +301,67 @@ class CastVoteRecord(CastVoteRecord_stats, CastVoteRecord_tables):
 
         # if making a new rule set using the same name, delete old one
         if set_name in self._rule_sets and set_dict != self._rule_sets[set_name]:
-            del self._modified_cvrs[set_name]
-            del self._candidate_sets[set_name]
+            self._modified_cvrs.pop(set_name, None)
+            self._modified_matrices.pop(set_name, None)
+            self._pairwise_matrices.pop(set_name, None)
+            self._candidate_sets.pop(set_name, None)
 
         self._rule_sets.update({set_name: set_dict})
 
+        # stats may depend on any rule set
+        self._stats_cache.clear()
+
+    def get_id_info(self) -> Dict[str, str]:
+        """
+        Return the contest id columns included in stats(), without building the stats tables.
+        """
+        return {col: self._id_df.at[0, col] for col in self._id_df.columns}
+
+    def get_rank_limit(self) -> int:
+        return self.get_ballot_matrix().n_ranks
+
+    def get_ballot_matrix(self, rule_set_name: Optional[str] = None) -> BallotMatrix:
+
+        if rule_set_name is None:
+            rule_set_name = self._default_rule_set_name
+
+        if rule_set_name not in self._modified_matrices:
+            self._make_modified_cvr(rule_set_name)
+
+        return self._modified_matrices[rule_set_name]
+
+    def get_pairwise_matrix(self, rule_set_name: Optional[str] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """
+        Return two candidate x candidate tables of weighted ballot counts, computed once per rule set.
+        The first counts ballots ranking the row candidate over the column candidate (including ballots that
+        only rank the row candidate). The second counts ballots ranking the row or the column candidate.
+        """
+        if rule_set_name is None:
+            rule_set_name = self._default_rule_set_name
+
+        if rule_set_name not in self._pairwise_matrices:
+            self._make_pairwise_matrix(rule_set_name)
+
+        return self._pairwise_matrices[rule_set_name]
+
+    def get_field(self, field_name: str) -> List:
+        """
+        Return a single parsed cvr column (weight or metadata such as precinct) without building ballot objects.
+        """
+        return self._parsed_cvr[field_name]
+
+    def get_field_names(self) -> List[str]:
+        return [k for k in self._parsed_cvr if k != 'ballot_matrix']
+
     def get_cvr_dict(self, rule_set_name: Optional[str] = None) -> Dict[str, List]:
 
         if rule_set_name is None:
             rule_set_name = self._default_rule_set_name
 
         if rule_set_name not in self._modified_cvrs:
-            self._make_modified_cvr(rule_set_name)
+            cvr = {k: v for k, v in self._parsed_cvr.items() if k != 'ballot_matrix'}
+            cvr['ballot_marks'] = self.get_ballot_matrix(rule_set_name).to_ballot_marks()
+            self._modified_cvrs.update({rule_set_name: cvr})
 
         return self._modified_cvrs[rule_set_name]
 
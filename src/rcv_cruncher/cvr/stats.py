@@ -1,12 +1,19 @@
 
-import collections
-import weightedstats
+from typing import (Dict, List, Optional, Tuple)
 
+import numpy as np
 import pandas as pd
 
 import rcv_cruncher.util as util
 
 from rcv_cruncher.marks import BallotMarks
+from rcv_cruncher.matrix import BallotMatrix
+
+# factorize argument giving missing values a code of their own, pandas 1.5 replaced na_sentinel=None with it
+if tuple(int(part) for part in pd.__version__.split('.')[:2]) >= (1, 5):
+    _FACTORIZE_KEEP_NA = {'use_na_sentinel': False}
+else:
+    _FACTORIZE_KEEP_NA = {'na_sentinel': None}
 
 
 class CastVoteRecord_stats:
@@ -16,6 +23,19 @@ class CastVoteRecord_stats:
               add_split_stats: bool = False,
               add_id_info: bool = True) -> pd.DataFrame:
 
+        # stats are memoized per argument combination, callers get a copy they are free to modify
+        cache_key = ('cvr', keep_decimal_type, add_split_stats, add_id_info)
+        if cache_key not in self._stats_cache:
+            self._stats_cache[cache_key] = self._make_cvr_stats(keep_decimal_type=keep_decimal_type,
+                                                                add_split_stats=add_split_stats,
+                                                                add_id_info=add_id_info)
+        return self._stats_cache[cache_key].copy()
+
+    def _make_cvr_stats(self,
+                        keep_decimal_type: bool = False,
+                        add_split_stats: bool = False,
+                        add_id_info: bool = True) -> pd.DataFrame:
+
         cvr_stats = self._summary_cvr_stat_table.copy()
 
         if add_id_info:
@@ -24,9 +44,6 @@ class CastVoteRecord_stats:
 
         if add_split_stats:
 
-            self._make_split_filter_dict()
-            self._compute_summary_cvr_split_stat_table()
-
             if self._summary_cvr_split_stat_table is not None:
 
                 cvr_split_stats = self._summary_cvr_split_stat_table.copy()
@@ -44,88 +61,89 @@ class CastVoteRecord_stats:
 
         return cvr_stats
 
-    def _compute_cvr_stat_table(self) -> None:
+    @property
+    def _cvr_stat_table(self) -> pd.DataFrame:
+        if 'cvr' not in self._stat_tables:
+            self._stat_tables['cvr'] = self._compute_cvr_stat_table()
+        return self._stat_tables['cvr']
+
+    @property
+    def _summary_cvr_stat_table(self) -> pd.DataFrame:
+        if 'summary_cvr' not in self._stat_tables:
+            self._stat_tables['summary_cvr'] = self._compute_summary_cvr_stat_table()
+        return self._stat_tables['summary_cvr']
 
-        cvr = self.get_cvr_dict()
+    def _compute_cvr_stat_table(self) -> pd.DataFrame:
+
+        # all columns are computed from the integer rank matrix of the parsed cvr, one array operation per column
+        ballot_matrix = self.get_ballot_matrix()
+        ranks = ballot_matrix.ranks
         candidates = self.get_candidates()
 
+        valid = ranks != BallotMatrix.PAD_CODE
+        skipped = ranks == BallotMatrix.SKIPPED_CODE
+        overvote = ranks == BallotMatrix.OVERVOTE_CODE
+        candidate = ranks >= BallotMatrix.WRITEIN_CODE
+        # later marks for a candidate already marked on the ballot
+        duplicate = ballot_matrix.duplicate_mask()
+
         df = pd.DataFrame()
-        df['weight'] = cvr['weight']
+        df['weight'] = self.get_field('weight')
 
-        df['valid_ranks_used'] = [len(b.unique_candidates) for b in cvr['ballot_marks']]
+        df['valid_ranks_used'] = (candidate & ~duplicate).sum(axis=1)
         df['ranks_used_times_weight'] = df['valid_ranks_used'] * df['weight']
 
-        df['used_last_rank'] = [True if b.marks[-1] != BallotMarks.SKIPPED else False for b in cvr['ballot_marks']]
+        n_marks = valid.sum(axis=1)
+        last_mark = np.take_along_axis(ranks, np.maximum(n_marks - 1, 0)[:, np.newaxis], axis=1)[:, 0]
+        df['used_last_rank'] = (n_marks > 0) & (last_mark != BallotMatrix.SKIPPED_CODE)
 
-        df['undervote'] = [b.unique_marks == {BallotMarks.SKIPPED} for b in cvr['ballot_marks']]
+        df['undervote'] = (skipped | ~valid).all(axis=1) & skipped.any(axis=1)
         df['ranked_single'] = df['valid_ranks_used'] == 1
         df['ranked_multiple'] = df['valid_ranks_used'] > 1
         df['ranked_3_or_more'] = df['valid_ranks_used'] > 2
 
-        ballot_marks_no_skipped = [BallotMarks.remove_mark(b, [BallotMarks.SKIPPED]) for b in cvr['ballot_marks']]
-        first_round = [b.marks[0] if b.marks else 'NA' for b in ballot_marks_no_skipped]
-        df['first_round'] = pd.Series(first_round, dtype='category')
+        # first mark that is not a skipped rank, 'NA' if there is none
+        marked = valid & ~skipped
+        first_mark = np.where(marked.any(axis=1), ranks[np.arange(len(ranks)), marked.argmax(axis=1)],
+                              BallotMatrix.PAD_CODE)
+        df['first_round'] = pd.Series(ballot_matrix.mark_array(pad_mark='NA')[first_mark], dtype='category')
 
         df['first_round_overvote'] = df['first_round'].eq(BallotMarks.OVERVOTE)
 
-        df['contains_overvote'] = [BallotMarks.OVERVOTE in b.unique_marks for b in cvr['ballot_marks']]
+        df['contains_overvote'] = overvote.any(axis=1)
 
         # contains_skipped
-        # {SKIPVOTE} & {x} - {y}
-        # this checks that x == SKIPVOTE and that y then != SKIPVOTE
-        # (the y check is important to know whether or not the ballot contains marks
+        # a skipped rank directly followed by a mark that is not a skipped rank
+        # (the check on the following mark is important to know whether or not the ballot contains marks
         # following the skipped rank)
-        df['contains_skip'] = [any({BallotMarks.SKIPPED} & {x} - {y} for x, y in zip(b.marks, b.marks[1:]))
-                               for b in cvr['ballot_marks']]
+        df['contains_skip'] = (skipped[:, :-1] & valid[:, 1:] & ~skipped[:, 1:]).any(axis=1)
 
         # contains_duplicate
-        # remove overvotes and undervotes
-        dup_check = [BallotMarks.remove_mark(b, [BallotMarks.SKIPPED, BallotMarks.OVERVOTE]) for b in cvr['ballot_marks']]
-        # count all ranks for candidates
-        counters = [collections.Counter(b.marks) for b in dup_check]
-        # check if any candidates were ranked more than once
-        df['contains_duplicate'] = [max(counter.values()) > 1 if counter else False for counter in counters]
+        # any candidate ranked more than once, overvotes and skipped ranks aside
+        df['contains_duplicate'] = duplicate.any(axis=1)
 
         irregular_condtions = ['contains_overvote', 'contains_skip', 'contains_duplicate']
         df['irregular'] = df[irregular_condtions].any(axis='columns')
 
-        # fully_ranked no overvotes
+        # fully_ranked: ballots that rank every candidate (not counting writeins) or that did not,
+        # but have no skipped ranks or duplicates (nor overvotes, when excluding overvotes)
         candidates_combined_writeins = BallotMarks.combine_writein_marks(candidates)
         candidates_excluded_writeins = BallotMarks.remove_mark(candidates_combined_writeins, [BallotMarks.WRITEIN])
-        candidate_set = candidates_excluded_writeins.unique_candidates
-
-        ballot_marks_cleaned = [BallotMarks.remove_mark(b, [BallotMarks.OVERVOTE, BallotMarks.SKIPPED])
-                                for b in cvr['ballot_marks']]
-        ballot_marks_cleaned = [BallotMarks.remove_duplicate_candidate_marks(b) for b in ballot_marks_cleaned]
+        candidate_codes = [ballot_matrix.encode(mark) for mark in candidates_excluded_writeins.unique_candidates]
 
-        fully_ranked = [(set(b.marks) & candidate_set) == candidate_set or
-                        # voters ranked every possible candidate
-                        len(a.marks) == len(b.marks)
-                        # or did not, had no skipped ranks, overvotes, or duplicates
-                        for a, b in zip(cvr['ballot_marks'], ballot_marks_cleaned)]
-        df['fully_ranked_excl_overvotes'] = fully_ranked
+        in_candidate_set = np.zeros(len(ballot_matrix.codes) + 1, dtype=bool)
+        in_candidate_set[np.array(candidate_codes, dtype=np.int64) + 1] = True
+        ranked_candidate_set = (in_candidate_set[ranks.astype(np.int64) + 1] & ~duplicate).sum(axis=1)
+        ranked_all_candidates = ranked_candidate_set == len(candidate_codes)
 
-        # fully_ranked with overvotes
-        candidates_combined_writeins = BallotMarks.combine_writein_marks(candidates)
-        candidates_excluded_writeins = BallotMarks.remove_mark(candidates_combined_writeins, [BallotMarks.WRITEIN])
-        candidate_set = candidates_excluded_writeins.unique_candidates
+        no_skips_or_duplicates = ~(skipped | duplicate).any(axis=1)
+        df['fully_ranked_excl_overvotes'] = ranked_all_candidates | (no_skips_or_duplicates & ~df['contains_overvote'])
+        df['fully_ranked_incl_overvotes'] = ranked_all_candidates | no_skips_or_duplicates
 
-        ballot_marks_cleaned = [BallotMarks.remove_mark(b, [BallotMarks.SKIPPED])
-                                for b in cvr['ballot_marks']]
-        ballot_marks_cleaned = [BallotMarks.remove_duplicate_candidate_marks(b) for b in ballot_marks_cleaned]
+        return df
 
-        fully_ranked = [(set(b.marks) & candidate_set) == candidate_set or
-                        # voters ranked every possible candidate
-                        len(a.marks) == len(b.marks)
-                        # or did not, had no skipped ranks, overvotes, or duplicates
-                        for a, b in zip(cvr['ballot_marks'], ballot_marks_cleaned)]
-        df['fully_ranked_incl_overvotes'] = fully_ranked
+    def _compute_summary_cvr_stat_table(self) -> pd.DataFrame:
 
-        self._cvr_stat_table = df
-
-    def _compute_summary_cvr_stat_table(self) -> None:
-
-        cvr = self.get_cvr_dict()
         candidates = self.get_candidates()
 
         s = pd.Series(dtype=object)
@@ -133,7 +151,7 @@ class CastVoteRecord_stats:
         candidates_no_writeins = BallotMarks.remove_mark(BallotMarks.combine_writein_marks(candidates), [BallotMarks.WRITEIN])
         s['n_candidates'] = len(candidates_no_writeins.marks)
 
-        s['rank_limit'] = len(cvr['ballot_marks'][0].marks)
+        s['rank_limit'] = self.get_ballot_matrix().n_ranks
         s['restrictive_rank_limit'] = True if s['rank_limit'] < (s['n_candidates'] - 1) else False
 
         # first_round_overvote
@@ -187,92 +205,108 @@ class CastVoteRecord_stats:
         # Median number of validly used rankings across all non-undervote ballots. (weighted)
         # s['median_rankings_used'] = self._cvr_stat_table.loc[~self._cvr_stat_table['undervote'], 'ranks_used_times_weight'].median()
 
-        ranks_used = self._cvr_stat_table.loc[~self._cvr_stat_table['undervote'], 'valid_ranks_used'].tolist()
-        weights = self._cvr_stat_table.loc[~self._cvr_stat_table['undervote'], 'weight'].tolist()
-        weights_float = [float(i) for i in weights]
-        s['median_rankings_used'] = weightedstats.weighted_median(ranks_used, weights=weights_float)
+        ranks_used = self._cvr_stat_table.loc[~self._cvr_stat_table['undervote'], 'valid_ranks_used']
+        weights = self._cvr_stat_table.loc[~self._cvr_stat_table['undervote'], 'weight']
+        s['median_rankings_used'] = util.weighted_median(ranks_used.to_numpy(), weights.to_numpy())
 
-        self._summary_cvr_stat_table = s.to_frame().transpose()
+        return s.to_frame().transpose()
 
-    def _make_split_filter_dict(self) -> None:
+    def _split_groups(self) -> Dict[str, Tuple[np.ndarray, List]]:
+        """
+        Group code of each ballot for every split field found in the cvr (matched without case),
+        along with the field values the codes index, in sorted order.
+        """
+        split_groups = {}
 
         if self.split_fields:
 
-            cvr = self.get_cvr_dict()
-            cvr_fields = list(cvr.keys())
+            cvr_fields = self.get_field_names()
             field_name_lower_dict = {k.lower(): k for k in cvr_fields}
 
             for field in self.split_fields:
                 if field.lower() in field_name_lower_dict:
                     cvr_field_name = field_name_lower_dict[field.lower()]
-                    cvr_field = cvr[cvr_field_name]
-                    field_filter_dict = {unique_val: [unique_val == i for i in cvr_field] for unique_val in set(cvr_field)}
-                    self._split_filter_dict.update({cvr_field_name: field_filter_dict})
+                    cvr_field = pd.Series(self.get_field(cvr_field_name), dtype=object)
+                    group_codes, unique_vals = pd.factorize(cvr_field, sort=True, **_FACTORIZE_KEEP_NA)
+                    split_groups[cvr_field_name] = (group_codes, unique_vals.tolist())
+
+        return split_groups
+
+    def _split_id_df(self, field: str, unique_vals: List) -> pd.DataFrame:
+        field_clean = self._clean_string(field)
+        return pd.DataFrame({
+            'split_field': [field] * len(unique_vals),
+            'split_value': pd.Series(unique_vals, dtype=object).infer_objects(),
+            'split_id': [field_clean + "-" + self._clean_string(unique_val) for unique_val in unique_vals]
+            })
 
     def _clean_string(self, x: str) -> str:
         return str(x).replace(":", "_").replace("/", "_").replace("\\", "_").replace(" ", "_").replace("-", "_")
 
-    def _compute_cvr_split_stats(self, split_filter) -> pd.DataFrame:
-
-        filtered_stat_table = self._cvr_stat_table.loc[split_filter, :]
-
-        first_round_overvote = filtered_stat_table.loc[filtered_stat_table['first_round_overvote'], 'weight'].sum()
-        ranked_single = filtered_stat_table.loc[filtered_stat_table['ranked_single'], 'weight'].sum()
-        ranked_multiple = filtered_stat_table.loc[filtered_stat_table['ranked_multiple'], 'weight'].sum()
-        ranked_3_or_more = filtered_stat_table.loc[filtered_stat_table['ranked_3_or_more'], 'weight'].sum()
-        total_fully_ranked = filtered_stat_table.loc[filtered_stat_table['fully_ranked_excl_overvotes'], 'weight'].sum()
-        includes_duplicate_ranking = filtered_stat_table.loc[filtered_stat_table['contains_duplicate'], 'weight'].sum()
-        includes_skipped_ranking = filtered_stat_table.loc[filtered_stat_table['contains_skip'], 'weight'].sum()
-        total_irregular = filtered_stat_table.loc[filtered_stat_table['irregular'], 'weight'].sum()
-        total_ballots = filtered_stat_table['weight'].sum()
-        includes_overvote_ranking = filtered_stat_table.loc[filtered_stat_table['contains_overvote'], 'weight'].sum()
-        total_undervote = filtered_stat_table.loc[filtered_stat_table['undervote'], 'weight'].sum()
-
-        weighted_sum = filtered_stat_table.loc[~filtered_stat_table['undervote'], 'ranks_used_times_weight'].sum()
-        mean_rankings_used = weighted_sum / filtered_stat_table.loc[~filtered_stat_table['undervote'], 'weight'].sum()
-
-        ranks_used = filtered_stat_table.loc[~filtered_stat_table['undervote'], 'valid_ranks_used'].tolist()
-        weights = filtered_stat_table.loc[~filtered_stat_table['undervote'], 'weight'].tolist()
-        weights_float = [float(i) for i in weights]
-        median_rankings_used = weightedstats.weighted_median(ranks_used, weights=weights_float)
-
-        filtered_summary_stat_table = pd.DataFrame({
-            'split_first_round_overvote': [first_round_overvote],
-            'split_ranked_single': [ranked_single],
-            'split_ranked_multiple': [ranked_multiple],
-            'split_ranked_3_or_more': [ranked_3_or_more],
-            'split_mean_rankings_used': [mean_rankings_used],
-            'split_median_rankings_used': [median_rankings_used],
-            'split_total_fully_ranked': [total_fully_ranked],
-            'split_includes_duplicate_ranking': [includes_duplicate_ranking],
-            'split_includes_skipped_ranking': [includes_skipped_ranking],
-            'split_total_irregular': [total_irregular],
-            'split_total_ballots': [total_ballots],
-            'split_includes_overvote_ranking': [includes_overvote_ranking],
-            'split_total_undervote': [total_undervote]
-            })
-        return filtered_summary_stat_table
-
-    def _compute_summary_cvr_split_stat_table(self) -> None:
-
-        if not self._split_filter_dict:
-            return
+    @property
+    def _summary_cvr_split_stat_table(self) -> Optional[pd.DataFrame]:
+        if 'summary_cvr_split' not in self._stat_tables:
+            self._stat_tables['summary_cvr_split'] = self._compute_summary_cvr_split_stat_table()
+        return self._stat_tables['summary_cvr_split']
+
+    def _compute_cvr_split_stats(self, group_codes: np.ndarray, n_groups: int) -> pd.DataFrame:
+
+        stat_table = self._cvr_stat_table
+        weight = stat_table['weight'].to_numpy()
+
+        def weight_sums(mask=None):
+            if mask is None:
+                return util.group_sums(group_codes, weight, n_groups)
+            mask = mask.to_numpy()
+            return util.group_sums(group_codes[mask], weight[mask], n_groups)
+
+        split_stats = {
+            'split_first_round_overvote': weight_sums(stat_table['first_round_overvote']),
+            'split_ranked_single': weight_sums(stat_table['ranked_single']),
+            'split_ranked_multiple': weight_sums(stat_table['ranked_multiple']),
+            'split_ranked_3_or_more': weight_sums(stat_table['ranked_3_or_more'])
+        }
+
+        # mean and median rankings used across the non-undervote ballots of each group,
+        # the medians from one sort of those ballots by group
+        not_undervote = (~stat_table['undervote']).to_numpy()
+        voted_codes = group_codes[not_undervote]
+        voted_weight = weight[not_undervote]
+        voted_ranks_used = stat_table['valid_ranks_used'].to_numpy()[not_undervote]
+
+        ranks_used_sums = util.group_sums(voted_codes, stat_table['ranks_used_times_weight'].to_numpy()[not_undervote], n_groups)
+        voted_weight_sums = util.group_sums(voted_codes, voted_weight, n_groups)
+        split_stats['split_mean_rankings_used'] = [ranks_used_sum / weight_sum if weight_sum else None
+                                                   for ranks_used_sum, weight_sum in zip(ranks_used_sums, voted_weight_sums)]
+
+        order = np.argsort(voted_codes, kind='stable')
+        group_bounds = np.searchsorted(voted_codes[order], np.arange(n_groups + 1))
+        split_stats['split_median_rankings_used'] = [
+            util.weighted_median(voted_ranks_used[order[start:end]], voted_weight[order[start:end]])
+            for start, end in zip(group_bounds[:-1], group_bounds[1:])
+        ]
+
+        split_stats.update({
+            'split_total_fully_ranked': weight_sums(stat_table['fully_ranked_excl_overvotes']),
+            'split_includes_duplicate_ranking': weight_sums(stat_table['contains_duplicate']),
+            'split_includes_skipped_ranking': weight_sums(stat_table['contains_skip']),
+            'split_total_irregular': weight_sums(stat_table['irregular']),
+            'split_total_ballots': weight_sums(),
+            'split_includes_overvote_ranking': weight_sums(stat_table['contains_overvote']),
+            'split_total_undervote': weight_sums(stat_table['undervote'])
+        })
+
+        return pd.DataFrame({stat: pd.Series(values, dtype=object) for stat, values in split_stats.items()}).infer_objects()
+
+    def _compute_summary_cvr_split_stat_table(self) -> Optional[pd.DataFrame]:
+
+        split_groups = self._split_groups()
+        if not split_groups:
+            return None
 
         split_df_list = []
+        for field, (group_codes, unique_vals) in split_groups.items():
+            split_stat_df = self._compute_cvr_split_stats(group_codes, len(unique_vals))
+            split_df_list.append(pd.concat([self._split_id_df(field, unique_vals), split_stat_df], axis='columns'))
 
-        for field in self._split_filter_dict:
-            field_clean = self._clean_string(field)
-
-            for unique_val in self._split_filter_dict[field]:
-                val_clean = self._clean_string(unique_val)
-                split_id = field_clean + "-" + val_clean
-
-                split_id_df = pd.DataFrame({
-                    'split_field': [field],
-                    'split_value': [unique_val],
-                    'split_id': [split_id]
-                    })
-                split_stat_df = self._compute_cvr_split_stats(self._split_filter_dict[field][unique_val])
-                split_df_list.append(pd.concat([split_id_df, split_stat_df], axis='columns'))
-
-        self._summary_cvr_split_stat_table = pd.concat(split_df_list, axis=0, sort=False)
+        return pd.concat(split_df_list, axis=0, ignore_index=True, sort=False)
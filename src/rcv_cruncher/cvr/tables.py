@@ -1,9 +1,11 @@
 
+import numpy as np
 import pandas as pd
 
 import rcv_cruncher.util as util
 
 from rcv_cruncher.marks import BallotMarks
+from rcv_cruncher.matrix import BallotMatrix
 
 
 class CastVoteRecord_tables:
@@ -22,68 +24,54 @@ class CastVoteRecord_tables:
 
     def _rank_header_cvr(self) -> pd.DataFrame:
 
-        ballot_dict = {k: v for k, v in self.get_cvr_dict().items()}
-        bs = [b.marks for b in ballot_dict['ballot_marks']]
-        weight = ballot_dict['weight']
-        del ballot_dict['ballot_marks']
-        del ballot_dict['weight']
-
-        # how many ranks?
-        num_ranks = max(len(i) for i in bs)
-
-        # shift over all ranks
-        # bs = [[m for m in b if m != BallotMarks.SKIPPED] for b in bs]
-
-        # make sure all ballots are lists of equal length, adding trailing 'skipped' if necessary
-        bs = [b + ([BallotMarks.SKIPPED] * (num_ranks - len(b))) for b in bs]
+        ballot_matrix = self.get_ballot_matrix()
+        weight = self.get_field('weight')
 
         # assemble output_table, start with extras
-        output_df = pd.DataFrame.from_dict(ballot_dict)
+        output_df = pd.DataFrame.from_dict({k: self.get_field(k) for k in self.get_field_names() if k != 'weight'})
 
         # are weights all one, then dont add to output
         if not all([i == 1 for i in weight]):
             output_df['weight'] = [float(w) for w in weight]
 
-        # add in rank columns
-        for i in range(1, num_ranks + 1):
-            output_df['rank' + str(i)] = [b[i-1] for b in bs]
-
-        # add in rank columns
-        # for i in range(1, num_ranks + 1):
-        #    output_df[str(i)] = [''.join(b[i-1].split(' ')) for b in bs]
-        #    output_df[str(i)] = output_df[str(i)].replace(to_replace=BallotMarks.SKIPPED, value='')
+        # add in rank columns, padding any shortened ballots with trailing 'skipped'
+        ranks = ballot_matrix.ranks
+        mark_array = ballot_matrix.mark_array(pad_mark=BallotMarks.SKIPPED)
+        for i in range(1, ballot_matrix.n_ranks + 1):
+            output_df['rank' + str(i)] = mark_array[ranks[:, i-1]]
 
         return output_df
 
     def _candidate_header_cvr(self) -> pd.DataFrame:
 
         # get ballots and candidates
-        ballot_dl = {k: v for k, v in self.get_cvr_dict().items()}
+        ballot_matrix = self.get_ballot_matrix()
         candidates = self.get_candidates().unique_candidates.copy()
         candidates.update({BallotMarks.OVERVOTE})
 
+        ballot_dl = {k: self.get_field(k) for k in self.get_field_names()}
+
         # remove weights if all equal to 1
         if set(ballot_dl['weight']) == {1}:
             del ballot_dl['weight']
 
         # add rank limit
-        ballot_dl['rank_limit'] = [len(ballot_dl['ballot_marks'][0].marks)] * len(ballot_dl['ballot_marks'])
-
-        # convert dict of list to list of dicts
-        ballot_ld = util.DL2LD(ballot_dl)
+        ballot_dl['rank_limit'] = [ballot_matrix.n_ranks] * ballot_matrix.n_ballots
 
         # add candidate index information
-        for b in ballot_ld:
-            b.update({f"candidate_{cand}": None for cand in candidates})
-            for rank_idx, cand in enumerate(b['ballot_marks'].marks, start=1):
-                if cand != BallotMarks.SKIPPED:
-                    if not b[f"candidate_{cand}"]:
-                        b[f"candidate_{cand}"] = str(rank_idx)
-                    else:
-                        b[f"candidate_{cand}"] += f',{rank_idx}'
-            del b['ballot_marks']
-
-        df = pd.DataFrame(ballot_ld)
+        ranks = ballot_matrix.ranks
+        for cand in candidates:
+            cand_col = np.full(ballot_matrix.n_ballots, None, dtype=object)
+            if cand in ballot_matrix.code_lookup:
+                cand_ranks = ranks == ballot_matrix.encode(cand)
+                for rank_idx in range(ballot_matrix.n_ranks):
+                    first_mark = cand_ranks[:, rank_idx] & np.equal(cand_col, None)
+                    later_mark = cand_ranks[:, rank_idx] & ~first_mark
+                    cand_col[first_mark] = str(rank_idx + 1)
+                    cand_col[later_mark] = cand_col[later_mark] + f',{rank_idx + 1}'
+            ballot_dl[f"candidate_{cand}"] = cand_col
+
+        df = pd.DataFrame(ballot_dl)
         return df.reindex(sorted(df.columns), axis=1)
 
     def rank_usage_table(self):
@@ -98,27 +86,22 @@ class CastVoteRecord_tables:
         candidate_set = sorted(candidate_set.unique_candidates)
 
         # get ballots
-        ballot_set = [{'ballot_marks': bm, 'weight': weight}
-                      for bm, weight in zip(self.get_cvr_dict()['ballot_marks'], self.get_cvr_dict()['weight'])]
+        weights = np.array(self.get_field('weight'), dtype=object)
         # remove skipped ranks
-        ballot_set = [{'ballot_marks': BallotMarks.remove_mark(b['ballot_marks'], [BallotMarks.SKIPPED]),
-                       'weight': b['weight']}
-                      for b in ballot_set]
+        ballot_matrix = BallotMatrix.remove_codes(self.get_ballot_matrix(), [BallotMatrix.SKIPPED_CODE])
         # remove empty ballots and those that start with overvote
-        ballot_set = [b for b in ballot_set
-                      if len(b['ballot_marks'].marks) >= 1 and b['ballot_marks'].marks[0] != BallotMarks.OVERVOTE]
+        first_ranks = ballot_matrix.ranks[:, 0] if ballot_matrix.n_ranks else np.full(len(weights), BallotMatrix.PAD_CODE)
+        keep = (first_ranks != BallotMatrix.PAD_CODE) & (first_ranks != BallotMatrix.OVERVOTE_CODE)
         # combine writeins
-        ballot_set = [{'ballot_marks': BallotMarks.combine_writein_marks(b['ballot_marks']),
-                       'weight': b['weight']}
-                      for b in ballot_set]
+        ballot_matrix = BallotMatrix.combine_writein_codes(ballot_matrix)
         # remove other overvotes
-        ballot_set = [{'ballot_marks': BallotMarks.remove_mark(b['ballot_marks'], [BallotMarks.OVERVOTE]),
-                       'weight': b['weight']}
-                      for b in ballot_set]
+        ballot_matrix = BallotMatrix.remove_codes(ballot_matrix, [BallotMatrix.OVERVOTE_CODE])
         # remove duplicate rankings
-        ballot_set = [{'ballot_marks': BallotMarks.remove_duplicate_candidate_marks(b['ballot_marks']),
-                       'weight': b['weight']}
-                      for b in ballot_set]
+        ballot_matrix = BallotMatrix.remove_duplicate_candidate_codes(ballot_matrix)
+
+        weights = weights[keep]
+        ranks_used = ballot_matrix.lengths()[keep].astype(object)
+        first_choices = ballot_matrix.ranks[keep, 0] if ballot_matrix.n_ranks else np.array([], dtype=int)
 
         all_ballots_label = "Any candidate"
         n_ballots_label = "Number of Ballots (excluding undervotes and ballots with first round overvote)"
@@ -130,8 +113,8 @@ class CastVoteRecord_tables:
         df = pd.DataFrame(index=rows, columns=cols)
         df.index.name = "Ballots with first choice:"
 
-        ballot_total = sum(b['weight'] for b in ballot_set)
-        mean_rankings = sum(len(b['ballot_marks'].marks) * b['weight'] for b in ballot_set) / ballot_total
+        ballot_total = weights.sum()
+        mean_rankings = (ranks_used * weights).sum() / ballot_total
         # median_rankings = statistics.median(len(b) for b in ballot_set)
 
         df.loc[all_ballots_label, n_ballots_label] = ballot_total
@@ -139,16 +122,13 @@ class CastVoteRecord_tables:
         # df.loc[all_ballots_label, median_label] = median_rankings
 
         # group ballots by first choice
-        first_choices = {cand: [] for cand in candidate_set}
-        for b in ballot_set:
-            first_choices[b['ballot_marks'].marks[0]].append(b)
-
         for cand in candidate_set:
-            first_choice_ballot_total = sum(b['weight'] for b in first_choices[cand])
+            first_choice_mask = first_choices == ballot_matrix.encode(cand)
+            first_choice_ballot_total = weights[first_choice_mask].sum()
             df.loc[cand, n_ballots_label] = first_choice_ballot_total
-            if first_choices[cand]:
-                df.loc[cand, mean_label] = sum(len(b['ballot_marks'].marks) * b['weight']
-                                               for b in first_choices[cand]) / first_choice_ballot_total
+            if first_choice_mask.any():
+                df.loc[cand, mean_label] = (ranks_used[first_choice_mask] *
+                                            weights[first_choice_mask]).sum() / first_choice_ballot_total
                 # df.loc[cand, median_label] = statistics.median(len(b) for b in first_choices[cand])
             else:
                 df.loc[cand, mean_label] = 0
@@ -164,12 +144,13 @@ class CastVoteRecord_tables:
         # candidate_set = BallotMarks.remove_mark(candidate_set, [BallotMarks.WRITEIN])
         candidate_set = sorted(candidate_set.unique_candidates)
 
-        ballot_dict = self.get_cvr_dict()
-        ballot_weights = ballot_dict['weight']
-        ballot_ranks = [BallotMarks.remove_mark(b, [BallotMarks.SKIPPED]) for b in ballot_dict['ballot_marks']]
-        ballot_ranks = [BallotMarks.combine_writein_marks(b) for b in ballot_ranks]
-        ballot_set = [{'ballot_marks': ranks.marks, 'weight': weight}
-                      for ranks, weight in zip(ballot_ranks, ballot_weights)]
+        ballot_weights = np.array(self.get_field('weight'), dtype=object)
+        ballot_matrix = BallotMatrix.remove_codes(self.get_ballot_matrix(), [BallotMatrix.SKIPPED_CODE])
+        ballot_matrix = BallotMatrix.combine_writein_codes(ballot_matrix)
+
+        ranks = ballot_matrix.ranks
+        first_ranks = ranks[:, 0] if ballot_matrix.n_ranks else np.full(len(ballot_weights), BallotMatrix.PAD_CODE)
+        top_three = ranks[:, :3]
 
         index_label = "Ballots with first choice:"
         n_ballots_label = "Number of Ballots"
@@ -183,24 +164,20 @@ class CastVoteRecord_tables:
         percent_df = pd.DataFrame(index=rows, columns=cols)
         percent_df.index.name = index_label
 
-        # group ballots by first choice
-        first_choices = {cand: [] for cand in candidate_set}
-        for b in ballot_set:
-            if len(b['ballot_marks']) >= 1 and b['ballot_marks'][0] != BallotMarks.OVERVOTE:
-                first_choices[b['ballot_marks'][0]].append(b)
-
         for cand in candidate_set:
 
-            n_first_choice = sum(b['weight'] for b in first_choices[cand])
+            # group ballots by first choice
+            first_choice_mask = first_ranks == ballot_matrix.encode(cand)
+
+            n_first_choice = ballot_weights[first_choice_mask].sum()
             count_df.loc[cand, n_ballots_label] = n_first_choice
             percent_df.loc[cand, n_ballots_label] = n_first_choice
 
             for opponent in candidate_set:
 
                 if n_first_choice:
-                    crossover_ballots = [True if opponent in b['ballot_marks'][0:min(3, len(b['ballot_marks']))] else False
-                                         for b in first_choices[cand]]
-                    crossover_val = sum(b['weight'] for b, flag in zip(first_choices[cand], crossover_ballots) if flag)
+                    crossover_ballots = (top_three[first_choice_mask] == ballot_matrix.encode(opponent)).any(axis=1)
+                    crossover_val = ballot_weights[first_choice_mask][crossover_ballots].sum()
                     count_df.loc[cand, colname_dict[opponent]] = crossover_val
                     percent_df.loc[cand, colname_dict[opponent]] = crossover_val*100/n_first_choice
                 else:
@@ -0,0 +1,494 @@
+from typing import (Dict, Iterator, List, Optional, Tuple)
+
+import abc
+import array
+import concurrent.futures
+import decimal
+import fnmatch
+import io
+import json
+import pathlib
+import posixpath
+import re
+import sys
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from rcv_cruncher.marks import BallotMarks
+from rcv_cruncher.json_stream import (PrefetchReader, iter_json_array)
+
+# ballot id is the image file name, e.x. "...\Images\00001_00001_000001*.*"
+_BALLOT_ID = re.compile(r'Images\\(.*)\*\.\*')
+
+# marks a rank that already holds more than one candidate while bucketing
+_OVERVOTED = object()
+
+
+class DominionExport:
+    """
+    The files of a Dominion CVR export, read either from a directory or straight from the zip archive it was
+    delivered in, without extracting it. Inside an archive, files are found by name in whichever folder they sit.
+    """
+
+    def __init__(self, cvr_path) -> None:
+
+        self.path = pathlib.Path(cvr_path)
+        self.zip = None
+        self.members = {}
+
+        if self.path.is_file() and zipfile.is_zipfile(self.path):
+            self.zip = zipfile.ZipFile(self.path)
+            for member in self.zip.namelist():
+                if not member.endswith('/'):
+                    self.members.setdefault(posixpath.basename(member), member)
+
+    def exists(self, name: str) -> bool:
+        if self.zip:
+            return name in self.members
+        return (self.path / name).is_file()
+
+    def open(self, name: str):
+        if self.zip:
+            return io.TextIOWrapper(self.zip.open(self.members[name]), encoding='utf8')
+        return open(self.path / name, encoding='utf8')
+
+    def glob(self, pattern: str) -> List[str]:
+        if self.zip:
+            return sorted(name for name in self.members if fnmatch.fnmatch(name, pattern))
+        return sorted(fpath.name for fpath in self.path.glob(pattern))
+
+    def iter_json_array(self, name: str, key: str) -> Iterator:
+        if self.zip:
+            # decompress on a background thread while the caller decodes
+            with PrefetchReader(self.open(name)) as f:
+                yield from iter_json_array(f, key)
+        else:
+            yield from iter_json_array(self.path / name, key)
+
+    def manifest(self, name: str, optional: bool = False) -> List[Dict]:
+        """
+        Entries of a manifest file. A missing optional manifest has no entries.
+        """
+        if optional and not self.exists(name):
+            return []
+        with self.open(name) as f:
+            return json.load(f)['List']
+
+
+class CategoricalColumn:
+    """
+    Ballot column of repeated values held as integer codes into a table of the distinct values, rather than as
+    one reference per ballot.
+    """
+
+    def __init__(self) -> None:
+        self.codes = array.array('i')
+        self.categories = []
+        self._lookup = {}
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def code(self, value) -> int:
+        """
+        Code for value, added to the table if new.
+        """
+        code = self._lookup.get(value)
+        if code is None:
+            code = len(self.categories)
+            self._lookup[value] = code
+            self.categories.append(value)
+        return code
+
+    def append(self, value) -> None:
+        self.codes.append(self.code(value))
+
+    def extend(self, other: 'CategoricalColumn') -> None:
+        recode = [self.code(value) for value in other.categories]
+        self.codes.extend(recode[code] for code in other.codes)
+
+    def tolist(self) -> List:
+        categories = self.categories
+        return [categories[code] for code in self.codes]
+
+
+def _descriptions(entries: List[Dict], key: str = 'Description') -> Dict:
+    """
+    Id to (interned) description lookup for manifest entries.
+    """
+    return {entry['Id']: sys.intern(entry[key]) for entry in entries}
+
+
+def _bucket_marks(marks: List[Dict], contest: Dict, distinct_candidates: bool) -> List:
+    """
+    Ballot ranks for one contest from a single pass over its marks. Ambiguous marks are ignored. A rank with
+    no marks is skipped and a rank with more than one mark is an overvote. If distinct_candidates is set,
+    repeated marks for the same candidate at one rank count once.
+    """
+    rank_limit = contest['rank_limit']
+    candidates = contest['candidates']
+
+    ranks = [None] * rank_limit
+    for mark in marks:
+
+        if mark['IsAmbiguous']:
+            continue
+
+        rank = mark['Rank'] - 1
+        if rank < 0 or rank >= rank_limit:
+            continue
+
+        current = ranks[rank]
+        if current is None:
+            ranks[rank] = candidates[mark['CandidateId']]
+        elif current is not _OVERVOTED:
+            if not distinct_candidates or candidates[mark['CandidateId']] != current:
+                ranks[rank] = _OVERVOTED
+
+    return [BallotMarks.SKIPPED if mark is None else BallotMarks.OVERVOTE if mark is _OVERVOTED else mark
+            for mark in ranks]
+
+
+class DominionVersion(abc.ABC):
+    """
+    Version specific parts of a Dominion export: which manifests are read, where a session keeps its contests,
+    which ballot columns are produced and in what order.
+    """
+
+    # ballot columns produced, in output order. Columns other than ranks, weight and ballotID are in fields.
+    columns = ()
+
+    # per ballot columns looked up from the manifests with session_fields, once per session_key
+    fields = ()
+
+    # whether repeated marks for one candidate at the same rank count once (otherwise they are an overvote)
+    distinct_candidates = False
+
+    def export_names(self, export: DominionExport) -> List[str]:
+        return ['CvrExport.json']
+
+    @abc.abstractmethod
+    def read_manifests(self, export: DominionExport, offices: List[str]) -> Dict:
+        """
+        Lookup tables used to decode sessions. Must include 'contest', mapping ids of the requested contests
+        to a dict with 'office', 'rank_limit' and 'candidates' (candidate id to name).
+        """
+        pass
+
+    @abc.abstractmethod
+    def session_contests(self, current: Dict, contest_manifest: Dict) -> List[Tuple]:
+        """
+        (contest id, marks) for each requested contest on the current version of a session.
+        """
+        pass
+
+    @abc.abstractmethod
+    def session_key(self, session: Dict, current: Dict) -> Tuple:
+        """
+        Manifest ids that determine the values of the per ballot fields.
+        """
+        pass
+
+    @abc.abstractmethod
+    def session_fields(self, key: Tuple, tables: Dict) -> Tuple:
+        """
+        Values of the per ballot fields, in order of fields.
+        """
+        pass
+
+    def ballot_dict(self, ballots: Dict) -> Dict:
+        """
+        Output ballot columns. Session fields stay integer coded, as one pandas Categorical per field.
+        """
+        n_ballots = len(ballots['ranks'])
+        field_codes = np.frombuffer(ballots['fields'].codes, dtype=np.intc)
+        field_table = ballots['fields'].categories
+
+        ballot_dict = {}
+        for col in self.columns:
+            if col == 'weight':
+                ballot_dict[col] = [decimal.Decimal('1')] * n_ballots
+            elif col in ['ranks', 'ballotID']:
+                ballot_dict[col] = ballots[col]
+            else:
+                # recode the distinct field value tuples to the distinct values of this field, a missing value is NaN
+                field_idx = self.fields.index(col)
+                value_codes, values = pd.factorize(pd.Series([row[field_idx] for row in field_table], dtype=object))
+                ballot_dict[col] = pd.Categorical.from_codes(value_codes[field_codes], categories=values)
+        return ballot_dict
+
+
+class Dominion5_2(DominionVersion):
+
+    columns = ('ranks', 'ballotID', 'precinct', 'ballotType', 'countingGroup', 'weight')
+    fields = ('precinct', 'ballotType', 'countingGroup')
+    distinct_candidates = True
+
+    def read_manifests(self, export, offices):
+
+        # offices are matched against upper cased contest names
+        upper_offices = {office.upper(): office for office in offices}
+
+        contest_manifest = {}
+        for i in export.manifest('ContestManifest.json'):
+            if i['Description'].strip() in upper_offices:
+                contest_manifest[i['Id']] = {'office': upper_offices[i['Description'].strip()],
+                                             'rank_limit': i['NumOfRanks'] or 1,
+                                             'candidates': {}}
+
+        for i in export.manifest('CandidateManifest.json'):
+            if i['ContestId'] in contest_manifest:
+                candidate = BallotMarks.WRITEIN if i['Description'] == 'Write-in' else sys.intern(i['Description'])
+                contest_manifest[i['ContestId']]['candidates'][i['Id']] = candidate
+
+        return {
+            'contest': contest_manifest,
+            'precinct': {i['Id']: sys.intern(i['Description'].split()[1])
+                         for i in export.manifest('PrecinctPortionManifest.json')},
+            'ballotType': _descriptions(export.manifest('BallotTypeManifest.json')),
+            'countingGroup': _descriptions(export.manifest('CountingGroupManifest.json'))
+        }
+
+    def session_contests(self, current, contest_manifest):
+        return [(contest['Id'], contest['Marks']) for contest in current['Contests']
+                if contest['Id'] in contest_manifest]
+
+    def session_key(self, session, current):
+        return current['PrecinctPortionId'], current['BallotTypeId'], session['CountingGroupId']
+
+    def session_fields(self, key, tables):
+        precinctPortionId, ballotTypeId, countingGroupId = key
+        return (tables['precinct'][precinctPortionId],
+                tables['ballotType'][ballotTypeId],
+                tables['countingGroup'][countingGroupId])
+
+
+class Dominion5_4(DominionVersion):
+
+    columns = ('ranks', 'weight', 'ballotID', 'precinctPortion', 'ballot_type', 'countingGroup', 'precinct')
+    fields = ('precinctPortion', 'precinct', 'ballot_type', 'countingGroup')
+
+    def read_manifests(self, export, offices):
+
+        candidate_manifest = _descriptions(export.manifest('CandidateManifest.json'))
+
+        contest_manifest = {}
+        for i in export.manifest('ContestManifest.json'):
+            if i['Description'].strip() in offices:
+                contest_manifest[i['Id']] = {'office': i['Description'].strip(),
+                                             'rank_limit': i['NumOfRanks'],
+                                             'candidates': candidate_manifest}
+
+        return {
+            'contest': contest_manifest,
+            'precinctPortion': {i['Id']: {'Portion': sys.intern(i['Description']), 'PrecinctId': i['PrecinctId']}
+                                for i in export.manifest('PrecinctPortionManifest.json')},
+            'precinct': _descriptions(export.manifest('PrecinctManifest.json', optional=True)),
+            'ballotType': _descriptions(export.manifest('BallotTypeManifest.json')),
+            'countingGroup': _descriptions(export.manifest('CountingGroupManifest.json'))
+        }
+
+    def session_contests(self, current, contest_manifest):
+
+        if len(current['Cards']) > 1:
+            raise RuntimeError('"Cards" has length greater than 1, not prepared for this. debug')
+
+        # a contest repeated on the card keeps its last marks
+        session_contest_marks = {}
+        for ballot_contest in current['Cards'][0]['Contests']:
+            if ballot_contest['Id'] in contest_manifest:
+                session_contest_marks[ballot_contest['Id']] = ballot_contest['Marks']
+
+        return list(session_contest_marks.items())
+
+    def session_key(self, session, current):
+        return current['PrecinctPortionId'], current['BallotTypeId'], session['CountingGroupId']
+
+    def session_fields(self, key, tables):
+        precinctPortionId, ballotTypeId, countingGroupId = key
+        precinctPortion = tables['precinctPortion'][precinctPortionId]
+
+        # precinct is only known if the export includes PrecinctManifest.json
+        precinct = None
+        if tables['precinct']:
+            precinct = tables['precinct'][precinctPortion['PrecinctId']]
+
+        return (precinctPortion['Portion'],
+                precinct,
+                tables['ballotType'][ballotTypeId],
+                tables['countingGroup'][countingGroupId])
+
+    def ballot_dict(self, ballots):
+        ballot_dict = super().ballot_dict(ballots)
+        if ballot_dict['precinct'].isna().all():
+            del ballot_dict['precinct']
+        return ballot_dict
+
+
+class Dominion5_10(DominionVersion):
+
+    columns = ('ranks', 'weight', 'ballotID', 'precinct', 'precinctPortion', 'ballot_type', 'countingGroup',
+               'votingLocation', 'district', 'districtType')
+    fields = ('precinct', 'precinctPortion', 'ballot_type', 'countingGroup', 'votingLocation', 'district',
+              'districtType')
+
+    def export_names(self, export):
+        # large elections are exported in several shards, decoded in sorted order
+        return export.glob('CvrExport*.json')
+
+    def read_manifests(self, export, offices):
+
+        tables = Dominion5_4().read_manifests(export, offices)
+
+        tables['district'] = {i['Id']: {'District': sys.intern(i['Description']),
+                                        'DistrictTypeId': i['DistrictTypeId']}
+                              for i in export.manifest('DistrictManifest.json')}
+        tables['districtType'] = _descriptions(export.manifest('DistrictTypeManifest.json'))
+        tables['districtPrecinctPortion'] = {i['PrecinctPortionId']: i['DistrictId']
+                                             for i in export.manifest('DistrictPrecinctPortionManifest.json')}
+        tables['tabulator'] = _descriptions(export.manifest('TabulatorManifest.json'), key='VotingLocationName')
+
+        return tables
+
+    def session_contests(self, current, contest_manifest):
+
+        session_contest_marks = {}
+        for cards in current['Cards']:
+            for ballot_contest in cards['Contests']:
+                if ballot_contest['Id'] in contest_manifest:
+                    if ballot_contest['Id'] in session_contest_marks:
+                        raise RuntimeError("Contest Id appears twice across a single set of cards. Not expected.")
+                    session_contest_marks[ballot_contest['Id']] = ballot_contest['Marks']
+
+        return list(session_contest_marks.items())
+
+    def session_key(self, session, current):
+        return (current['PrecinctPortionId'], current['BallotTypeId'], session['CountingGroupId'],
+                session['TabulatorId'])
+
+    def session_fields(self, key, tables):
+        precinctPortionId, ballotTypeId, countingGroupId, tabulatorId = key
+        precinctPortion, precinct, ballotType, countingGroup = Dominion5_4.session_fields(
+            self, (precinctPortionId, ballotTypeId, countingGroupId), tables)
+
+        district = tables['district'][tables['districtPrecinctPortion'][precinctPortionId]]
+
+        return (precinct,
+                precinctPortion,
+                ballotType,
+                countingGroup,
+                tables['tabulator'][tabulatorId],
+                district['District'],
+                tables['districtType'][district['DistrictTypeId']])
+
+
+def decode_sessions(export: DominionExport, export_name: str, version: DominionVersion, tables: Dict) -> Dict:
+    """
+    Decode the sessions of one CvrExport file. Returns ballot columns for each contest id in the contest manifest:
+    ranks and ballotID lists, and the session fields of each ballot as a CategoricalColumn of field value tuples.
+    """
+    contest_manifest = tables['contest']
+    distinct_candidates = version.distinct_candidates
+
+    # sessions share a handful of precinct, ballot type, ... combinations, so look each up only once
+    session_fields = CategoricalColumn()
+    session_codes = {}
+
+    contest_ballots = {contest_id: {'ranks': [], 'ballotID': [], 'fields': array.array('i')}
+                       for contest_id in contest_manifest}
+
+    for session in export.iter_json_array(export_name, 'Sessions'):
+
+        # for each session use original, or if isCurrent is False, use modified
+        current = session['Original'] if session['Original']['IsCurrent'] else session['Modified']
+
+        session_contest_marks = version.session_contests(current, contest_manifest)
+        if not session_contest_marks:
+            continue
+
+        ballotID_search = _BALLOT_ID.search(session['ImageMask'])
+        if not ballotID_search:
+            raise RuntimeError('regex is not working correctly. debug')
+        ballotID = ballotID_search.group(1)
+
+        key = version.session_key(session, current)
+        fields_code = session_codes.get(key)
+        if fields_code is None:
+            fields_code = session_codes[key] = session_fields.code(version.session_fields(key, tables))
+
+        for contest_id, marks in session_contest_marks:
+            ballots = contest_ballots[contest_id]
+            ballots['ranks'].append(_bucket_marks(marks, contest_manifest[contest_id], distinct_candidates))
+            ballots['ballotID'].append(ballotID)
+            ballots['fields'].append(fields_code)
+
+    for ballots in contest_ballots.values():
+        fields = CategoricalColumn()
+        fields.codes = ballots['fields']
+        fields.categories = session_fields.categories
+        ballots['fields'] = fields
+
+    return contest_ballots
+
+
+# state for export decoding worker processes, set once per worker by _init_worker
+_worker = {}
+
+
+def _init_worker(cvr_path, version: DominionVersion, tables: Dict) -> None:
+    _worker['export'] = DominionExport(cvr_path)
+    _worker['version'] = version
+    _worker['tables'] = tables
+
+
+def _worker_decode_sessions(export_name: str) -> Dict:
+    return decode_sessions(_worker['export'], export_name, _worker['version'], _worker['tables'])
+
+
+def read_contests(cvr_path, offices: List[str], version: DominionVersion, n_workers: Optional[int] = 1) -> Dict:
+    """
+    Read ballots for several contests from a Dominion export, with a single pass over the CvrExport files.
+    Export files are decoded independently (in worker processes if n_workers > 1) and combined in order.
+
+    :raises RuntimeError: If ballotIDs pulled from ImageMask field are not unique.
+        Or if regex used to pull ballotID from ImageMask field malfunctions.
+    :return: A dictionary with one ballot dictionary per office found in ContestManifest.json.
+    """
+    export = DominionExport(cvr_path)
+    n_workers = int(n_workers or 1)
+
+    tables = version.read_manifests(export, offices)
+    export_names = version.export_names(export)
+
+    executor = None
+    if n_workers > 1 and len(export_names) > 1:
+        executor = concurrent.futures.ProcessPoolExecutor(max_workers=min(n_workers, len(export_names)),
+                                                          initializer=_init_worker,
+                                                          initargs=(cvr_path, version, tables))
+        export_ballots = executor.map(_worker_decode_sessions, export_names)
+    else:
+        export_ballots = (decode_sessions(export, export_name, version, tables) for export_name in export_names)
+
+    contest_ballots = {contest_id: {'ranks': [], 'ballotID': [], 'fields': CategoricalColumn()}
+                       for contest_id in tables['contest']}
+    try:
+        for export_contest_ballots in export_ballots:
+            for contest_id, columns in export_contest_ballots.items():
+                for col, values in columns.items():
+                    contest_ballots[contest_id][col].extend(values)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    contest_ballot_dicts = {}
+    for contest_id, ballots in contest_ballots.items():
+
+        # check ballotIDs are unique
+        if len(set(ballots['ballotID'])) != len(ballots['ballotID']):
+            raise RuntimeError("some non-unique ballot IDs")
+
+        contest_ballot_dicts[tables['contest'][contest_id]['office']] = version.ballot_dict(ballots)
+
+    return contest_ballot_dicts
@@ -0,0 +1,187 @@
+from typing import (Any, Iterator, TextIO, Union)
+
+import json
+import os
+import queue
+import threading
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+class _JSONStream:
+    """
+    Reads JSON values one at a time from a text file, holding only a bounded window of the file in memory.
+    """
+
+    def __init__(self, f: TextIO, chunk_size: int) -> None:
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self) -> bool:
+        """
+        Read the next chunk, dropping the consumed part of the buffer. Returns False at end of file.
+        """
+        if self.eof:
+            return False
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _error(self, msg: str) -> json.JSONDecodeError:
+        return json.JSONDecodeError(msg, self.buf, self.pos)
+
+    def skip_whitespace(self) -> None:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._fill():
+                return
+
+    def next_char(self) -> str:
+        self.skip_whitespace()
+        if self.pos >= len(self.buf):
+            raise self._error('unexpected end of file')
+        char = self.buf[self.pos]
+        self.pos += 1
+        return char
+
+    def expect(self, char: str) -> None:
+        if self.next_char() != char:
+            raise self._error(f'expected "{char}"')
+
+    def peek(self) -> str:
+        self.skip_whitespace()
+        return self.buf[self.pos] if self.pos < len(self.buf) else ''
+
+    def value(self) -> Any:
+        """
+        Decode the next complete JSON value, reading more of the file until it fits in the buffer.
+        """
+        self.skip_whitespace()
+        while True:
+            try:
+                decoded, end = _DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+                continue
+            # a number cut off at the end of the buffer still decodes, make sure it was complete
+            if end == len(self.buf) and self._fill():
+                continue
+            self.pos = end
+            return decoded
+
+
+class PrefetchReader:
+    """
+    Text file wrapper that reads ahead on a background thread, so that producing the text (for example
+    decompressing a zip archive member) overlaps with whatever the caller does with it. At most depth chunks
+    are held in memory.
+    """
+
+    def __init__(self, f: TextIO, chunk_size: int = 1 << 20, depth: int = 4) -> None:
+        self.f = f
+        self.chunk_size = chunk_size
+        self.chunks = queue.Queue(maxsize=depth)
+        self.stopped = threading.Event()
+        self.done = False
+        self.thread = threading.Thread(target=self._read_ahead, daemon=True)
+        self.thread.start()
+
+    def _read_ahead(self) -> None:
+        try:
+            while not self.stopped.is_set():
+                chunk = self.f.read(self.chunk_size)
+                self._put(chunk)
+                if not chunk:
+                    return
+        except Exception as e:
+            self._put(e)
+
+    def _put(self, item) -> None:
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def read(self, size: int = -1) -> str:
+        if self.done:
+            return ''
+        chunk = self.chunks.get()
+        if isinstance(chunk, Exception):
+            self.done = True
+            raise chunk
+        if not chunk:
+            self.done = True
+        return chunk
+
+    def close(self) -> None:
+        self.stopped.set()
+        self.thread.join()
+        self.f.close()
+
+    def __enter__(self) -> 'PrefetchReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+
+def iter_json_array(source: Union[str, os.PathLike, TextIO], key: str, chunk_size: int = 1 << 20) -> Iterator:
+    """
+    Yield, one at a time, the items of the array stored under key in a file holding a single JSON object.
+    Items are decoded as the file is read, so memory use depends on the size of one item rather than the file.
+    Members of the object other than key are decoded and discarded, and reading stops at the end of the array.
+
+    :param source: Path to the file, or an open text file (which is not closed here).
+    :raises KeyError: If the object has no member named key.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, encoding='utf8') as f:
+            yield from iter_json_array(f, key, chunk_size)
+        return
+
+    stream = _JSONStream(source, chunk_size)
+
+    # tolerate a byte order mark, which some exports begin with
+    if stream.peek() == '\ufeff':
+        stream.pos += 1
+
+    stream.expect('{')
+    if stream.peek() == '}':
+        raise KeyError(key)
+
+    # find the member
+    while True:
+        member_name = stream.value()
+        stream.expect(':')
+        if member_name == key:
+            break
+        stream.value()
+        separator = stream.next_char()
+        if separator == '}':
+            raise KeyError(key)
+        if separator != ',':
+            raise stream._error('expected "," or "}"')
+
+    stream.expect('[')
+    if stream.peek() == ']':
+        return
+
+    while True:
+        yield stream.value()
+        separator = stream.next_char()
+        if separator == ']':
+            return
+        if separator != ',':
+            raise stream._error('expected "," or "]"')
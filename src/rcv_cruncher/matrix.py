@@ -0,0 +1,418 @@
+from __future__ import annotations
+from typing import (Iterable, List, Optional, Sequence, Set)
+
+import collections
+
+import numpy as np
+
+from rcv_cruncher.marks import BallotMarks
+
+
+class BallotMatrix:
+    """
+    All ballots of a cast vote record stored as one ballots x ranks integer array
+    plus a code table mapping each integer back to its mark.
+
+    Codes 0, 1 and 2 are reserved for BallotMarks.SKIPPED, BallotMarks.OVERVOTE and BallotMarks.WRITEIN.
+    Every other mark found in the input is assigned the next free code. Ballots that become shorter
+    once rules are applied are right-padded with PAD_CODE.
+
+    Rank arrays are read-only and shared between copies, every change builds a new array. Once rules are
+    applied, only the ballots they changed are stored, as overrides of the array shared with the unmodified
+    ballots, so each rule set costs memory in proportion to the ballots it alters.
+    """
+
+    PAD_CODE = -1
+    SKIPPED_CODE = 0
+    OVERVOTE_CODE = 1
+    WRITEIN_CODE = 2
+
+    RESERVED_MARKS = [BallotMarks.SKIPPED, BallotMarks.OVERVOTE, BallotMarks.WRITEIN]
+
+    # inactive_type values stored as small integer codes, 0 means rules have not been applied
+    INACTIVE_TYPES = [None,
+                      BallotMarks.UNDERVOTE,
+                      BallotMarks.PRETALLY_EXHAUST,
+                      BallotMarks.MAYBE_EXHAUSTED,
+                      BallotMarks.MAYBE_EXHAUSTED_BY_OVERVOTE,
+                      BallotMarks.MAYBE_EXHAUSTED_BY_REPEATED_SKIPPED_RANKING,
+                      BallotMarks.MAYBE_EXHAUSTED_BY_DUPLICATE_RANKING]
+
+    @staticmethod
+    def code_dtype(n_codes: int) -> np.dtype:
+        if n_codes < np.iinfo(np.int16).max:
+            return np.dtype(np.int16)
+        return np.dtype(np.int32)
+
+    @staticmethod
+    def combine_writein_codes(ballot_matrix: BallotMatrix) -> BallotMatrix:
+
+        if not isinstance(ballot_matrix, BallotMatrix):
+            raise TypeError('ballot_matrix must be BallotMatrix object.')
+
+        copy_ballot_matrix = ballot_matrix.copy()
+        copy_ballot_matrix._combine_writeins()
+        return copy_ballot_matrix
+
+    @staticmethod
+    def remove_codes(ballot_matrix: BallotMatrix, remove_codes: Iterable[int]) -> BallotMatrix:
+
+        if not isinstance(ballot_matrix, BallotMatrix):
+            raise TypeError('ballot_matrix must be BallotMatrix object.')
+
+        copy_ballot_matrix = ballot_matrix.copy()
+        copy_ballot_matrix._compact(~np.isin(copy_ballot_matrix.ranks, list(remove_codes)))
+        return copy_ballot_matrix
+
+    @staticmethod
+    def remove_duplicate_candidate_codes(ballot_matrix: BallotMatrix) -> BallotMatrix:
+
+        if not isinstance(ballot_matrix, BallotMatrix):
+            raise TypeError('ballot_matrix must be BallotMatrix object.')
+
+        copy_ballot_matrix = ballot_matrix.copy()
+        copy_ballot_matrix._compact(~copy_ballot_matrix.duplicate_mask())
+        return copy_ballot_matrix
+
+    @staticmethod
+    def from_rank_lists(rank_lists: Sequence[Sequence]) -> BallotMatrix:
+
+        ballot_lengths = collections.Counter(len(ranks) for ranks in rank_lists)
+        if len(ballot_lengths) > 1:
+            raise RuntimeError(f'Parsed CVR contains ballots with unequal length rank lists. {str(ballot_lengths)}')
+
+        n_ranks = next(iter(ballot_lengths)) if ballot_lengths else 0
+
+        codes = list(BallotMatrix.RESERVED_MARKS)
+        code_lookup = {mark: code for code, mark in enumerate(codes)}
+
+        flat = []
+        for ranks in rank_lists:
+            for mark in ranks:
+                code = code_lookup.get(mark)
+                if code is None:
+                    code = len(codes)
+                    code_lookup[mark] = code
+                    codes.append(mark)
+                flat.append(code)
+
+        ranks = np.array(flat, dtype=BallotMatrix.code_dtype(len(codes))).reshape(len(rank_lists), n_ranks)
+        return BallotMatrix(ranks, codes)
+
+    @staticmethod
+    def from_mark_index(mark_index: np.ndarray, marks: Sequence, block_rows: int = 1024) -> BallotMatrix:
+        """
+        Build from a ballots x ranks integer array of positions in a list of marks, as produced by readers
+        that code values while reading. Equal marks share a code and codes are numbered in the order marks
+        first appear, as in from_rank_lists.
+        """
+        mark_index = np.asarray(mark_index)
+        if mark_index.ndim != 2:
+            raise TypeError('mark_index must be a two dimensional (ballots x ranks) array.')
+
+        codes = list(BallotMatrix.RESERVED_MARKS)
+        code_lookup = {mark: code for code, mark in enumerate(codes)}
+        provisional = np.array([code_lookup.setdefault(mark, len(code_lookup)) for mark in marks], dtype=np.int64)
+        ranks = provisional[mark_index]
+
+        # scan growing blocks of ballots until every code present has been seen
+        n_reserved = len(codes)
+        present = np.flatnonzero(np.bincount(ranks.ravel(), minlength=n_reserved)[n_reserved:]) + n_reserved
+        provisional_marks = list(code_lookup)
+        recode = np.arange(len(provisional_marks))
+        seen = set()
+        start = 0
+        while len(seen) < len(present):
+            block_codes, block_first = np.unique(ranks[start:start + block_rows].ravel(), return_index=True)
+            new = sorted((idx, code) for code, idx in zip(block_codes.tolist(), block_first.tolist())
+                         if code >= n_reserved and code not in seen)
+            for _, code in new:
+                seen.add(code)
+                recode[code] = len(codes)
+                codes.append(provisional_marks[code])
+            start += block_rows
+            block_rows *= 2
+
+        return BallotMatrix(recode[ranks].astype(BallotMatrix.code_dtype(len(codes))), codes)
+
+    def __init__(self, ranks: np.ndarray, codes: Iterable) -> None:
+
+        ranks = np.asarray(ranks)
+        if ranks.ndim != 2:
+            raise TypeError('ranks must be a two dimensional (ballots x ranks) array.')
+
+        codes = list(codes)
+        if codes[:len(self.RESERVED_MARKS)] != self.RESERVED_MARKS:
+            raise RuntimeError('code table must start with the reserved skipped, overvote and writein marks.')
+
+        self.ranks = ranks
+        self.codes = codes
+        self.code_lookup = {mark: code for code, mark in enumerate(codes)}
+
+        self.rules = {}
+        self.inactive_type = np.zeros(ranks.shape[0], dtype=np.int8)
+
+    @property
+    def ranks(self) -> np.ndarray:
+        """
+        The ballots x ranks code array, with any changed ballots merged into a new array on each access
+        (the merged array is not kept, so that idle rule sets only hold their changed ballots). Callers that
+        read it more than once should keep a local reference.
+        """
+        if self._changed_rows is None:
+            return self._shared_ranks
+
+        ranks = self._shared_ranks.copy()
+        ranks[self._changed_rows] = self._changed_ranks
+        ranks.flags.writeable = False
+        return ranks
+
+    @ranks.setter
+    def ranks(self, ranks: np.ndarray) -> None:
+        self._shared_ranks = self._read_only(ranks)
+        self._changed_rows = None
+        self._changed_ranks = None
+
+    @staticmethod
+    def _read_only(array: np.ndarray) -> np.ndarray:
+        array = array.view()
+        array.flags.writeable = False
+        return array
+
+    def __len__(self) -> int:
+        return self._shared_ranks.shape[0]
+
+    @property
+    def n_ballots(self) -> int:
+        return self._shared_ranks.shape[0]
+
+    @property
+    def n_ranks(self) -> int:
+        return self._shared_ranks.shape[1]
+
+    @property
+    def n_changed(self) -> int:
+        """
+        Number of ballots stored apart from the shared rank array.
+        """
+        return 0 if self._changed_rows is None else len(self._changed_rows)
+
+    def copy(self) -> BallotMatrix:
+
+        # rank arrays are never written in place, so the copy can share them
+        copy_obj = BallotMatrix(self._shared_ranks, self.codes)
+        copy_obj._changed_rows = self._changed_rows
+        copy_obj._changed_ranks = self._changed_ranks
+
+        copy_obj.rules = self.rules
+        copy_obj.inactive_type = self.inactive_type.copy()
+
+        return copy_obj
+
+    def _store_changed_rows(self, shared_ranks: np.ndarray) -> None:
+        """
+        Keep only the ballots that differ from shared_ranks (an array other copies may hold), unless most do.
+        """
+        ranks = self._shared_ranks
+        if ranks is shared_ranks or ranks.shape != shared_ranks.shape:
+            return
+
+        changed_rows = np.flatnonzero((ranks != shared_ranks).any(axis=1))
+        if len(changed_rows) > len(ranks) // 2:
+            return
+
+        changed_ranks = ranks[changed_rows]
+        self.ranks = shared_ranks
+        if len(changed_rows):
+            self._changed_rows = self._read_only(changed_rows)
+            self._changed_ranks = self._read_only(changed_ranks)
+
+    def encode(self, mark) -> int:
+        return self.code_lookup[mark]
+
+    def mark_array(self, pad_mark=None) -> np.ndarray:
+        """
+        Object array for decoding with fancy indexing, the last entry decodes PAD_CODE.
+        """
+        mark_array = np.empty(len(self.codes) + 1, dtype=object)
+        mark_array[:-1] = self.codes
+        mark_array[-1] = pad_mark
+        return mark_array
+
+    def decode_column(self, rank_idx: int, pad_mark=None) -> np.ndarray:
+        return self.mark_array(pad_mark=pad_mark)[self.ranks[:, rank_idx]]
+
+    def lengths(self) -> np.ndarray:
+        return (self.ranks != self.PAD_CODE).sum(axis=1)
+
+    def to_lists(self) -> List[List]:
+        codes = self.codes
+        return [[codes[code] for code in row if code != self.PAD_CODE] for row in self.ranks.tolist()]
+
+    def to_ballot_marks(self) -> List[BallotMarks]:
+
+        ballot_marks = []
+        inactive_types = self.inactive_types()
+        for marks, inactive_type in zip(self.to_lists(), inactive_types):
+            b = BallotMarks(marks)
+            b.rules = self.rules
+            b.inactive_type = inactive_type
+            ballot_marks.append(b)
+
+        return ballot_marks
+
+    def inactive_types(self) -> List[Optional[str]]:
+        return [self.INACTIVE_TYPES[code] for code in self.inactive_type.tolist()]
+
+    def candidate_codes(self) -> np.ndarray:
+        present = np.unique(self.ranks)
+        return present[present >= self.WRITEIN_CODE]
+
+    def unique_candidates(self) -> Set:
+        return {self.codes[code] for code in self.candidate_codes().tolist()}
+
+    def writein_codes(self) -> np.ndarray:
+        return np.array([code for code, mark in enumerate(self.codes)
+                         if code >= self.WRITEIN_CODE and BallotMarks.check_writein_match(mark)], dtype=np.int64)
+
+    def _lookup(self, table: np.ndarray) -> np.ndarray:
+        # table is indexed by code + 1 so that PAD_CODE maps through position 0
+        ranks = self.ranks
+        return table[ranks.astype(np.int64) + 1].astype(ranks.dtype)
+
+    def _combine_writeins(self) -> None:
+        table = np.arange(-1, len(self.codes))
+        table[self.writein_codes() + 1] = self.WRITEIN_CODE
+        self.ranks = self._lookup(table)
+
+    def _compact(self, keep: np.ndarray) -> None:
+        """
+        Drop every position not flagged in keep, shifting the remaining marks left and padding the end.
+        """
+        ranks = self.ranks
+        keep = keep & (ranks != self.PAD_CODE)
+        if keep.all():
+            return
+
+        order = np.argsort(~keep, axis=1, kind='stable')
+        compacted = np.take_along_axis(ranks, order, axis=1)
+        compacted[np.arange(self.n_ranks)[np.newaxis, :] >= keep.sum(axis=1)[:, np.newaxis]] = self.PAD_CODE
+        self.ranks = compacted
+
+    def duplicate_mask(self) -> np.ndarray:
+        """
+        True wherever a candidate code already appeared earlier on the same ballot.
+        """
+        ranks = self.ranks
+        order = np.argsort(ranks, axis=1, kind='stable')
+        sorted_ranks = np.take_along_axis(ranks, order, axis=1)
+
+        sorted_dups = np.zeros(ranks.shape, dtype=bool)
+        sorted_dups[:, 1:] = sorted_ranks[:, 1:] == sorted_ranks[:, :-1]
+
+        dups = np.zeros(ranks.shape, dtype=bool)
+        np.put_along_axis(dups, order, sorted_dups, axis=1)
+        return dups & (ranks >= self.WRITEIN_CODE)
+
+    def apply_rules(self,
+                    combine_writein_marks: bool = False,
+                    exclude_writein_marks: bool = False,
+                    exclude_duplicate_candidate_marks: bool = False,
+                    exclude_overvote_marks: bool = False,
+                    exclude_skipped_marks: bool = False,
+                    treat_combined_writeins_as_exhaustable_duplicates: bool = False,
+                    exhaust_on_duplicate_candidate_marks: bool = False,
+                    exhaust_on_overvote_marks: bool = False,
+                    exhaust_on_repeated_skipped_marks: bool = False) -> None:
+
+        if self.rules:
+            raise RuntimeError('rules have already been applied to these ballots')
+
+        shared_ranks = self.ranks
+
+        rules = BallotMarks.new_rule_set(
+            combine_writein_marks=combine_writein_marks,
+            exclude_writein_marks=exclude_writein_marks,
+            exclude_duplicate_candidate_marks=exclude_duplicate_candidate_marks,
+            exclude_overvote_marks=exclude_overvote_marks,
+            exclude_skipped_marks=exclude_skipped_marks,
+            treat_combined_writeins_as_exhaustable_duplicates=treat_combined_writeins_as_exhaustable_duplicates,
+            exhaust_on_duplicate_candidate_marks=exhaust_on_duplicate_candidate_marks,
+            exhaust_on_overvote_marks=exhaust_on_overvote_marks,
+            exhaust_on_repeated_skipped_marks=exhaust_on_repeated_skipped_marks
+        )
+
+        # same semantics as BallotMarks.apply_rules, evaluated for all ballots at once
+        valid = self.ranks != self.PAD_CODE
+        skipped = self.ranks == self.SKIPPED_CODE
+        all_skipped = (skipped | ~valid).all(axis=1) & skipped.any(axis=1)
+
+        # has to occur before exhaustion by duplicates is computed
+        if combine_writein_marks and treat_combined_writeins_as_exhaustable_duplicates:
+            self._combine_writeins()
+
+        n_ballots, n_ranks = self.ranks.shape
+
+        # flag every position that would stop the ballot, then cut each ballot at its first flag
+        repeated_skipped = np.zeros((n_ballots, n_ranks), dtype=bool)
+        if exhaust_on_repeated_skipped_marks and n_ranks > 1:
+            # any non-skip mark at or after each position
+            marks_remain = np.logical_or.accumulate((valid & ~skipped)[:, ::-1], axis=1)[:, ::-1]
+            repeated_skipped[:, :-1] = skipped[:, :-1] & skipped[:, 1:] & marks_remain[:, 1:]
+
+        overvote = np.zeros((n_ballots, n_ranks), dtype=bool)
+        if exhaust_on_overvote_marks:
+            overvote = self.ranks == self.OVERVOTE_CODE
+
+        duplicate = np.zeros((n_ballots, n_ranks), dtype=bool)
+        if exhaust_on_duplicate_candidate_marks:
+            duplicate = self.duplicate_mask()
+
+        stops = repeated_skipped | overvote | duplicate
+        stopped = stops.any(axis=1)
+
+        cut_idx = np.full(n_ballots, n_ranks)
+        specific_exhaust = np.zeros(n_ballots, dtype=np.int64)
+        if stopped.any():
+
+            stop_idx = stops.argmax(axis=1)
+            cut_idx[stopped] = stop_idx[stopped]
+
+            # checks are made in the same order as BallotMarks.apply_rules, first match decides the exhaust type
+            ballot_idx = np.arange(n_ballots)
+            specific_exhaust = np.select(
+                [repeated_skipped[ballot_idx, stop_idx], overvote[ballot_idx, stop_idx], duplicate[ballot_idx, stop_idx]],
+                [self.INACTIVE_TYPES.index(BallotMarks.MAYBE_EXHAUSTED_BY_REPEATED_SKIPPED_RANKING),
+                 self.INACTIVE_TYPES.index(BallotMarks.MAYBE_EXHAUSTED_BY_OVERVOTE),
+                 self.INACTIVE_TYPES.index(BallotMarks.MAYBE_EXHAUSTED_BY_DUPLICATE_RANKING)],
+                default=0)
+            specific_exhaust[~stopped] = 0
+
+        keep = np.arange(n_ranks)[np.newaxis, :] < cut_idx[:, np.newaxis]
+
+        if combine_writein_marks and not treat_combined_writeins_as_exhaustable_duplicates:
+            self._combine_writeins()
+
+        # exclusions only drop marks, so they can all be folded into a single compaction
+        if exclude_duplicate_candidate_marks:
+            keep &= ~self.duplicate_mask()
+
+        if exclude_overvote_marks:
+            keep &= self.ranks != self.OVERVOTE_CODE
+
+        if exclude_skipped_marks:
+            keep &= self.ranks != self.SKIPPED_CODE
+
+        if exclude_writein_marks:
+            keep &= self.ranks != self.WRITEIN_CODE
+
+        self._compact(keep)
+        self._store_changed_rows(shared_ranks)
+
+        self.rules = rules
+        self.inactive_type = np.select(
+            [all_skipped, self.lengths() == 0, specific_exhaust > 0],
+            [self.INACTIVE_TYPES.index(BallotMarks.UNDERVOTE),
+             self.INACTIVE_TYPES.index(BallotMarks.PRETALLY_EXHAUST),
+             specific_exhaust],
+            default=self.INACTIVE_TYPES.index(BallotMarks.MAYBE_EXHAUSTED)).astype(np.int8)
@@ -0,0 +1,128 @@
+from typing import (Dict, Tuple, Union)
+
+import abc
+import decimal
+
+
+Number = Union[int, decimal.Decimal]
+
+
+class NumericBackend(abc.ABC):
+    """
+    Arithmetic used for ballot weights, tallies and transfers during tabulation.
+
+    Values are held internally in backend units (to_internal) while tabulating and converted back
+    (to_external) whenever they are returned from a getter.
+    """
+
+    name = None
+
+    @abc.abstractmethod
+    def to_internal(self, value: decimal.Decimal) -> Number:
+        pass
+
+    @abc.abstractmethod
+    def to_external(self, value: Number) -> Number:
+        pass
+
+    @abc.abstractmethod
+    def split_weight(self, weight: Number, numerator: Number, denominator: Number) -> Tuple[Number, Number]:
+        """
+        Split a ballot weight into the part kept by its current candidate and the part passed on, where
+        the passed on share is numerator/denominator. Returns (kept, passed on).
+        """
+        pass
+
+    def normalize(self, value: decimal.Decimal) -> Number:
+        """
+        Return the value as the backend would report it after a round trip through tabulation.
+        """
+        return self.to_external(self.to_internal(value))
+
+
+class DecimalBackend(NumericBackend):
+    """
+    Reference backend. Every value is a decimal.Decimal (30 significant digits).
+    """
+
+    name = 'decimal'
+
+    def to_internal(self, value: decimal.Decimal) -> decimal.Decimal:
+        return value
+
+    def to_external(self, value: Number) -> Number:
+        return value
+
+    def split_weight(self, weight: decimal.Decimal,
+                     numerator: decimal.Decimal, denominator: decimal.Decimal) -> Tuple[decimal.Decimal, decimal.Decimal]:
+        surplus_percent = numerator / denominator
+        return weight * (1 - surplus_percent), weight * surplus_percent
+
+
+class IntBackend(NumericBackend):
+    """
+    Integer counts, for contests where every ballot weight is a whole number. Ballot weights cannot be split.
+    """
+
+    name = 'int'
+
+    def to_internal(self, value: decimal.Decimal) -> int:
+        if value != value.to_integral_value():
+            raise RuntimeError(f'"int" numeric backend requires whole number ballot weights, found {value}.')
+        return int(value)
+
+    def to_external(self, value: Number) -> Number:
+        return value
+
+    def split_weight(self, weight: int, numerator: int, denominator: int) -> Tuple[int, int]:
+        raise RuntimeError('"int" numeric backend cannot split ballot weights, use the "fixed" backend.')
+
+
+class FixedBackend(NumericBackend):
+    """
+    Scaled integer fixed point with a set number of decimal places. Ballot weights are rounded (half even)
+    to that many places when tabulation starts. When a weight is split, the passed on share is rounded down
+    and the current candidate keeps the remainder, so no weight is created or lost.
+    """
+
+    name = 'fixed'
+
+    def __init__(self, places: int = 6) -> None:
+        if places < 0:
+            raise RuntimeError('"fixed" numeric backend needs a non-negative number of decimal places.')
+        self.places = places
+        self._scale = 10 ** places
+
+    def to_internal(self, value: decimal.Decimal) -> int:
+        return int((value * self._scale).to_integral_value(rounding=decimal.ROUND_HALF_EVEN))
+
+    def to_external(self, value: Number) -> Number:
+        if isinstance(value, decimal.Decimal):
+            return value
+        return decimal.Decimal(value).scaleb(-self.places)
+
+    def split_weight(self, weight: int, numerator: int, denominator: int) -> Tuple[int, int]:
+        passed_on = weight * numerator // denominator
+        return weight - passed_on, passed_on
+
+
+def get_numeric_backend_dict() -> Dict:
+    """
+    Return dictionary of numeric backends, backend_name: class_obj
+    """
+    return {
+        'decimal': DecimalBackend,
+        'int': IntBackend,
+        'fixed': FixedBackend
+    }
+
+
+def get_numeric_backend(name: str = 'decimal', fixed_point_places: int = 6) -> NumericBackend:
+
+    backend_dict = get_numeric_backend_dict()
+    if name not in backend_dict:
+        raise RuntimeError(f'numeric backend "{name}" is not one of {list(backend_dict)}')
+
+    if name == 'fixed':
+        return FixedBackend(fixed_point_places)
+    return backend_dict[name]()
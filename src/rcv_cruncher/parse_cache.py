@@ -0,0 +1,258 @@
+from typing import (Callable, Dict, List, Optional)
+
+import decimal
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import sys
+import types
+
+import numpy as np
+import pandas as pd
+
+import rcv_cruncher
+from rcv_cruncher.matrix import BallotMatrix
+
+# bump when the on-disk layout or the key changes, old entries are then simply never found
+CACHE_VERSION = 3
+
+# metadata column values that survive a json round trip unchanged
+_CACHEABLE_TYPES = (str, int, float, bool, type(None))
+
+
+def input_fingerprint(parser_args: Dict) -> List:
+    """
+    Size and modification time of every input file named in the parser arguments. Directory arguments
+    cover all files below them. File arguments also cover the other files in the same directory, since
+    some parsers read side files (such as candidate_codes.csv) next to the CVR.
+    """
+    fingerprint = []
+    for arg_name, arg_value in sorted(parser_args.items()):
+
+        if not isinstance(arg_value, (str, pathlib.Path)) or not os.path.exists(arg_value):
+            continue
+
+        arg_path = pathlib.Path(arg_value)
+        if arg_path.is_dir():
+            files = sorted(p for p in arg_path.rglob('*') if p.is_file())
+        else:
+            files = sorted(p for p in arg_path.parent.iterdir() if p.is_file())
+
+        for fpath in files:
+            stat = fpath.stat()
+            fingerprint.append([arg_name, str(fpath), stat.st_size, stat.st_mtime_ns])
+
+    return fingerprint
+
+
+def _code_digest(code: types.CodeType, digest) -> None:
+    """
+    Add a code object to the digest: its bytecode and its constants, including those of nested functions.
+    """
+    digest.update(code.co_code)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            _code_digest(const, digest)
+        elif isinstance(const, frozenset):
+            digest.update(repr(sorted(const, key=repr)).encode('utf8'))
+        else:
+            digest.update(repr(const).encode('utf8'))
+
+
+def _parser_modules(parser_func: Callable) -> List[str]:
+    """
+    The module defining the parser plus every rcv_cruncher module it refers to, directly or through
+    other rcv_cruncher modules.
+    """
+    modules = set()
+    to_visit = [parser_func.__module__]
+    while to_visit:
+
+        module_name = to_visit.pop()
+        if module_name in modules or module_name not in sys.modules:
+            continue
+        modules.add(module_name)
+
+        for obj in list(vars(sys.modules[module_name]).values()):
+            ref = obj.__name__ if isinstance(obj, types.ModuleType) else getattr(obj, '__module__', None)
+            if isinstance(ref, str) and (ref == 'rcv_cruncher' or ref.startswith('rcv_cruncher.')):
+                to_visit.append(ref)
+
+    return sorted(modules)
+
+
+@functools.lru_cache(maxsize=None)
+def parser_fingerprint(parser_func: Callable) -> str:
+    """
+    Hash of the parser code (bytecode and constants) and of the source files of the modules it uses,
+    so that any change to the parser or to the helpers doing the decoding gives new cache keys.
+    Computed once per parser function and process, a batch of contests reuses it for every key.
+    """
+    digest = hashlib.sha256()
+    _code_digest(parser_func.__code__, digest)
+
+    for module_name in _parser_modules(parser_func):
+        source_file = getattr(sys.modules[module_name], '__file__', None)
+        if source_file and os.path.isfile(source_file):
+            digest.update(module_name.encode('utf8'))
+            digest.update(pathlib.Path(source_file).read_bytes())
+
+    return digest.hexdigest()
+
+
+def cache_key(parser_func: Callable, parser_args: Dict) -> str:
+    """
+    Key for a parser call: the package version, the parser name and code fingerprint, its arguments
+    and a fingerprint of its input files.
+    """
+    key_info = {
+        'version': CACHE_VERSION,
+        'package_version': rcv_cruncher.__version__,
+        'parser': f'{parser_func.__module__}.{parser_func.__qualname__}',
+        'parser_code': parser_fingerprint(parser_func),
+        'parser_args': {k: str(v) for k, v in parser_args.items()},
+        'inputs': input_fingerprint(parser_args)
+    }
+    return hashlib.sha256(json.dumps(key_info, sort_keys=True).encode('utf8')).hexdigest()
+
+
+def _factorize(values: List) -> Optional[Dict]:
+    """
+    Integer code per value plus the list of distinct values, or None if a value cannot be stored.
+    Categorical columns keep their own codes, with -1 for missing values.
+    """
+    if isinstance(values, pd.Categorical):
+        categories = values.categories.tolist()
+        if any(type(value) not in _CACHEABLE_TYPES for value in categories):
+            return None
+        return {'codes': values.codes.astype(np.int32), 'categories': categories, 'categorical': True}
+
+    lookup = {}
+    categories = []
+    codes = np.empty(len(values), dtype=np.int32)
+    for idx, value in enumerate(values):
+
+        if type(value) not in _CACHEABLE_TYPES:
+            return None
+
+        # NaN != NaN, so give all of them one shared key
+        value_key = (type(value), value) if value == value else 'nan'
+        code = lookup.get(value_key)
+        if code is None:
+            code = len(categories)
+            lookup[value_key] = code
+            categories.append(value)
+        codes[idx] = code
+
+    return {'codes': codes, 'categories': categories}
+
+
+def save_parsed_cvr(cache_dir: pathlib.Path, key: str, parsed_cvr: Dict) -> Dict:
+    """
+    Write parser output to the cache. Ranks are stored as a ballot matrix, weights and metadata columns as
+    integer coded numpy arrays, so that all of them can be memory mapped when loaded.
+
+    Returns the parsed cvr, with ranks converted to a BallotMatrix. Parser output that cannot be stored
+    (unusual column value types) is returned unchanged and not cached.
+    """
+    if 'ranks' not in parsed_cvr or len(parsed_cvr['ranks']) == 0:
+        return parsed_cvr
+
+    ballot_matrix = parsed_cvr['ranks']
+    if not isinstance(ballot_matrix, BallotMatrix):
+        ballot_matrix = BallotMatrix.from_rank_lists(parsed_cvr['ranks'])
+
+    if not all(isinstance(mark, str) for mark in ballot_matrix.codes):
+        return parsed_cvr
+
+    weight = parsed_cvr.get('weight', [decimal.Decimal('1')] * len(ballot_matrix))
+
+    columns = {}
+    for col, values in parsed_cvr.items():
+        if col in ['ranks', 'weight']:
+            continue
+        if isinstance(values, np.ndarray):
+            values = values.tolist()
+        factorized = _factorize(values if isinstance(values, pd.Categorical) else list(values))
+        if factorized is None:
+            return parsed_cvr
+        columns[col] = factorized
+
+    cache_dir = pathlib.Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # write into a scratch directory and move it into place, so concurrent runs never see a partial entry
+    tmp_dir = cache_dir / f'{key}.tmp{os.getpid()}'
+    tmp_dir.mkdir()
+
+    np.save(tmp_dir / 'ranks.npy', ballot_matrix.ranks)
+    np.save(tmp_dir / 'weight.npy', np.array([str(w) for w in weight]))
+    np.save(tmp_dir / 'columns.npy',
+            np.column_stack([columns[col]['codes'] for col in columns]) if columns
+            else np.empty((len(ballot_matrix), 0), dtype=np.int32))
+
+    meta = {
+        'codes': ballot_matrix.codes,
+        'columns': list(columns),
+        'categories': [columns[col]['categories'] for col in columns],
+        'categorical': [col for col in columns if columns[col].get('categorical')]
+    }
+    with open(tmp_dir / 'meta.json', 'w', encoding='utf8') as meta_file:
+        json.dump(meta, meta_file)
+
+    try:
+        os.replace(tmp_dir, cache_dir / key)
+    except OSError:
+        # another process stored the same entry first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    parsed_cvr = dict(parsed_cvr)
+    parsed_cvr['ranks'] = ballot_matrix
+    return parsed_cvr
+
+
+def load_parsed_cvr(cache_dir: pathlib.Path, key: str) -> Optional[Dict]:
+    """
+    Read parser output stored by save_parsed_cvr. Returns None if there is no entry for the key.
+    """
+    entry_dir = pathlib.Path(cache_dir) / key
+    if not (entry_dir / 'meta.json').is_file():
+        return None
+
+    with open(entry_dir / 'meta.json', encoding='utf8') as meta_file:
+        meta = json.load(meta_file)
+
+    ranks = np.load(entry_dir / 'ranks.npy', mmap_mode='r')
+    weight = np.load(entry_dir / 'weight.npy', mmap_mode='r')
+    column_codes = np.load(entry_dir / 'columns.npy', mmap_mode='r')
+
+    parsed_cvr = {
+        'ranks': BallotMatrix(ranks, meta['codes']),
+        'weight': [decimal.Decimal(w) for w in weight.tolist()]
+    }
+    for col_idx, (col, categories) in enumerate(zip(meta['columns'], meta['categories'])):
+        if col in meta['categorical']:
+            parsed_cvr[col] = pd.Categorical.from_codes(np.asarray(column_codes[:, col_idx]), categories=categories)
+        else:
+            parsed_cvr[col] = [categories[code] for code in column_codes[:, col_idx].tolist()]
+
+    return parsed_cvr
+
+
+def cached_parse(parser_func: Callable, parser_args: Dict, cache_dir: Optional[pathlib.Path] = None) -> Dict:
+    """
+    Run the parser, or load its output from the cache directory if the same call was cached before
+    with unchanged input files. Without a cache directory the parser is simply run.
+    """
+    if not cache_dir:
+        return parser_func(**parser_args)
+
+    key = cache_key(parser_func, parser_args)
+    parsed_cvr = load_parsed_cvr(cache_dir, key)
+    if parsed_cvr is None:
+        parsed_cvr = save_parsed_cvr(cache_dir, key, parser_func(**parser_args))
+
+    return parsed_cvr
@@ -3,17 +3,17 @@ from typing import (Union)
 
 import csv
 import pathlib
-import json
-import math
 import os
-import re
 import collections
 import decimal
-import xmltodict
 
+import numpy as np
 import pandas as pd
 
 from rcv_cruncher.marks import BallotMarks
+from rcv_cruncher.matrix import BallotMatrix
+import rcv_cruncher.cdf as cdf
+import rcv_cruncher.dominion as dominion
 
 decimal.getcontext().prec = 30
 
@@ -39,82 +39,169 @@ def get_parser_dict():
     return parser_dict
 
 
-def rank_column(cvr_path):
+def rank_column(cvr_path, chunksize=100000):
     """Reads ballot ranking information stored in csv format.
     One ballot per row, with ranking columns appearing in order and named with the word "rank"
     (e.x. "rank1", "rank2", etc)
 
+    The file is read in chunks of rows. Rank columns are held as integer codes into the distinct rank
+    values, other columns as numpy arrays of the type pandas reads them as.
+
     :param cvr_path: The path to the CVR file. If a file called "candidate_codes.csv" exists in the
     same directory, it will be read and columns named "code" and "candidate" will be used to replace
     candidate codes with candidate names in the CVR file during readin.
     :type cvr_path: :data:`types.Path`
-    :raises RuntimeError: Error raised if not all parsed rank lists are the same length.
-    :return: A dictionary of lists containing all columns in the CVR file.
-        Rank columns are combined into per-ballot lists and stored with the key 'ranks'.
+    :param chunksize: Number of rows read at a time.
+    :type chunksize: int
+    :return: A dictionary containing all columns in the CVR file.
+        Rank columns are combined into a :class:`BallotMatrix` and stored with the key 'ranks'.
+        Other columns are numpy arrays, with missing values replaced by 'skipped'.
         A 'weight' key and list of 1's is added to the dictionary if no 'weight' column exists.
+        A 'count' column (ballots per row, for aggregated files) is multiplied into the weights and removed.
         All weights are of type :class:`decimal.Decimal`.
     :rtype: :data:`types.BallotDictOfLists`
     """
 
     cvr_path = pathlib.Path(cvr_path)
-    df = pd.read_csv(cvr_path, encoding="utf8")
 
     # find rank columns
-    rank_col = [col for col in df.columns if 'rank' in col.lower()]
-
-    # ensure rank columns are strings
-    df[rank_col] = df[rank_col].astype(str)
+    columns = pd.read_csv(cvr_path, encoding="utf8", nrows=0).columns.tolist()
+    rank_col = [col for col in columns if 'rank' in col.lower()]
+    other_col = [col for col in columns if col not in rank_col]
+
+    # rank columns are read as text and coded, other columns keep the type pandas infers for each chunk
+    rank_columns = [_RankCsvColumn() for _ in rank_col]
+    chunk_index = []
+    chunk_values = {col: [] for col in other_col}
+    for chunk in pd.read_csv(cvr_path, encoding="utf8", dtype={col: str for col in rank_col}, chunksize=chunksize):
+        chunk_index.append(np.column_stack([rank_column.add(chunk[col]) for rank_column, col in zip(rank_columns, rank_col)])
+                           if rank_col else np.empty((len(chunk), 0), dtype=np.int32))
+        for col in other_col:
+            chunk_values[col].append(chunk[col].to_numpy())
+
+    # one lookup from rank value to mark: candidate codes swapped for names (codes may have been read
+    # as integers or floats), then skipped ranks and overvotes replaced with constants
+    replace_dicts = []
 
-    # if candidate codes file exist, swap in names
     candidate_codes_fpath = cvr_path.parent / 'candidate_codes.csv'
     if os.path.isfile(candidate_codes_fpath):
-
         cand_codes = pd.read_csv(candidate_codes_fpath, encoding="utf8")
+        replace_dicts.append({str(code): cand for code, cand in zip(cand_codes['code'], cand_codes['candidate'])})
+        replace_dicts.append({str(float(code)): cand
+                              for code, cand in zip(cand_codes['code'], cand_codes['candidate'])})
+
+    replace_dicts.append({'under': BallotMarks.SKIPPED,
+                          'skipped': BallotMarks.SKIPPED,
+                          'nan': BallotMarks.SKIPPED,
+                          'undervote': BallotMarks.SKIPPED,
+                          'over': BallotMarks.OVERVOTE,
+                          'overvote': BallotMarks.OVERVOTE,
+                          'UWI': BallotMarks.WRITEIN})
+
+    def rank_mark(value):
+        for replace_dict in replace_dicts:
+            value = replace_dict.get(value, value)
+        return value
+
+    # assemble ballot matrix from the position of each rank value in the list of all rank column values
+    mark_index = np.concatenate(chunk_index) if chunk_index else np.empty((0, len(rank_col)), dtype=np.int32)
+    n_ballots = len(mark_index)
+    rank_marks = []
+    for col_idx, rank_column in enumerate(rank_columns):
+        col_index = mark_index[:, col_idx]
+        col_index[col_index < 0] = len(rank_column.tokens)
+        col_index += len(rank_marks)
+        rank_marks.extend(rank_mark(value) for value in rank_column.values())
+        rank_marks.append(BallotMarks.SKIPPED)
+
+    dct = {'ranks': BallotMatrix.from_mark_index(mark_index, rank_marks)}
 
-        cand_codes_dict = {str(code): cand for code, cand in zip(cand_codes['code'], cand_codes['candidate'])}
-        replace_dict = {col: cand_codes_dict for col in rank_col}
-        df = df.replace(replace_dict)
+    # add in non-rank columns
+    for col in other_col:
+        dct[col] = _combine_chunks(chunk_values[col]) if chunk_values[col] else np.array([], dtype=object)
 
-        cand_codes_dict = {str(float(code)): cand for code, cand in zip(cand_codes['code'], cand_codes['candidate'])}
-        replace_dict = {col: cand_codes_dict for col in rank_col}
-        df = df.replace(replace_dict)
+    # add weight if not present in csv
+    if 'weight' not in dct:
+        dct['weight'] = [decimal.Decimal('1')] * n_ballots
+    else:
+        dct['weight'] = [decimal.Decimal(str(w)) for w in dct['weight'].tolist()]
 
+    # rows of aggregated files carry a ballot count, which is kept as weight rather than repeated ballots
+    if 'count' in dct:
+        dct['weight'] = [w * decimal.Decimal(str(c)) for w, c in zip(dct['weight'], dct.pop('count').tolist())]
 
-    # replace skipped ranks and overvotes with constants
-    df = df.replace({col: {'under': BallotMarks.SKIPPED,
-                           'skipped': BallotMarks.SKIPPED,
-                           'nan': BallotMarks.SKIPPED,
-                           'undervote': BallotMarks.SKIPPED,
-                           'over': BallotMarks.OVERVOTE,
-                           'overvote': BallotMarks.OVERVOTE,
-                           'UWI': BallotMarks.WRITEIN}
-                    for col in rank_col})
+    return dct
 
-    df = df.fillna(BallotMarks.SKIPPED)
 
-    # pull out rank lists
-    rank_col_list = [df[col].tolist() for col in rank_col]
-    rank_lists = [list(rank_tuple) for rank_tuple in list(zip(*rank_col_list))]
+class _RankCsvColumn:
+    """
+    A rank column read as text, held as integer codes into the distinct values of the whole column.
+    """
 
-    # double check all ballot ranks are equal length
-    if not all([len(i) == len(rank_lists[0]) for i in rank_lists]):
-        raise RuntimeError("not all rank lists are same length. debug")
+    def __init__(self):
+        self.tokens = []
+        self.has_missing = False
+        self._lookup = {}
+
+    def add(self, values):
+        """
+        Code each value of a chunk, -1 for missing values.
+        """
+        codes, uniques = pd.factorize(values)
+        recode = np.empty(len(uniques) + 1, dtype=np.int32)
+        for idx, token in enumerate(uniques.tolist()):
+            code = self._lookup.get(token)
+            if code is None:
+                code = self._lookup[token] = len(self.tokens)
+                self.tokens.append(token)
+            recode[idx] = code
+        recode[-1] = -1
+        self.has_missing = self.has_missing or bool(np.any(codes < 0))
+        return recode[codes]
+
+    def values(self):
+        """
+        The distinct values as text, written the way the column reads when pandas infers its type from the whole
+        file: an all numeric column reads as numbers, and as floats if some ranks are missing.
+        """
+        try:
+            values = pd.to_numeric(pd.Series(self.tokens, dtype=object))
+        except (ValueError, TypeError):
+            return self.tokens
+        if self.has_missing:
+            values = values.astype(float)
+        return values.astype(str).tolist()
+
+
+def _combine_chunks(chunk_values):
+    """
+    Join the per chunk arrays of a column. Numbers in a column that also holds text in another chunk become
+    text, as they would be if the whole file were read at once. Missing values are 'skipped'.
+    """
+    if len(set(values.dtype == object for values in chunk_values)) > 1:
+        chunk_values = [values if values.dtype == object else _as_text(values) for values in chunk_values]
+    values = np.concatenate(chunk_values)
+    missing = pd.isna(values)
+    if missing.any():
+        values = values.astype(object)
+        values[missing] = BallotMarks.SKIPPED
+    return values
 
-    # assemble dict
-    dct = {'ranks': rank_lists}
 
-    # add in non-rank columns
-    for col in df.columns:
-        if col not in rank_col:
-            dct[col] = df[col].tolist()
+def _as_text(values):
+    text = values.astype(object)
+    present = ~pd.isna(values)
+    text[present] = values[present].astype(str)
+    return text
 
-    # add weight if not present in csv
-    if 'weight' not in dct:
-        dct['weight'] = [decimal.Decimal('1') for b in dct['ranks']]
-    else:
-        dct['weight'] = [decimal.Decimal(str(w)) for w in dct['weight']]
 
-    return dct
+def _single_contest(contest_ballot_dicts, office):
+    """
+    Pull one office out of the results of a multi-contest parser.
+    """
+    if office not in contest_ballot_dicts:
+        raise RuntimeError(f'office "{office}" not found in ContestManifest.json')
+    return contest_ballot_dicts[office]
 
 
 def dominion5_4(cvr_path, office):
@@ -130,328 +217,42 @@ def dominion5_4(cvr_path, office):
     :return:
     :rtype: :data:`types.BallotDictOfLists`
     """
+    return _single_contest(dominion5_4_contests(cvr_path, [office]), office)
 
-    path = pathlib.Path(cvr_path)
 
-    # load manifests, with ids as keys
-    with open(path / 'ContestManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            if i['Description'].strip() == office:
-                current_contest_id = i['Id']
-                current_contest_rank_limit = i['NumOfRanks']
-
-    candidate_manifest = {}
-    with open(path / 'CandidateManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            candidate_manifest[i['Id']] = i['Description']
-
-    precinctPortion_manifest = {}
-    with open(path / 'PrecinctPortionManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            precinctPortion_manifest[i['Id']] = {'Portion': i['Description'], 'PrecinctId': i['PrecinctId']}
-
-    precinct_manifest = {}
-    if os.path.isfile(path / 'PrecinctManifest.json'):
-        with open(path / 'PrecinctManifest.json', encoding="utf8") as f:
-            for i in json.load(f)['List']:
-                precinct_manifest[i['Id']] = i['Description']
-
-    ballotType_manifest = {}
-    with open(path / 'BallotTypeManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            ballotType_manifest[i['Id']] = i['Description']
-
-    countingGroup_manifest = {}
-    with open(path / 'CountingGroupManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            countingGroup_manifest[i['Id']] = i['Description']
-
-    ballotTypeContest_manifest = {}
-    with open(path / 'BallotTypeContestManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-
-            if i['ContestId'] not in ballotTypeContest_manifest.keys():
-                ballotTypeContest_manifest[i['ContestId']] = []
-
-            ballotTypeContest_manifest[i['ContestId']].append(i['BallotTypeId'])
-
-    # read in ballots
-    ballot_ranks = []
-    ballot_IDs = []
-    ballot_precinctPortions = []
-    ballot_precincts = []
-    ballot_types = []
-    ballot_countingGroups = []
-    with open(path / 'CvrExport.json', encoding="utf8") as f:
-        for contests in json.load(f)['Sessions']:
-
-            # ballotID
-            ballotID_search = re.search('Images\\\\(.*)\*\.\*', contests['ImageMask'])
-            if ballotID_search:
-                ballotID = ballotID_search.group(1)
-            else:
-                raise RuntimeError('regex is not working correctly. debug')
-
-            countingGroup = countingGroup_manifest[contests['CountingGroupId']]
-
-            # for each session use original, or if isCurrent is False,
-            # use modified
-            if contests['Original']['IsCurrent']:
-                current_contests = contests['Original']
-            else:
-                current_contests = contests['Modified']
-
-            # precinctId for this ballot
-            precinctPortion = precinctPortion_manifest[current_contests['PrecinctPortionId']]['Portion']
-            precinctId = precinctPortion_manifest[current_contests['PrecinctPortionId']]['PrecinctId']
-
-            precinct = None
-            if precinct_manifest:
-                precinct = precinct_manifest[precinctId]
-
-            # ballotType for this ballot
-            ballotType = ballotType_manifest[current_contests['BallotTypeId']]
-
-            if len(current_contests['Cards']) > 1:
-                print('"Cards" has length greater than 1, not prepared for this. debug')
-                exit(1)
-
-            ballot_contest_marks = None
-            for ballot_contest in current_contests['Cards'][0]['Contests']:
-                if ballot_contest['Id'] == current_contest_id:
-                    ballot_contest_marks = ballot_contest['Marks']
-
-            # skip ballot if didn't contain contest
-            if ballot_contest_marks is None:
-                continue
-
-            # check for marks on each rank expected for this contest
-            currentRank = 1
-            current_ballot_ranks = []
-            while currentRank <= current_contest_rank_limit:
-
-                # find any marks that have the currentRank and aren't Ambiguous
-                currentRank_marks = [i for i in ballot_contest_marks
-                                     if i['Rank'] == currentRank and i['IsAmbiguous'] is False]
-
-                if len(currentRank_marks) == 0:
-                    currentCandidate = BallotMarks.SKIPPED
-                elif len(currentRank_marks) > 1:
-                    currentCandidate = BallotMarks.OVERVOTE
-                else:
-                    currentCandidate = candidate_manifest[currentRank_marks[0]['CandidateId']]
-
-                current_ballot_ranks.append(currentCandidate)
-                currentRank += 1
-
-            ballot_ranks.append(current_ballot_ranks)
-            ballot_precinctPortions.append(precinctPortion)
-            ballot_precincts.append(precinct)
-            ballot_IDs.append(ballotID)
-            ballot_types.append(ballotType)
-            ballot_countingGroups.append(countingGroup)
-
-    ballot_dict = {'ranks': ballot_ranks,
-                   'weight': [decimal.Decimal('1')] * len(ballot_ranks),
-                   'ballotID': ballot_IDs,
-                   'precinctPortion': ballot_precinctPortions,
-                   'ballot_type': ballot_types,
-                   'countingGroup': ballot_countingGroups}
-
-    # make sure precinctManifest was part of CVR, otherwise exclude precinct column
-    if len(ballot_precincts) != sum(i is None for i in ballot_precincts):
-        ballot_dict['precinct'] = ballot_precincts
-
-    # check ballotIDs are unique
-    if len(set(ballot_dict['ballotID'])) != len(ballot_dict['ballotID']):
-        raise RuntimeError("some non-unique ballot IDs")
+def dominion5_4_contests(cvr_path, offices):
+    """Reads ballot data from Dominion V5.4 CVRs for several contests with a single pass over CvrExport.json.
 
-    return ballot_dict
+    :param cvr_path: Directory containing the CVR export and manifest files, or a zip archive holding them.
+    :type cvr_path: :data:`types.Path`
+    :param offices: Contest names to read. Each should match a contest name in ContestManifest.json.
+    :type offices: List[str]
+    :raises RuntimeError: If ballotIDs pulled from ImageMask field are not unique.
+        Or if regex used to pull ballotID from ImageMask field malfunctions.
+    :return: A dictionary with one ballot dictionary per office found in ContestManifest.json.
+    :rtype: Dict[str, :data:`types.BallotDictOfLists`]
+    """
+    return dominion.read_contests(cvr_path, offices, dominion.Dominion5_4())
 
 
-def dominion5_10(cvr_path, office):
+def dominion5_10(cvr_path, office, n_workers=1):
+    return _single_contest(dominion5_10_contests(cvr_path, [office], n_workers=n_workers), office)
 
-    path = pathlib.Path(cvr_path)
 
-    # load manifests, with ids as keys
-    with open(path / 'ContestManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            if i['Description'].strip() == office:
-                current_contest_id = i['Id']
-                current_contest_rank_limit = i['NumOfRanks']
-
-    candidate_manifest = {}
-    with open(path / 'CandidateManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            candidate_manifest[i['Id']] = i['Description']
-
-    precinctPortion_manifest = {}
-    with open(path / 'PrecinctPortionManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            precinctPortion_manifest[i['Id']] = {'Portion': i['Description'], 'PrecinctId': i['PrecinctId']}
-
-    precinct_manifest = {}
-    if os.path.isfile(path / 'PrecinctManifest.json'):
-        with open(path / 'PrecinctManifest.json', encoding="utf8") as f:
-            for i in json.load(f)['List']:
-                precinct_manifest[i['Id']] = i['Description']
-
-    district_manifest = {}
-    with open(path / 'DistrictManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            district_manifest[i['Id']] = {'District': i['Description'], 'DistrictTypeId': i['DistrictTypeId']}
-
-    districtType_manifest = {}
-    with open(path / 'DistrictTypeManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            districtType_manifest[i['Id']] = i['Description']
-
-    districtPrecinctPortion_manifest = {}
-    with open(path / 'DistrictPrecinctPortionManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            districtPrecinctPortion_manifest[i['PrecinctPortionId']] = i['DistrictId']
-
-    ballotType_manifest = {}
-    with open(path / 'BallotTypeManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            ballotType_manifest[i['Id']] = i['Description']
-
-    countingGroup_manifest = {}
-    with open(path / 'CountingGroupManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            countingGroup_manifest[i['Id']] = i['Description']
-
-    ballotTypeContest_manifest = {}
-    with open(path / 'BallotTypeContestManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-
-            if i['ContestId'] not in ballotTypeContest_manifest.keys():
-                ballotTypeContest_manifest[i['ContestId']] = []
-
-            ballotTypeContest_manifest[i['ContestId']].append(i['BallotTypeId'])
-
-    tabulator_manifest = {}
-    with open(path / 'TabulatorManifest.json', encoding="utf8") as f:
-        for i in json.load(f)['List']:
-            tabulator_manifest[i['Id']] = i['VotingLocationName']
-
-    # read in ballots
-    ballot_ranks = []
-    ballot_IDs = []
-    ballot_precinctPortions = []
-    ballot_precincts = []
-    ballot_types = []
-    ballot_countingGroups = []
-    ballot_votingLocation = []
-    ballot_district = []
-    ballot_districtType = []
-
-    for cvr_export in path.glob("CvrExport*.json"):
-        with open(cvr_export, encoding="utf8") as f:
-            for contests in json.load(f)['Sessions']:
-
-                # ballotID
-                ballotID_search = re.search('Images\\\\(.*)\*\.\*', contests['ImageMask'])
-                if ballotID_search:
-                    ballotID = ballotID_search.group(1)
-                else:
-                    raise RuntimeError('regex is not working correctly. debug')
-
-                countingGroup = countingGroup_manifest[contests['CountingGroupId']]
-
-                # voting location for ballots
-                ballotVotingLocation = tabulator_manifest[contests['TabulatorId']]
-
-                # for each session use original, or if isCurrent is False,
-                # use modified
-                if contests['Original']['IsCurrent']:
-                    current_contests = contests['Original']
-                else:
-                    current_contests = contests['Modified']
-
-                # precinctId for this ballot
-                precinctPortion = precinctPortion_manifest[current_contests['PrecinctPortionId']]['Portion']
-                precinctId = precinctPortion_manifest[current_contests['PrecinctPortionId']]['PrecinctId']
-
-                precinct = None
-                if precinct_manifest:
-                    precinct = precinct_manifest[precinctId]
-
-                # ballotType for this ballot
-                ballotType = ballotType_manifest[current_contests['BallotTypeId']]
-
-                # district for ballot
-                ballotDistrictId = districtPrecinctPortion_manifest[current_contests['PrecinctPortionId']]
-                ballotDistrict = district_manifest[ballotDistrictId]['District']
-                ballotDistrictType = districtType_manifest[district_manifest[ballotDistrictId]['DistrictTypeId']]
-
-                ballot_contest_marks = None
-                for cards in current_contests['Cards']:
-                    for ballot_contest in cards['Contests']:
-                        if ballot_contest['Id'] == current_contest_id:
-                            if ballot_contest_marks is not None:
-                                raise (RuntimeError(
-                                    "Contest Id appears twice across a single set of cards. Not expected."))
-                            ballot_contest_marks = ballot_contest['Marks']
-
-                # skip ballot if didn't contain contest
-                if ballot_contest_marks is None:
-                    continue
-
-                # check for marks on each rank expected for this contest
-                currentRank = 1
-                current_ballot_ranks = []
-                while currentRank <= current_contest_rank_limit:
-
-                    # find any marks that have the currentRank and aren't Ambiguous
-                    currentRank_marks = [i for i in ballot_contest_marks
-                                         if i['Rank'] == currentRank and i['IsAmbiguous'] is False]
-
-                    currentCandidate = '**error**'
-
-                    if len(currentRank_marks) == 0:
-                        currentCandidate = BallotMarks.SKIPPED
-                    elif len(currentRank_marks) > 1:
-                        currentCandidate = BallotMarks.OVERVOTE
-                    else:
-                        currentCandidate = candidate_manifest[currentRank_marks[0]['CandidateId']]
-
-                    if currentCandidate == '**error**':
-                        raise RuntimeError('error in filtering marks. debug')
-
-                    current_ballot_ranks.append(currentCandidate)
-                    currentRank += 1
-
-                ballot_ranks.append(current_ballot_ranks)
-                ballot_precinctPortions.append(precinctPortion)
-                ballot_precincts.append(precinct)
-                ballot_IDs.append(ballotID)
-                ballot_types.append(ballotType)
-                ballot_countingGroups.append(countingGroup)
-                ballot_votingLocation.append(ballotVotingLocation)
-                ballot_district.append(ballotDistrict)
-                ballot_districtType.append(ballotDistrictType)
-
-    ballot_dict = {'ranks': ballot_ranks,
-                   'weight': [decimal.Decimal('1')] * len(ballot_ranks),
-                   'ballotID': ballot_IDs,
-                   'precinct': ballot_precincts,
-                   'precinctPortion': ballot_precinctPortions,
-                   'ballot_type': ballot_types,
-                   'countingGroup': ballot_countingGroups,
-                   'votingLocation': ballot_votingLocation,
-                   'district': ballot_district,
-                   'districtType': ballot_districtType}
-
-    # make sure precinctManifest was part of CVR, otherwise exclude precinct column
-    if len(ballot_precincts) != sum(i is None for i in ballot_precincts):
-        ballot_dict['precinct'] = ballot_precincts
-
-    # check ballotIDs are unique
-    if len(set(ballot_dict['ballotID'])) != len(ballot_dict['ballotID']):
-        raise RuntimeError("some non-unique ballot IDs")
+def dominion5_10_contests(cvr_path, offices, n_workers=1):
+    """Reads ballot data from Dominion V5.10 CVRs for several contests with a single pass over the
+    CvrExport*.json files.
 
-    return ballot_dict
+    :param cvr_path: Directory containing the CVR export and manifest files, or a zip archive holding them.
+    :type cvr_path: :data:`types.Path`
+    :param offices: Contest names to read. Each should match a contest name in ContestManifest.json.
+    :type offices: List[str]
+    :param n_workers: Number of processes used to decode CvrExport shards in parallel. Defaults to 1 (no workers).
+    :type n_workers: int
+    :return: A dictionary with one ballot dictionary per office found in ContestManifest.json.
+    :rtype: Dict[str, :data:`types.BallotDictOfLists`]
+    """
+    return dominion.read_contests(cvr_path, offices, dominion.Dominion5_10(), n_workers=n_workers)
 
 
 def choice_pro_plus(cvr_path):
@@ -603,99 +404,204 @@ def optech1(cvr_path, office):
                 for k, v in master_lookup['Candidate'].items()}
 
     # READ BALLOT FILE
-    voter_info_collected = collections.defaultdict(list)
-    max_rank_num = 0
-    with open(ballot_image_path, "r", encoding='utf8') as f:
+    columns = _optech1_fixed_width_columns(ballot_image_path, contest_id)
+    if columns is None:
+        columns = _optech1_text_columns(ballot_image_path, contest_id)
+
+    return _optech1_ballots(columns, tally_type_map, precinct_map, name_map)
+
+
+# ballot image record layout, (start, stop) character positions of each field
+_OPTECH1_FIELDS = {
+    'contest': (0, 7),
+    'voter': (7, 16),
+    'tally_type': (23, 26),
+    'precinct': (26, 33),
+    'rank': (33, 36),
+    'candidate': (36, 43),
+    'skipped': (43, 44),
+    'overvote': (44, 45)
+}
 
-        for line in f:
 
-            line_contest_id = line[:7].strip()
-            line_voter_id = line[7:16].strip()
-            line_tally_type = line[23:26].strip()
-            line_precinct_id = line[26:33].strip()
-            line_candidate_id = line[36:43].strip()
-            line_rank = line[33:36].strip()
-            line_skipped = line[43].strip()
-            line_overvote = line[44].strip()
-
-            # skip line if not for contest
-            if line_contest_id != contest_id:
-                continue
-
-            max_rank_num = int(line_rank) if int(line_rank) > max_rank_num else max_rank_num
-
-            voter_info_collected[line_voter_id].append({
-                'voter_id': line_voter_id,
-                'tally_type': tally_type_map[line_tally_type],
-                'precinct': precinct_map[line_precinct_id],
-                # 0 candidate id plus a skipped or overvote mark, indicate skip or overvote
-                'candidate': name_map[line_candidate_id] if int(line_candidate_id) else 0,
-                'rank': int(line_rank),
-                'skipped': int(line_skipped),
-                'overvote': int(line_overvote)
-                })
-
-            # debug check to see if ballot marks with valid candidate name stored sometimes also get paired,
-            # with overvote or skipped marks?
-            if int(line_candidate_id) and (int(line_skipped) or int(line_overvote)):
-                raise RuntimeError('both a skip and overvote mark for this rank. unexpected')
-
-    # for each voter, assemble the ballot
-    dct = {
-        'ranks': [],
-        'precinct': [],
-        'tally_type': [],
-        'ballotID': []
-    }
-    for voter_id in voter_info_collected:
+def _optech1_fixed_width_columns(ballot_image_path, contest_id, chunk_records=1 << 20):
+    """
+    Read the fields of the ballot image lines for one contest as fixed width byte string arrays, decoding the
+    file a chunk of records at a time through a numpy structured dtype. Returns None if the file is not made
+    of equal length ascii lines, in which case it has to be read line by line.
+    """
+    with open(ballot_image_path, 'rb') as f:
+        first_line = f.readline()
 
-        voter_ballot_info = voter_info_collected[voter_id]
+    record_len = len(first_line)
+    if not first_line.endswith(b'\n') or record_len <= _OPTECH1_FIELDS['overvote'][1]:
+        return None
 
-        # debug checks
-        voter_tally_type_set = set([b['tally_type'] for b in voter_ballot_info])
-        voter_precinct_set = set([b['precinct'] for b in voter_ballot_info])
+    newline = b'\r\n' if first_line.endswith(b'\r\n') else b'\n'
 
-        if len(voter_tally_type_set) > 1:
-            raise RuntimeError("Marks for this voter contain multiple tally type values. Unexpected.")
+    record_dtype = np.dtype({
+        'names': list(_OPTECH1_FIELDS),
+        'formats': [f'S{stop - start}' for start, stop in _OPTECH1_FIELDS.values()],
+        'offsets': [start for start, stop in _OPTECH1_FIELDS.values()],
+        'itemsize': record_len
+    })
 
-        if len(voter_precinct_set) > 1:
-            raise RuntimeError("Marks for this voter contain multiple precinct values. Unexpected.")
+    contest_records = []
+    with open(ballot_image_path, 'rb') as f:
+        while True:
 
-        voter_tally_type = list(voter_tally_type_set)[0]
-        voter_precinct = list(voter_precinct_set)[0]
+            data = f.read(record_len * chunk_records)
+            if not data:
+                break
+
+            # last line without a line break
+            if not data.endswith(b'\n'):
+                data += newline
+
+            n_records = len(data) // record_len
+            if len(data) % record_len or not data.isascii() or data.count(b'\n') != n_records \
+                    or data.count(newline) != n_records or data[record_len - 1::record_len].count(b'\n') != n_records:
+                return None
+
+            records = np.frombuffer(data, dtype=record_dtype)
 
-        voter_ranks = [None] * max_rank_num
-        for rank in range(1, max_rank_num + 1):
+            # contest ids are compared with surrounding spaces removed, as in the master lookup
+            contest_values = [value for value in np.unique(records['contest'])
+                              if value.decode().strip() == contest_id]
+            contest_records.append(records[np.isin(records['contest'], contest_values)])
 
-            rank_info_filter = [b for b in voter_ballot_info if b['rank'] == rank]
+    if not contest_records:
+        return {field: np.array([], dtype='S1') for field in _OPTECH1_FIELDS}
 
-            if len(rank_info_filter) > 1:
-                raise RuntimeError('unexpected')
-                # an overvote marker is stored in the file, but do overvoted ranks still get all their marks stored ?
-            elif len(rank_info_filter) == 0:
-                raise RuntimeError('unexpected')
-                # this would be unexpected since there is a skipped rank mark in the file
-            else:
-                rank_info = rank_info_filter[0]
+    contest_records = np.concatenate(contest_records)
+    return {field: contest_records[field] for field in _OPTECH1_FIELDS}
 
-            rank_candidate = rank_info['candidate']
 
-            if rank_candidate == 0 and rank_info['skipped'] and rank_info['overvote']:
-                raise RuntimeError('this shouldnt be reached')
-            elif rank_candidate == 0 and rank_info['skipped']:
-                voter_ranks[rank-1] = BallotMarks.SKIPPED
-            elif rank_candidate == 0 and rank_info['overvote']:
-                voter_ranks[rank-1] = BallotMarks.OVERVOTE
-            else:
-                voter_ranks[rank-1] = rank_candidate
+def _optech1_text_columns(ballot_image_path, contest_id):
+    """
+    Read the fields of the ballot image lines for one contest as string arrays, line by line.
+    """
+    with open(ballot_image_path, "r", encoding='utf8') as f:
+        lines = [line for line in f if line[:7].strip() == contest_id]
 
-        if any(r is None for r in voter_ranks):
-            raise RuntimeError('not all ranks for this voter had data stored in the file. unexpected.')
+    return {field: np.array([line[start:stop] for line in lines], dtype=str)
+            for field, (start, stop) in _OPTECH1_FIELDS.items()}
 
-        dct['ranks'].append(voter_ranks)
-        dct['ballotID'].append(voter_id)
-        dct['tally_type'].append(voter_tally_type)
-        dct['precinct'].append(voter_precinct)
+
+def _optech1_factorize(column):
+    """
+    Integer code for each value in a fixed width column, the list of distinct values with surrounding
+    spaces removed and the index of the first entry holding each. Values are numbered in order of first appearance.
+    """
+    if len(column) == 0:
+        return np.array([], dtype=np.int64), [], np.array([], dtype=np.int64)
+
+    raw_values, raw_first, raw_codes = np.unique(column, return_index=True, return_inverse=True)
+
+    stripped = np.char.strip(raw_values)
+    if stripped.dtype.kind == 'S':
+        stripped = np.char.decode(stripped, 'ascii')
+
+    # raw values that only differ by padding are the same value
+    if np.array_equal(np.char.str_len(stripped), np.char.str_len(raw_values)):
+        values, stripped_codes, first = stripped, np.arange(len(stripped)), raw_first
+    else:
+        values, stripped_codes = np.unique(stripped, return_inverse=True)
+        first = np.full(len(values), len(column), dtype=np.int64)
+        np.minimum.at(first, stripped_codes, raw_first)
+
+    order = np.argsort(first, kind='stable')
+    recode = np.empty(len(values), dtype=np.int64)
+    recode[order] = np.arange(len(values))
+
+    return recode[stripped_codes][raw_codes], values[order].tolist(), first[order]
+
+
+def _optech1_ints(column):
+    """
+    Integer value of each entry of a fixed width column.
+    """
+    codes, values, _ = _optech1_factorize(column)
+    return np.array([int(value) for value in values], dtype=np.int64)[codes]
+
+
+def _optech1_lookup(column, lookup):
+    """
+    Lookup the value of each entry of a fixed width column. Returns an integer code per entry and the
+    looked up values.
+    """
+    codes, values, _ = _optech1_factorize(column)
+    looked_up = []
+    looked_up_codes = {}
+    recode = np.empty(len(values), dtype=np.int64)
+    for idx, value in enumerate(values):
+        value = lookup[value]
+        if value not in looked_up_codes:
+            looked_up_codes[value] = len(looked_up)
+            looked_up.append(value)
+        recode[idx] = looked_up_codes[value]
+    return recode[codes], looked_up
+
+
+def _optech1_ballots(columns, tally_type_map, precinct_map, name_map):
+    """
+    Assemble one ballot per voter from the ballot image fields of a contest, scattering each line into a
+    voters x ranks matrix.
+    """
+    voter, voter_ids, voter_first_line = _optech1_factorize(columns['voter'])
+    tally_type, tally_types = _optech1_lookup(columns['tally_type'], tally_type_map)
+    precinct, precincts = _optech1_lookup(columns['precinct'], precinct_map)
+    rank = _optech1_ints(columns['rank'])
+    skipped = _optech1_ints(columns['skipped'])
+    overvote = _optech1_ints(columns['overvote'])
+
+    # 0 candidate id plus a skipped or overvote mark, indicate skip or overvote
+    candidate_codes, candidate_ids, _ = _optech1_factorize(columns['candidate'])
+    candidate_ints = [int(candidate_id) for candidate_id in candidate_ids]
+    candidate_names = [name_map[candidate_id] if candidate_int else 0
+                       for candidate_id, candidate_int in zip(candidate_ids, candidate_ints)]
+    candidate_is_zero = np.array([candidate_int == 0 for candidate_int in candidate_ints], dtype=bool)[candidate_codes]
+
+    # debug check to see if ballot marks with valid candidate name stored sometimes also get paired,
+    # with overvote or skipped marks?
+    if np.any(~candidate_is_zero & ((skipped != 0) | (overvote != 0))):
+        raise RuntimeError('both a skip and overvote mark for this rank. unexpected')
+
+    n_voters = len(voter_ids)
+    max_rank_num = max(int(rank.max()) if len(rank) else 0, 0)
+
+    # debug checks, a voter's lines should agree on tally type and precinct
+    if np.any(tally_type != tally_type[voter_first_line][voter]):
+        raise RuntimeError("Marks for this voter contain multiple tally type values. Unexpected.")
+
+    if np.any(precinct != precinct[voter_first_line][voter]):
+        raise RuntimeError("Marks for this voter contain multiple precinct values. Unexpected.")
+
+    # each rank of each voter should have exactly one line
+    in_ranks = rank >= 1
+    cell = voter[in_ranks] * max_rank_num + rank[in_ranks] - 1
+    cell_lines = np.bincount(cell, minlength=n_voters * max_rank_num)
+    if np.any(cell_lines != 1):
+        raise RuntimeError('unexpected')
+
+    if np.any(candidate_is_zero[in_ranks] & (skipped[in_ranks] != 0) & (overvote[in_ranks] != 0)):
+        raise RuntimeError('this shouldnt be reached')
+
+    # mark values are the skipped and overvote constants followed by the candidate names
+    mark_values = [BallotMarks.SKIPPED, BallotMarks.OVERVOTE] + candidate_names
+    mark = np.where(candidate_is_zero & (skipped != 0), 0,
+                    np.where(candidate_is_zero & (overvote != 0), 1, candidate_codes + 2))
+
+    ballot_marks = np.empty(n_voters * max_rank_num, dtype=np.int64)
+    ballot_marks[cell] = mark[in_ranks]
+
+    dct = {
+        'ranks': [[mark_values[m] for m in voter_marks]
+                  for voter_marks in ballot_marks.reshape(n_voters, max_rank_num).tolist()],
+        'precinct': [precincts[code] for code in precinct[voter_first_line].tolist()],
+        'tally_type': [tally_types[code] for code in tally_type[voter_first_line].tolist()],
+        'ballotID': voter_ids
+    }
 
     # add weights
     dct.update({'weight': [decimal.Decimal('1')] * len(dct['ranks'])})
@@ -758,22 +664,21 @@ def minneapolis2009(cvr_path, office):
     choice_map['XXX'] = BallotMarks.SKIPPED
     default = BallotMarks.WRITEIN
 
-    # read ballots
-    precincts = []
-    ballots = []
+    # read ballots, rows carry a ballot count and are kept as one weighted record per precinct and ranking
+    record_weights = {}
     with open(cvr_path, "r", encoding='utf8') as f:
         f.readline()
         for line in csv.reader(f):
-            choices = [choice_map.get(i.strip(), i if default is None else default)
-                       for i in line[1:-1]]
-            if choices != ['', '', '']:
-                ballots.extend([choices] * int(float(line[-1])))
-                for p in range(int(float(line[-1]))):
-                    precincts.append(line[0])
+            choices = tuple(choice_map.get(i.strip(), i if default is None else default)
+                            for i in line[1:-1])
+            count = int(float(line[-1]))
+            if choices != ('', '', '') and count > 0:
+                record = (line[0], choices)
+                record_weights[record] = record_weights.get(record, 0) + count
 
-    bs = {'ranks': ballots,
-          'weight': [decimal.Decimal('1')] * len(ballots),
-          'precinct': precincts}
+    bs = {'ranks': [list(choices) for _, choices in record_weights],
+          'weight': [decimal.Decimal(count) for count in record_weights.values()],
+          'precinct': [precinct for precinct, _ in record_weights]}
 
     return bs
 
@@ -859,161 +764,63 @@ def santafe_id(column_id, contest_id, ctx):
 
 
 def dominion5_2(cvr_path, office):
+    return _single_contest(dominion5_2_contests(cvr_path, [office]), office)
 
-    path = pathlib.Path(cvr_path)
 
-    with open(path / 'ContestManifest.json', encoding='utf8') as f:
-        for i in json.load(f)['List']:
-            if i['Description'].strip() == office.upper():
-                contest_id = i['Id']
-                ranks = i['NumOfRanks']
-                if ranks == 0:
-                    ranks = 1
-
-    candidates = {}
-    with open(path / 'CandidateManifest.json', encoding='utf8') as f:
-        for i in json.load(f)['List']:
-            if i['ContestId'] == contest_id:
-                candidates[i['Id']] = i['Description']
-
-    precincts = {}
-    with open(path / 'PrecinctPortionManifest.json', encoding='utf8') as f:
-        for i in json.load(f)['List']:
-            precincts[i['Id']] = i['Description'].split()[1]
-
-    ballotType_manifest = {}
-    with open(path / 'BallotTypeManifest.json', encoding='utf8') as f:
-        for i in json.load(f)['List']:
-            ballotType_manifest[i['Id']] = i['Description']
-
-    countingGroup_manifest = {}
-    with open(path / 'CountingGroupManifest.json', encoding='utf8') as f:
-        for i in json.load(f)['List']:
-            countingGroup_manifest[i['Id']] = i['Description']
-
-    ballots = {'ranks': [], 'ballotID': [], 'precinct': [], 'ballotType': [], 'countingGroup': [], 'weight': []}
-    with open(path / 'CvrExport.json', encoding='utf8') as f:
-
-        for contests in json.load(f)['Sessions']:
-
-            # ballotID
-            ballotID_search = re.search('Images\\\\(.*)\*\.\*', contests['ImageMask'])
-            if ballotID_search:
-                ballotID = ballotID_search.group(1)
-            else:
-                raise RuntimeError('regex is not working correctly. debug')
-
-            countingGroup = countingGroup_manifest[contests['CountingGroupId']]
-
-            if contests['Original']['IsCurrent']:
-                current_contests = contests['Original']
-            else:
-                current_contests = contests['Modified']
-
-            precinct = precincts[current_contests['PrecinctPortionId']]
-            ballotType = ballotType_manifest[current_contests['BallotTypeId']]
-
-            for contest in current_contests['Contests']:
-
-                # confirm correct contest
-                if contest['Id'] == contest_id:
-
-                    # make empty ballot
-                    ballot = [BallotMarks.SKIPPED] * ranks
-
-                    # look through marks
-                    for mark in contest['Marks']:
-                        candidate = candidates[mark['CandidateId']]
-                        if candidate == 'Write-in':
-                            candidate = BallotMarks.WRITEIN
-                        rank = mark['Rank']-1
-                        if mark['IsAmbiguous']:
-                            pass
-                        elif ballot[rank] == BallotMarks.OVERVOTE:
-                            pass
-                        elif ballot[rank] == BallotMarks.SKIPPED:
-                            ballot[rank] = candidate
-                        elif ballot[rank] != candidate:
-                            ballot[rank] = BallotMarks.OVERVOTE
-
-                    ballots['countingGroup'].append(countingGroup)
-                    ballots['ballotType'].append(ballotType)
-                    ballots['precinct'].append(precinct)
-                    ballots['ranks'].append(ballot)
-                    ballots['ballotID'].append(ballotID)
-
-    ballots['weight'] = [decimal.Decimal('1')] * len(ballots['ranks'])
-
-    # check ballotIDs are unique
-    if len(set(ballots['ballotID'])) != len(ballots['ballotID']):
-        print("some non-unique ballot IDs")
-        exit(1)
+def dominion5_2_contests(cvr_path, offices):
+    """Reads ballot data from Dominion V5.2 CVRs for several contests with a single pass over CvrExport.json.
 
-    return ballots
+    :param cvr_path: Directory containing the CVR export and manifest files, or a zip archive holding them.
+    :type cvr_path: :data:`types.Path`
+    :param offices: Contest names to read. Matched against upper cased contest names in ContestManifest.json.
+    :type offices: List[str]
+    :raises RuntimeError: If ballotIDs pulled from ImageMask field are not unique.
+        Or if regex used to pull ballotID from ImageMask field malfunctions.
+    :return: A dictionary with one ballot dictionary per office found in ContestManifest.json.
+    :rtype: Dict[str, :data:`types.BallotDictOfLists`]
+    """
+    return dominion.read_contests(cvr_path, offices, dominion.Dominion5_2())
 
 
-def unisyn(cvr_path):
+def unisyn(cvr_path, n_workers=1):
     """
     This parser was developed for the unisyn 2020 Hawaii Dem Primary CVR which only contained the
     ranked choice votes for a single election. Unisyn uses the common data format in xml, however the
-    parser currently is not a complete common data format parser.
+    parser currently is not a complete common data format parser. Each rank is reported as its own contest.
+
+    The xml files in cvr_path are streamed one CVR at a time and, if n_workers > 1, read in parallel
+    worker processes.
 
     For more information on common data format, see:
     https://pages.nist.gov/CastVoteRecords/
     https://github.com/hiltonroscoe/cdfprototype
     """
 
-    glob_str = pathlib.Path(cvr_path).glob('/*.xml')
-
-    contestIDdicts = {}
-    for f in glob_str:
+    xml_paths = sorted(pathlib.Path(cvr_path).glob('*.xml'))
+    if not xml_paths:
+        raise RuntimeError(f'no xml files found in {cvr_path}.')
 
-        with open(f) as fd:
-            xml_dict = xmltodict.parse(fd.read())
+    report = cdf.read_cvr_reports(xml_paths, n_workers=n_workers)
+    contests = list(report['contests'].values())
+    if not contests:
+        raise RuntimeError(f'no CVRs found in {cvr_path}.')
 
-        # get candidates
-        candidatesIDs = {}
-        for cand_dict in xml_dict['CastVoteRecordReport']['Election']['Candidate']:
-            candidatesIDs[cand_dict['@ObjectId']] = cand_dict['Name']
-
-        # loop through CVR snapshots
-        for cvr_dict in xml_dict['CastVoteRecordReport']['CVR']:
-
-            cvr_contest = cvr_dict['CVRSnapshot']['CVRContest']
+    # check that all rank lists are equal
+    if len(set(len(contest['rank']) for contest in contests)) > 1:
+        raise RuntimeError('not all rank lists are equal.')
 
-            if cvr_contest['ContestId'] not in contestIDdicts:
-                contestIDdicts.update({cvr_contest['ContestId']: []})
-            contestIDdicts[cvr_contest['ContestId']].append(cvr_contest['CVRContestSelection'])
+    # ballots x ranks arrays, each ballot ordered by its rank numbers
+    ballot_ranks = np.array([contest['rank'] for contest in contests], dtype=np.int64).T
+    ballot_selections = np.array([contest['selection'] for contest in contests], dtype=np.int64).T
+    rank_order = np.argsort(ballot_ranks, axis=1, kind='stable')
+    ballot_selections = np.take_along_axis(ballot_selections, rank_order, axis=1)
 
-    # check that all rank lists are equal
-    first_rank = list(contestIDdicts.keys())[0]
-    rank_length_equal = [len(contestIDdicts[k]) == len(contestIDdicts[first_rank]) for k in contestIDdicts]
-    if not all(rank_length_equal):
-        print("not all rank lists are equal.")
-        raise RuntimeError
-
-    # combine ranks into lists
-    ballot_lists = []
-    for idx in range(len(contestIDdicts[first_rank])):
-
-        idx_ranks = [int(contestIDdicts[rank_key][idx]['Rank']) for rank_key in contestIDdicts]
-
-        idx_candidates = []
-        for rank_key in contestIDdicts:
-            contest_dict = contestIDdicts[rank_key][idx]
-            if 'SelectionPosition' in contest_dict:
-                if isinstance(contest_dict['SelectionPosition'], list):
-                    idx_candidates.append(BallotMarks.OVERVOTE)
-                else:
-                    idx_candidates.append(candidatesIDs[contest_dict['SelectionPosition']['Position']])
-            elif contest_dict['TotalNumberVotes'] == '0':
-                idx_candidates.append(BallotMarks.SKIPPED)
-
-        ordered_ranks = sorted(zip(idx_candidates, idx_ranks), key=lambda x: x[1])
-        ballot_lists.append([t[0] for t in ordered_ranks])
+    # selection codes start at cdf.SKIPPED == -2
+    marks = [BallotMarks.SKIPPED, BallotMarks.OVERVOTE]
+    marks.extend(report['candidates'][position] for position in report['positions'])
 
     # assemble dict
-    dct = {'ranks': ballot_lists}
+    dct = {'ranks': BallotMatrix.from_mark_index(ballot_selections - cdf.SKIPPED, marks)}
     dct['weight'] = [decimal.Decimal('1')] * len(dct['ranks'])
 
     return dct
@@ -1038,42 +845,47 @@ def surveyUSA(cvr_path):
     candidate_codes_df = pd.read_csv(path / 'candidate_codes.csv')
 
     # candidate code dict
-    candidate_map = {row['code']: row['candidate'] for index, row in candidate_codes_df.iterrows()}
+    candidate_map = dict(zip(candidate_codes_df['code'].tolist(), candidate_codes_df['candidate'].tolist()))
 
     # find rank columns
     rank_columns = [col for col in csv_df.columns if 'rank' in col.lower()]
-
-    ballots = []
-    for index, row in csv_df.iterrows():
-
-        b_ranks = [BallotMarks.SKIPPED] * len(rank_columns)
-
-        saw_undecided = False
-        since_undecided = []
-
-        for idx, rank in enumerate(rank_columns):
-
-            # nan marks end of ranks
-            if math.isnan(row[rank]):
-                if since_undecided:
-                    print('some candidates appeared after an undecided vote! debug')
-                    raise RuntimeError
-                break
-
-            candidate = candidate_map[row[rank]]
-
-            if saw_undecided:
-                since_undecided.append(candidate)
-
-            if candidate == 'Undecided':
-                saw_undecided = True
-
-            if candidate != 'Undecided':
-                b_ranks[idx] = candidate
-
-        ballots.append(b_ranks)
-
-    ballot_dict = {'ranks': ballots, 'weight': csv_df['weight'], 'ballotID': csv_df['ballotID']}
+    rank_codes = csv_df[rank_columns].to_numpy(dtype=float)
+    n_ballots, n_ranks = rank_codes.shape
+
+    # nan marks end of ranks
+    rank_nan = np.isnan(rank_codes)
+    has_nan = rank_nan.any(axis=1)
+    first_nan = np.where(has_nan, rank_nan.argmax(axis=1), n_ranks)
+    in_ranks = np.arange(n_ranks) < first_nan[:, None]
+
+    # look up each distinct code once, marks are indexed from 1 with 0 left for skipped ranks
+    unique_codes = np.unique(rank_codes[in_ranks])
+    known = np.array([True] + [code in candidate_map for code in unique_codes.tolist()])
+    candidates = [candidate_map.get(code) for code in unique_codes.tolist()]
+    undecided = np.array([False] + [candidate == 'Undecided' for candidate in candidates])
+
+    mark_index = np.zeros((n_ballots, n_ranks), dtype=np.int64)
+    mark_index[in_ranks] = np.searchsorted(unique_codes, rank_codes[in_ranks]) + 1
+
+    # undecided ranks are left skipped, but no candidate may follow them before the end of ranks
+    rank_undecided = undecided[mark_index]
+    has_undecided = rank_undecided.any(axis=1)
+    first_undecided = np.where(has_undecided, rank_undecided.argmax(axis=1), n_ranks)
+
+    # report the first ballot with an unknown code or a candidate after undecided
+    unknown_rows = ~known[mark_index].all(axis=1)
+    undecided_rows = has_nan & has_undecided & (first_undecided < first_nan - 1)
+    bad_rows = np.flatnonzero(unknown_rows | undecided_rows)
+    if bad_rows.size:
+        row = bad_rows[0]
+        if unknown_rows[row]:
+            raise KeyError(rank_codes[row, (~known[mark_index[row]]).argmax()].item())
+        raise RuntimeError('some candidates appeared after an undecided vote!')
+    mark_index[rank_undecided] = 0
+
+    ranks = BallotMatrix.from_mark_index(mark_index, [BallotMarks.SKIPPED] + candidates)
+
+    ballot_dict = {'ranks': ranks, 'weight': csv_df['weight'], 'ballotID': csv_df['ballotID']}
     return ballot_dict
 
 
@@ -1089,21 +901,16 @@ def candidate_column(cvr_path: Union[str, pathlib.Path]):
 
     max_rank_num = int(cvr[candidate_dict.keys()].max().max())
 
-    ballots = []
-    for _, row in cvr.iterrows():
-        row_ranks = {int(row[code]): candidate_dict[code] for code, value in candidate_dict.items()
-                     if value and not pd.isna(row[code])}
-
-        ballot = []
-        for rank_num in range(1, max_rank_num + 1):
-            if rank_num in row_ranks:
-                ballot.append(row_ranks[rank_num])
-            else:
-                ballot.append(BallotMarks.SKIPPED)
+    # scatter each candidate column into the rank it marks, later columns win a rank marked more than once.
+    # marks are indexed from 1 with 0 left for skipped ranks
+    candidate_ranks = np.trunc(cvr[list(candidate_dict)].to_numpy(dtype=float))
+    mark_index = np.zeros((len(cvr), max_rank_num), dtype=np.int64)
+    for cand_idx, cand in enumerate(candidate_dict.values()):
+        cand_rank = candidate_ranks[:, cand_idx]
+        marked = np.flatnonzero((cand_rank >= 1) & (cand_rank <= max_rank_num)) if cand else []
+        mark_index[marked, cand_rank[marked].astype(np.int64) - 1] = cand_idx + 1
 
-        ballots.append(ballot)
-
-    ballot_dict = {'ranks': ballots}
+    ballot_dict = {'ranks': BallotMatrix.from_mark_index(mark_index, [BallotMarks.SKIPPED, *candidate_dict.values()])}
     for col in cvr.columns:
         if col not in candidate_dict:
             ballot_dict[col] = cvr[col]
@@ -1127,3 +934,18 @@ parser_dict = {
     # "santafe": santafe, still need to figure out this parser
     # "santafe_id": santafe_id,
 }
+
+# parsers that can read several contests from the same CVR in one pass, keyed by their single contest parser
+multi_contest_parser_dict = {
+    dominion5_2: dominion5_2_contests,
+    dominion5_4: dominion5_4_contests,
+    dominion5_10: dominion5_10_contests
+}
+
+
+def get_multi_contest_parser(parser_func):
+    """Returns the multi-contest version of a single contest parser, or None if there is not one.
+    Multi-contest parsers take an 'offices' list in place of 'office' and return a dictionary of
+    ballot dictionaries keyed by office.
+    """
+    return multi_contest_parser_dict.get(parser_func)
@@ -7,14 +7,17 @@ import decimal
 import random
 import pathlib
 
+import numpy as np
 import pandas as pd
 
 import rcv_cruncher.util as util
 
 from rcv_cruncher.cvr.base import CastVoteRecord
 from rcv_cruncher.marks import BallotMarks
+from rcv_cruncher.matrix import BallotMatrix
 from rcv_cruncher.rcv.stats import RCV_stats
 from rcv_cruncher.rcv.tables import RCV_tables
+from rcv_cruncher.rcv.trace import BallotTrace
 
 
 class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
@@ -47,7 +50,7 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
         save_path = pathlib.Path(save_dir) / 'first_choice_to_finalist'
         save_path.mkdir(exist_ok=True)
 
-        uid = rcv_obj.stats()[0]['unique_id'].item()
+        uid = rcv_obj.get_id_info()['unique_id']
         for iTab in range(1, rcv_obj.n_tabulations() + 1):
             df = rcv_obj.first_choice_to_finalist_table(tabulation_num=iTab)
             df.to_csv(save_path / f'{uid}_tab{iTab}.csv')
@@ -63,7 +66,7 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
         save_path = pathlib.Path(save_dir) / 'round_by_round_table'
         save_path.mkdir(exist_ok=True)
 
-        uid = rcv_obj.stats()[0]['unique_id'].item()
+        uid = rcv_obj.get_id_info()['unique_id']
         for iTab in range(1, rcv_obj.n_tabulations() + 1):
             df = rcv_obj.round_by_round_table(tabulation_num=iTab)
             df.to_csv(save_path / f'{uid}_tab{iTab}.csv', index=False)
@@ -124,6 +127,8 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
                  n_winners: Optional[int] = None,
                  multi_winner_rounds: Optional[bool] = None,
                  bottoms_up_threshold: Optional[float] = None,
+                 compress_ballots: bool = False,
+                 trace_level: str = 'full',
                  *args, **kwargs) -> None:
 
         # INIT CVR
@@ -152,8 +157,19 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
         self._multi_winner_rounds = multi_winner_rounds
         self._contest_candidates = self.get_candidates(self._contest_rule_set_name)
         self._contest_cvr_ld = None
+
+        # when compressing, tabulation runs over one record per distinct rank pattern
+        # and _ballot_record_index maps each ballot to its record
+        self._compress_ballots = compress_ballots
+        self._ballot_record_index = None
+        self._ballot_record_matrix = None
+        self._ballot_record_marks = None
+        self._ballot_record_weights = None
         self._reset_ballots()
 
+        # how much of the round by round ballot allocation and weight history to keep, see BallotTrace
+        self._trace_level = trace_level
+
         # INIT STATE INFO
 
         # contest-level
@@ -173,19 +189,26 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
         self._run_contest()
 
         # CONTEST STATS
-        self._contest_stat_table = None
-        self._compute_contest_stat_table()
-
-        self._summary_contest_stat_tables = None
-        self._compute_summary_contest_stat_tables()
-
-        self._summary_contest_split_stat_tables = None
+        # computed on first use, see the _contest_stat_table and _summary_contest_stat_tables properties
 
     def stats(self,
               keep_decimal_type: bool = False,
               add_split_stats: bool = False,
               add_id_info: bool = True) -> List[pd.DataFrame]:
 
+        # stats are memoized per argument combination, callers get copies they are free to modify
+        cache_key = ('contest', keep_decimal_type, add_split_stats, add_id_info)
+        if cache_key not in self._stats_cache:
+            self._stats_cache[cache_key] = self._make_stats(keep_decimal_type=keep_decimal_type,
+                                                            add_split_stats=add_split_stats,
+                                                            add_id_info=add_id_info)
+        return [df.copy() for df in self._stats_cache[cache_key]]
+
+    def _make_stats(self,
+                    keep_decimal_type: bool = False,
+                    add_split_stats: bool = False,
+                    add_id_info: bool = True) -> List[pd.DataFrame]:
+
         # start with cvr stats, 1 set per cvr
         cvr_stats = self._summary_cvr_stat_table.copy()
 
@@ -200,9 +223,6 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
 
         if add_split_stats:
 
-            self._make_split_filter_dict()
-            self._compute_summary_cvr_split_stat_table()
-            self._compute_summary_contest_split_stat_tables()
             cvr_split_stat_table = self._summary_cvr_split_stat_table
             contest_split_stat_tables = self._summary_contest_split_stat_tables
 
@@ -232,10 +252,88 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
 
         return contest_stats
 
+    def _contest_ballots(self) -> Tuple[List[BallotMarks], List[decimal.Decimal]]:
+        """
+        Return the contest ballot marks and weights that tabulation runs over (one entry per record when compressing).
+        Weights are in numeric backend units.
+        """
+        if self._compress_ballots:
+            if self._ballot_record_index is None:
+                self._compress_contest_ballots()
+            if self._ballot_record_marks is None:
+                self._ballot_record_marks = self._ballot_record_matrix.to_ballot_marks()
+            ballot_marks, weights = self._ballot_record_marks, self._ballot_record_weights
+        else:
+            contest_cvr_dl = self.get_cvr_dict(self._contest_rule_set_name)
+            ballot_marks, weights = contest_cvr_dl['ballot_marks'], contest_cvr_dl['weight']
+
+        return ballot_marks, [self._numeric.to_internal(weight) for weight in weights]
+
+    def _contest_ballot_matrix(self) -> Tuple[BallotMatrix, List[decimal.Decimal]]:
+        """
+        Return the contest ballot matrix and weights that tabulation runs over (one row per record when compressing).
+        Weights are in numeric backend units.
+        """
+        if self._compress_ballots:
+            if self._ballot_record_index is None:
+                self._compress_contest_ballots()
+            ballot_matrix, weights = self._ballot_record_matrix, self._ballot_record_weights
+        else:
+            ballot_matrix, weights = self.get_ballot_matrix(self._contest_rule_set_name), self.get_field('weight')
+
+        return ballot_matrix, [self._numeric.to_internal(weight) for weight in weights]
+
     def _reset_ballots(self) -> None:
-        contest_cvr_dl = self.get_cvr_dict(self._contest_rule_set_name)
+        ballot_marks, weights = self._contest_ballots()
         self._contest_cvr_ld = [{'ballot_marks': bm, 'weight': weight, 'weight_distrib': []}
-                                for bm, weight in zip(contest_cvr_dl['ballot_marks'], contest_cvr_dl['weight'])]
+                                for bm, weight in zip(ballot_marks, weights)]
+
+    def _compress_contest_ballots(self) -> None:
+        """
+        Collapse ballots with identical contest rank sequences (and inactive type) into one record
+        carrying their summed weight.
+        """
+        ballot_matrix = self.get_ballot_matrix(self._contest_rule_set_name)
+        ranks = ballot_matrix.ranks
+        record_keys = np.column_stack([ranks, ballot_matrix.inactive_type])
+        _, first_index, record_index = np.unique(record_keys, axis=0, return_index=True, return_inverse=True)
+        record_index = record_index.reshape(-1)
+
+        record_weights = [decimal.Decimal('0')] * len(first_index)
+        for record_idx, weight in zip(record_index.tolist(), self.get_field('weight')):
+            record_weights[record_idx] += weight
+
+        self._ballot_record_index = record_index
+        record_matrix = BallotMatrix(ranks[first_index], ballot_matrix.codes)
+        record_matrix.rules = ballot_matrix.rules
+        record_matrix.inactive_type = ballot_matrix.inactive_type[first_index]
+        self._ballot_record_matrix = record_matrix
+        self._ballot_record_weights = record_weights
+
+    def _expand_records(self, record_values: List) -> List:
+        """
+        Map per-record tabulation values back onto every ballot.
+        """
+        if self._ballot_record_index is None:
+            return record_values
+        return [record_values[record_idx] for record_idx in self._ballot_record_index.tolist()]
+
+    def _expand_record_weights(self, record_weights: List[decimal.Decimal]) -> List[decimal.Decimal]:
+        """
+        Split per-record weights back onto ballots in proportion to each ballot's share of the record's initial weight.
+        """
+        if self._ballot_record_index is None:
+            return record_weights
+
+        ballot_weights = []
+        for record_idx, weight in zip(self._ballot_record_index.tolist(), self.get_field('weight')):
+            record_weight = record_weights[record_idx]
+            record_initial_weight = self._ballot_record_weights[record_idx]
+            if record_weight == record_initial_weight:
+                ballot_weights.append(self._numeric.normalize(weight))
+            else:
+                ballot_weights.append(record_weight * weight / record_initial_weight)
+        return ballot_weights
 
     def _pre_check(self) -> None:
         """
@@ -244,7 +342,7 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
 
         # check for all blank ballots, undervote or blank before exhaust
         ballot_sets = [b['ballot_marks'].unique_marks for b in self._contest_cvr_ld]
-        if not set.union(*ballot_sets):
+        if not set().union(*ballot_sets):
             raise RuntimeError(f"(tabulation={self._tab_num}) all effectively blank ballots")
 
     def _new_tabulation(self) -> None:
@@ -263,8 +361,7 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
                 'final_weight_distrib': [],
                 'final_ranks': [],
                 'initial_ranks': [],
-                'ballot_round_allocation': [],
-                'ballot_round_weight': [],
+                'ballot_trace': BallotTrace(self._trace_level),
                 'win_threshold': None
             }
         )
@@ -284,8 +381,7 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
         self._pre_check()
 
         # store initial values
-        initial_ranks = [b['ballot_marks'].marks for b in self._contest_cvr_ld]
-        self._tabulations[self._tab_num-1]['initial_ranks'] = initial_ranks
+        self._tabulations[self._tab_num-1]['initial_ranks'] = self._current_ranks()
 
         not_complete = self._contest_not_complete()
         while not_complete:
@@ -351,17 +447,27 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
                 self._clean_ballots()
 
         # record final ballot weight distributions
-        final_weight_distrib = [b['weight_distrib'] + [(b['ballot_marks'].marks[0], b['weight'])]
-                                if b['ballot_marks'].marks else b['weight_distrib'] + [('empty', b['weight'])]
-                                for b in self._contest_cvr_ld]
-        self._tabulations[self._tab_num-1]['final_weight_distrib'] = final_weight_distrib
+        self._tabulations[self._tab_num-1]['final_weight_distrib'] = self._current_weight_distrib()
 
         # set final ranks for each ballot
-        final_ranks = [b['ballot_marks'].marks for b in self._contest_cvr_ld]
-        self._tabulations[self._tab_num-1]['final_ranks'] = final_ranks
+        self._tabulations[self._tab_num-1]['final_ranks'] = self._current_ranks()
 
         self._tabulations[self._tab_num-1]['win_threshold'] = self._win_threshold()
 
+    def _current_ranks(self) -> List[List]:
+        """
+        Return the ranks of each ballot, with removed candidates already cleaned out.
+        """
+        return [b['ballot_marks'].marks for b in self._contest_cvr_ld]
+
+    def _current_weight_distrib(self) -> List[List[Tuple[str, decimal.Decimal]]]:
+        """
+        Return each ballot's weight distribution, including its current weight allotted to its top ranked candidate.
+        """
+        return [b['weight_distrib'] + [(b['ballot_marks'].marks[0], b['weight'])]
+                if b['ballot_marks'].marks else b['weight_distrib'] + [('empty', b['weight'])]
+                for b in self._contest_cvr_ld]
+
     def _clean_ballots(self) -> None:
         """
         Remove any newly inactivated candidates from the ballot ranks.
@@ -399,8 +505,7 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
 
         round_results = list(zip(*vote_alloc.most_common()))
         self._tabulations[self._tab_num-1]['rounds'].append(round_results)
-        self._tabulations[self._tab_num-1]['ballot_round_allocation'].append(ballot_alloc)
-        self._tabulations[self._tab_num-1]['ballot_round_weight'].append(ballot_alloc_weight)
+        self._tabulations[self._tab_num-1]['ballot_trace'].add_round(ballot_alloc, ballot_alloc_weight)
 
     def _update_candidates(self) -> None:
         """
@@ -464,6 +569,7 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
         Return a dictionary containing keys as candidates and values as their vote counts in the round.
         """
         cands, tallies = self._tabulations[tabulation_num-1]['rounds'][round_num-1]
+        tallies = [self._numeric.to_external(tally) for tally in tallies]
 
         # remove elected or eliminated candidates
         if only_round_active_candidates:
@@ -509,10 +615,12 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
         Return a dictionary containing keys as candidates + 'exhaust' and values as their round net transfer
         """
         if candidate_netted:
-            transfers = self._tabulations[tabulation_num-1]['summary_transfers']
-        else:
-            transfers = self._tabulations[tabulation_num-1]['by_candidate_transfers']
-        return transfers[round_num-1]
+            transfers = self._tabulations[tabulation_num-1]['summary_transfers'][round_num-1]
+            return {cand: self._numeric.to_external(transfer) for cand, transfer in transfers.items()}
+
+        transfers = self._tabulations[tabulation_num-1]['by_candidate_transfers'][round_num-1]
+        return {from_cand: {to_cand: self._numeric.to_external(transfer) for to_cand, transfer in to_transfers.items()}
+                for from_cand, to_transfers in transfers.items()}
 
     def get_candidate_outcomes(self, tabulation_num: int = 1) -> List[Dict]:
         """
@@ -521,33 +629,49 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
         candidate_outcomes = self._tabulations[tabulation_num-1]['candidate_outcomes']
         return list(candidate_outcomes.values())
 
+    def get_round_allocation(self, round_num: int, tabulation_num: int = 1) -> List[str]:
+        """
+        Return a list of the candidates (or 'exhaust') each ballot counted towards in a round, index-matched with
+        ballots. Which rounds are available depends on trace_level.
+        """
+        round_allocation = self._tabulations[tabulation_num-1]['ballot_trace'].allocation(round_num)
+        return self._expand_records(round_allocation)
+
+    def get_round_weights(self, round_num: int, tabulation_num: int = 1) -> List[decimal.Decimal]:
+        """
+        Return a list of ballot weights counted in a round, index-matched with ballots. The first and final rounds
+        are always available, others depend on trace_level.
+        """
+        round_weights = [self._numeric.to_external(weight)
+                         for weight in self._tabulations[tabulation_num-1]['ballot_trace'].weights(round_num)]
+        return self._expand_record_weights(round_weights)
+
     def get_final_weights(self, tabulation_num: int = 1) -> List[decimal.Decimal]:
         """
         Return a list of ballot weights after tabulation, index-matched with ballots
         """
-        final_weights = self._tabulations[tabulation_num-1]['ballot_round_weight'][-1]
-        return final_weights
+        ballot_trace = self._tabulations[tabulation_num-1]['ballot_trace']
+        return self.get_round_weights(ballot_trace.n_rounds, tabulation_num=tabulation_num)
 
     def get_initial_ranks(self, tabulation_num: int = 1) -> List[List]:
         """
         Return a list of ballot ranks prior to tabulation, but after an initial cleaning. Each set of ranks is a list.
         """
         initial_ranks = self._tabulations[tabulation_num-1]['initial_ranks']
-        return initial_ranks
+        return self._expand_records(initial_ranks)
 
     def get_initial_weights(self, tabulation_num: int = 1) -> List[decimal.Decimal]:
         """
         Return a list of ballot weights prior to tabulation, but after an initial cleaning. Each set of ranks is a list.
         """
-        initial_weights = self._tabulations[tabulation_num-1]['ballot_round_weight'][0]
-        return initial_weights
+        return self.get_round_weights(1, tabulation_num=tabulation_num)
 
     def get_final_ranks(self, tabulation_num: int = 1) -> List[List]:
         """
         Return a list of ballot ranks after tabulation. Each set of ranks is a list.
         """
         final_ranks = self._tabulations[tabulation_num-1]['final_ranks']
-        return final_ranks
+        return self._expand_records(final_ranks)
 
     def get_final_weight_distrib(self, tabulation_num: int = 1) -> List[List[Tuple[str, decimal.Decimal]]]:
         """
@@ -555,8 +679,21 @@ class RCV(abc.ABC, CastVoteRecord, RCV_stats, RCV_tables):
         is a ranking-weight tuple pair. Ballots that exhausted have the string 'empty' in the ranking position of
         the tuple.
         """
-        final_weights = self._tabulations[tabulation_num-1]['final_weight_distrib']
-        return final_weights
+        final_weights = [[(cand, self._numeric.to_external(weight)) for cand, weight in weight_distrib]
+                         for weight_distrib in self._tabulations[tabulation_num-1]['final_weight_distrib']]
+
+        if self._ballot_record_index is None:
+            return final_weights
+
+        expanded_weights = []
+        for record_idx, weight in zip(self._ballot_record_index.tolist(), self.get_field('weight')):
+            record_initial_weight = self._ballot_record_weights[record_idx]
+            if weight == record_initial_weight:
+                expanded_weights.append(final_weights[record_idx])
+            else:
+                expanded_weights.append([(cand, cand_weight * weight / record_initial_weight)
+                                         for cand, cand_weight in final_weights[record_idx]])
+        return expanded_weights
 
     def get_win_threshold(self, tabulation_num: int = 1) -> Optional[Union[int, float]]:
         return self._tabulations[tabulation_num-1]['win_threshold']
@@ -0,0 +1,170 @@
+from typing import (List, Tuple)
+
+import collections
+import decimal
+
+import numpy as np
+
+from rcv_cruncher.matrix import BallotMatrix
+
+
+class RCV_piles:
+    """
+    Tabulation core for variants that only ever transfer whole ballots away from a single eliminated candidate
+    (SingleWinner, Until2, Sequential, BottomsUpThresh).
+
+    Instead of rebuilding every ballot each time a candidate becomes inactive, each ballot keeps a cursor into its
+    rank list and each candidate keeps a pile of the ballot indices currently counting towards them. Removing a
+    candidate only advances the ballots in that candidate's pile, and round tallies are updated incrementally.
+    """
+
+    def _reset_ballots(self) -> None:
+
+        ballot_matrix, weights = self._contest_ballot_matrix()
+
+        # ranks stay integer coded, candidate names are only looked up for ballots that move and for output
+        self._pile_ranks = ballot_matrix.ranks
+        self._pile_marks = ballot_matrix.mark_array(pad_mark='exhaust')
+        self._pile_code_lookup = ballot_matrix.code_lookup
+        self._pile_weights = list(weights)
+        self._pile_cursor = np.zeros(len(self._pile_weights), dtype=np.int64)
+
+        first_ranks = self._pile_ranks[:, 0] if ballot_matrix.n_ranks else np.full(len(self._pile_weights), BallotMatrix.PAD_CODE)
+        self._pile_alloc = self._pile_marks[first_ranks].tolist()
+
+        self._piles = {cand: [] for cand in self._contest_candidates.unique_candidates}
+        self._pile_tallies = {cand: 0 for cand in self._contest_candidates.unique_candidates}
+        for idx, (candidate, weight) in enumerate(zip(self._pile_alloc, self._pile_weights)):
+            if candidate != 'exhaust':
+                self._piles[candidate].append(idx)
+                self._pile_tallies[candidate] += weight
+
+    def _removed_code_table(self) -> np.ndarray:
+        """
+        Flags indexed by code + 1, True for removed candidates and for the padding code (at position 0),
+        which only ever trails the marks of a ballot.
+        """
+        removed = np.zeros(len(self._pile_marks), dtype=bool)
+        removed[0] = True
+        removed_codes = [self._pile_code_lookup[cand] for cand in self._removed_candidates
+                         if cand in self._pile_code_lookup]
+        removed[np.array(removed_codes, dtype=np.int64) + 1] = True
+        return removed
+
+    def _advance_pile(self, candidate: str) -> List[Tuple[int, str]]:
+        """
+        Move every ballot in the candidate's pile to its next continuing candidate (or to exhaust).
+        Returns (ballot index, destination) pairs in ballot order.
+        """
+        removed = self._removed_code_table()
+        n_ranks = self._pile_ranks.shape[1]
+
+        # step the cursors of all ballots in the pile together, past any removed candidates
+        pile = np.array(sorted(self._piles[candidate]), dtype=np.int64)
+        pos = self._pile_cursor[pile] + 1
+        while True:
+            in_ballot = np.flatnonzero(pos < n_ranks)
+            skip = in_ballot[removed[self._pile_ranks[pile[in_ballot], pos[in_ballot]].astype(np.int64) + 1]]
+            if not len(skip):
+                break
+            pos[skip] += 1
+        self._pile_cursor[pile] = pos
+
+        destination_codes = np.full(len(pile), BallotMatrix.PAD_CODE, dtype=np.int64)
+        in_ballot = pos < n_ranks
+        destination_codes[in_ballot] = self._pile_ranks[pile[in_ballot], pos[in_ballot]]
+
+        moved = list(zip(pile.tolist(), self._pile_marks[destination_codes].tolist()))
+        for idx, destination in moved:
+            if destination != 'exhaust':
+                self._piles[destination].append(idx)
+                self._pile_tallies[destination] += self._pile_weights[idx]
+            self._pile_alloc[idx] = destination
+
+        self._piles[candidate] = []
+        self._pile_tallies[candidate] = 0
+        return moved
+
+    def _current_ranks(self) -> List[List]:
+
+        removed = self._removed_code_table().tolist()
+        marks = self._pile_marks.tolist()
+        return [[marks[code] for code in ranks if not removed[code + 1]] for ranks in self._pile_ranks.tolist()]
+
+    def _current_weight_distrib(self) -> List[List[Tuple[str, decimal.Decimal]]]:
+        return [[(candidate, weight)] if candidate != 'exhaust' else [('empty', weight)]
+                for candidate, weight in zip(self._pile_alloc, self._pile_weights)]
+
+    def _pre_check(self) -> None:
+        """
+        Any checks on the input data to make sure tabulation will be possible.
+        """
+        # check for all blank ballots, undervote or blank before exhaust
+        if not any(self._piles.values()):
+            raise RuntimeError(f"(tabulation={self._tab_num}) all effectively blank ballots")
+
+    def _clean_ballots(self) -> None:
+        """
+        Remove any newly inactivated candidates from the ballot ranks.
+        """
+        newly_removed = [cand for cand in self._inactive_candidates if cand not in self._removed_candidates]
+        self._removed_candidates += newly_removed
+        for inactive_cand in newly_removed:
+            self._advance_pile(inactive_cand)
+
+    def _tally_active_ballots(self) -> None:
+
+        vote_alloc = collections.Counter({cand: self._pile_tallies[cand]
+                                          for cand in self._contest_candidates.unique_candidates})
+
+        round_results = list(zip(*vote_alloc.most_common()))
+        self._tabulations[self._tab_num-1]['rounds'].append(round_results)
+        # whole ballots move between piles, so weights never change and the list can be shared
+        ballot_trace = self._tabulations[self._tab_num-1]['ballot_trace']
+        if ballot_trace.level == 'full':
+            ballot_alloc = list(self._pile_alloc)
+        elif ballot_trace.level == 'final_only':
+            # only the latest round is kept, and piles only move once the next round starts,
+            # so the live list holds the final allocation when tabulation ends
+            ballot_alloc = self._pile_alloc
+        else:
+            ballot_alloc = None
+        ballot_trace.add_round(ballot_alloc, self._pile_weights)
+
+    def _calc_round_transfer(self) -> None:
+        """
+        This function should append a dictionary to self.transfers containing:
+        candidate names as keys, plus one key for 'exhaust' and any other keys for transfer categories
+        values as round transfer flows.
+
+        rules:
+        - transfer votes from round loser
+        """
+        candidates = self._contest_candidates.unique_candidates.union({'exhaust'})
+
+        # calculate transfer
+        by_candidate_transfer_dict = {
+            from_cand: {to_cand: 0 for to_cand in candidates if to_cand != from_cand}
+            for from_cand in candidates if from_cand != 'exhaust'
+            }
+        summary_transfer_dict = {cand: 0 for cand in candidates}
+
+        # the loser's ballots are moved now, so the following ballot cleaning has nothing left to do for them
+        self._removed_candidates.append(self._round_loser)
+        for idx, transfer_to_candidate in self._advance_pile(self._round_loser):
+            summary_transfer_dict[transfer_to_candidate] += self._pile_weights[idx]
+            by_candidate_transfer_dict[self._round_loser][transfer_to_candidate] += self._pile_weights[idx]
+
+        summary_transfer_dict[self._round_loser] = sum(summary_transfer_dict.values()) * -1
+        self._tabulations[self._tab_num-1]['summary_transfers'].append(summary_transfer_dict)
+
+        # remove candidates with no transfer
+        by_candidate_transfer_dict = {
+            from_cand: {
+                to_cand: transfer_count for to_cand, transfer_count in transfers.items()
+                if transfer_count != 0
+                }
+            for from_cand, transfers in by_candidate_transfer_dict.items()
+            if sum(transfers.values()) != 0
+        }
+        self._tabulations[self._tab_num-1]['by_candidate_transfers'].append(by_candidate_transfer_dict)
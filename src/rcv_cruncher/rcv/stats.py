@@ -1,13 +1,13 @@
 
-from typing import List
-
-import collections
+from typing import (Dict, List, Optional)
 
+import numpy as np
 import pandas as pd
 
-# import rcv_cruncher.util as util
+import rcv_cruncher.util as util
 
 from rcv_cruncher.marks import BallotMarks
+from rcv_cruncher.matrix import BallotMatrix
 from rcv_cruncher.util import InactiveType
 
 
@@ -16,12 +16,32 @@ class RCV_stats:
     Mixin containing all reporting stats. Can be overriden by any rcv variant.
     """
 
-    def _exhaustion_categories(self, *, tabulation_num=1):
+    # exhaustion categories in the order they are checked, _exhaustion_categories returns indices into this list
+    EXHAUSTION_TYPES = [
+        InactiveType.UNDERVOTE,
+        InactiveType.PRETALLY_EXHAUST,
+        InactiveType.NOT_EXHAUSTED,
+        InactiveType.POSTTALLY_EXHAUSTED_BY_DUPLICATE_RANKING,
+        InactiveType.POSTTALLY_EXHAUSTED_BY_REPEATED_SKIPPED_RANKING,
+        InactiveType.POSTTALLY_EXHAUSTED_BY_OVERVOTE,
+        InactiveType.POSTTALLY_EXHAUSTED_BY_RANK_LIMIT,
+        InactiveType.POSTTALLY_EXHAUSTED_BY_ABSTENTION
+    ]
+
+    # contest stat table columns flagging ballots of a single exhaustion category
+    EXHAUSTION_TYPE_COLUMNS = {
+        'pretally_exhausted': InactiveType.PRETALLY_EXHAUST,
+        'posttally_exhausted_by_overvote': InactiveType.POSTTALLY_EXHAUSTED_BY_OVERVOTE,
+        'posttally_exhausted_by_repeated_skipped_rankings': InactiveType.POSTTALLY_EXHAUSTED_BY_REPEATED_SKIPPED_RANKING,
+        'posttally_exhausted_by_abstention': InactiveType.POSTTALLY_EXHAUSTED_BY_ABSTENTION,
+        'posttally_exhausted_by_rank_limit': InactiveType.POSTTALLY_EXHAUSTED_BY_RANK_LIMIT,
+        'posttally_exhausted_by_duplicate_rankings': InactiveType.POSTTALLY_EXHAUSTED_BY_DUPLICATE_RANKING
+    }
+
+    def _exhaustion_categories(self, *, tabulation_num=1) -> np.ndarray:
         """
-        Returns a list with constants indicating why each ballot
-        was exhausted in a single-winner rcv contest.
-
-        Possible list values are:
+        Returns an integer array indicating why each ballot was exhausted in a single-winner rcv contest.
+        Each value indexes EXHAUSTION_TYPES, whose entries are:
 
         - UNDERVOTE : if the ballot was undervote, and therefore neither active nor exhaustable.
 
@@ -52,43 +72,32 @@ class RCV_stats:
 
         restrictive_rank_limit = self._summary_cvr_stat_table['restrictive_rank_limit'].item()
 
-        used_last_rank_list = self._cvr_stat_table['used_last_rank']
-        initial_ranks_list = self.get_initial_ranks(tabulation_num=tabulation_num)
-        final_ranks_list = self.get_final_ranks(tabulation_num=tabulation_num)
-        ballot_marks_list = self.get_cvr_dict(self._contest_rule_set_name)['ballot_marks']
-
-        why_exhaust = []
-        # loop through each ballot
-        for used_last_rank, inital_ranks, final_ranks, ballot_marks in zip(
-            used_last_rank_list, initial_ranks_list, final_ranks_list, ballot_marks_list):
-
-            # if the exhaust status is already known
-            if ballot_marks.inactive_type == BallotMarks.UNDERVOTE:
-                why_exhaust.append(InactiveType.UNDERVOTE)
-
-            elif ballot_marks.inactive_type == BallotMarks.PRETALLY_EXHAUST or not inital_ranks:
-                why_exhaust.append(InactiveType.PRETALLY_EXHAUST)
-
-            # if the ballot still had some ranks at the end of tabulation
-            # then it wasnt exhausted
-            elif final_ranks:
-                why_exhaust.append(InactiveType.NOT_EXHAUSTED)
-
-            elif ballot_marks.inactive_type == BallotMarks.MAYBE_EXHAUSTED_BY_DUPLICATE_RANKING:
-                why_exhaust.append(InactiveType.POSTTALLY_EXHAUSTED_BY_DUPLICATE_RANKING)
-
-            elif ballot_marks.inactive_type == BallotMarks.MAYBE_EXHAUSTED_BY_REPEATED_SKIPPED_RANKING:
-                why_exhaust.append(InactiveType.POSTTALLY_EXHAUSTED_BY_REPEATED_SKIPPED_RANKING)
-
-            elif ballot_marks.inactive_type == BallotMarks.MAYBE_EXHAUSTED_BY_OVERVOTE:
-                why_exhaust.append(InactiveType.POSTTALLY_EXHAUSTED_BY_OVERVOTE)
-
-            elif restrictive_rank_limit and used_last_rank:
-                why_exhaust.append(InactiveType.POSTTALLY_EXHAUSTED_BY_RANK_LIMIT)
-            else:
-                why_exhaust.append(InactiveType.POSTTALLY_EXHAUSTED_BY_ABSTENTION)
-
-        return why_exhaust
+        used_last_rank = self._cvr_stat_table['used_last_rank'].to_numpy()
+        inactive_type = self.get_ballot_matrix(self._contest_rule_set_name).inactive_type
+
+        # rank emptiness is tracked per tabulated record, then mapped back onto ballots
+        tabulation = self._tabulations[tabulation_num-1]
+        initial_empty = np.array([not ranks for ranks in tabulation['initial_ranks']], dtype=bool)
+        final_empty = np.array([not ranks for ranks in tabulation['final_ranks']], dtype=bool)
+        if self._ballot_record_index is not None:
+            initial_empty = initial_empty[self._ballot_record_index]
+            final_empty = final_empty[self._ballot_record_index]
+
+        def is_inactive_type(inactive_type_name):
+            return inactive_type == BallotMatrix.INACTIVE_TYPES.index(inactive_type_name)
+
+        # the first condition met decides the category
+        conditions = [
+            is_inactive_type(BallotMarks.UNDERVOTE),
+            is_inactive_type(BallotMarks.PRETALLY_EXHAUST) | initial_empty,
+            # if the ballot still had some ranks at the end of tabulation then it wasnt exhausted
+            ~final_empty,
+            is_inactive_type(BallotMarks.MAYBE_EXHAUSTED_BY_DUPLICATE_RANKING),
+            is_inactive_type(BallotMarks.MAYBE_EXHAUSTED_BY_REPEATED_SKIPPED_RANKING),
+            is_inactive_type(BallotMarks.MAYBE_EXHAUSTED_BY_OVERVOTE),
+            restrictive_rank_limit & used_last_rank
+        ]
+        return np.select(conditions, np.arange(len(conditions)), default=len(conditions))
 
     ####################
     # CONTEST INFO
@@ -158,10 +167,6 @@ class RCV_stats:
         In the case of multi-winner elections, this result will only pertain to the first candidate elected.
         '''
 
-        contest_cvr_dl = self.get_cvr_dict(self._contest_rule_set_name)
-        contest_cvr_ld = [{'ballot_marks': bm, 'weight': weight}
-                          for bm, weight in zip(contest_cvr_dl['ballot_marks'], contest_cvr_dl['weight'])]
-
         cands = self._contest_candidates
         if len(cands.unique_candidates) == 1:
             return True
@@ -169,22 +174,9 @@ class RCV_stats:
         winner = self._tabulation_winner(tabulation_num=tabulation_num)[0]
         losers = [cand for cand in cands.unique_candidates if cand != winner]
 
-        net = collections.Counter()
-        for b in contest_cvr_ld:
-            for loser in losers:
-
-                # does winner or loser appear first on this ballot?
-                ballot_contrib = 0
-                for mark in b['ballot_marks'].marks:
-                    if mark == winner:
-                        ballot_contrib = b['weight']
-                        break
-                    if mark == loser:
-                        ballot_contrib = -1 * b['weight']
-                        break
-
-                # accumulate
-                net.update({loser: ballot_contrib})
+        # net weight of ballots ranking the winner over each loser
+        preferred_df, _ = self.get_pairwise_matrix(self._contest_rule_set_name)
+        net = {loser: preferred_df.at[winner, loser] - preferred_df.at[loser, winner] for loser in losers}
 
         # any negative net values indicate a head-to-head where contest winner loses
         if min(net.values()) > 0:
@@ -321,53 +313,49 @@ class RCV_stats:
         top3_check = [bool(set(winner).intersection(b)) for b in top3]
         return sum(b['weight'] for flag, b in zip(top3_check, contest_cvr_ld) if flag)
 
-    def _compute_contest_stat_table(self):
+    @property
+    def _contest_stat_table(self) -> pd.DataFrame:
+        if 'contest' not in self._stat_tables:
+            self._stat_tables['contest'] = self._compute_contest_stat_table()
+        return self._stat_tables['contest']
+
+    @property
+    def _summary_contest_stat_tables(self) -> List[pd.DataFrame]:
+        if 'summary_contest' not in self._stat_tables:
+            self._stat_tables['summary_contest'] = self._compute_summary_contest_stat_tables()
+        return self._stat_tables['summary_contest']
 
-        cvr = self.get_cvr_dict(self._contest_rule_set_name)
+    def _compute_contest_stat_table(self) -> pd.DataFrame:
 
         df = pd.DataFrame()
 
         # ADD WEIGHTS
-        df['weight'] = cvr['weight']
+        df['weight'] = self.get_field('weight')
         for iTab in range(1, self._tab_num+1):
             df[f'final_weight{iTab}'] = self.get_final_weights(tabulation_num=iTab)
 
         # EXHAUSTION STATS
+        exhaust_codes = {}
         for iTab in range(1, self._tab_num+1):
-            exhaust_type = self._exhaustion_categories(tabulation_num=iTab)
-            df[f'exhaust_type{iTab}'] = pd.Series(exhaust_type, dtype='category')
+            exhaust_codes[iTab] = self._exhaustion_categories(tabulation_num=iTab)
+            df[f'exhaust_type{iTab}'] = pd.Categorical.from_codes(exhaust_codes[iTab], categories=self.EXHAUSTION_TYPES)
 
         for iTab in range(1, self._tab_num+1):
-            exhaust_type_str = f'exhaust_type{iTab}'
-            df[f'pretally_exhausted{iTab}'] = df[exhaust_type_str].eq(
-                InactiveType.PRETALLY_EXHAUST)
-            df[f'posttally_exhausted_by_overvote{iTab}'] = df[exhaust_type_str].eq(
-                InactiveType.POSTTALLY_EXHAUSTED_BY_OVERVOTE)
-            df[f'posttally_exhausted_by_repeated_skipped_rankings{iTab}'] = df[exhaust_type_str].eq(
-                InactiveType.POSTTALLY_EXHAUSTED_BY_REPEATED_SKIPPED_RANKING)
-            df[f'posttally_exhausted_by_abstention{iTab}'] = df[exhaust_type_str].eq(
-                InactiveType.POSTTALLY_EXHAUSTED_BY_ABSTENTION)
-            df[f'posttally_exhausted_by_rank_limit{iTab}'] = df[exhaust_type_str].eq(
-                InactiveType.POSTTALLY_EXHAUSTED_BY_RANK_LIMIT)
-            df[f'posttally_exhausted_by_duplicate_rankings{iTab}'] = df[exhaust_type_str].eq(
-                InactiveType.POSTTALLY_EXHAUSTED_BY_DUPLICATE_RANKING)
-
-            all_posttally_conditions = [
-                f'posttally_exhausted_by_overvote{iTab}',
-                f'posttally_exhausted_by_repeated_skipped_rankings{iTab}',
-                f'posttally_exhausted_by_abstention{iTab}',
-                f'posttally_exhausted_by_rank_limit{iTab}',
-                f'posttally_exhausted_by_duplicate_rankings{iTab}'
-            ]
+
+            for column, exhaust_type in self.EXHAUSTION_TYPE_COLUMNS.items():
+                df[f'{column}{iTab}'] = exhaust_codes[iTab] == self.EXHAUSTION_TYPES.index(exhaust_type)
+
+            all_posttally_conditions = [f'{column}{iTab}' for column in self.EXHAUSTION_TYPE_COLUMNS
+                                        if column != 'pretally_exhausted']
             df['posttally_exhausted'+str(iTab)] = df[all_posttally_conditions].any(axis='columns')
 
             exh_by_rank_limit_fully_ranked = self._cvr_stat_table['fully_ranked_incl_overvotes'] & \
-                df[exhaust_type_str].eq(InactiveType.POSTTALLY_EXHAUSTED_BY_RANK_LIMIT)
+                df[f'posttally_exhausted_by_rank_limit{iTab}']
             df[f'posttally_exhausted_by_rank_limit_fully_ranked{iTab}'] = exh_by_rank_limit_fully_ranked
 
-        self._contest_stat_table = df
+        return df
 
-    def _compute_summary_contest_stat_tables(self) -> None:
+    def _compute_summary_contest_stat_tables(self) -> List[pd.DataFrame]:
 
         tabulation_stats = []
 
@@ -407,30 +395,27 @@ class RCV_stats:
             final_round_active_votes = sum(self.get_round_tally_dict(s['n_rounds'], tabulation_num=iTab).values())
             s['final_round_active_votes'] = final_round_active_votes
 
-            weight = self._contest_stat_table[f'final_weight{iTab}']
+            exhaust_totals = self._exhaustion_weight_totals(self._contest_stat_table, tabulation_num=iTab)
+            weight = self._contest_stat_table[f'final_weight{iTab}'].to_numpy()
+            zero = exhaust_totals[InactiveType.UNDERVOTE] * 0
 
-            pretally = sum(self._contest_stat_table[f'pretally_exhausted{iTab}'] * weight)
-            s['total_pretally_exhausted'] = pretally
+            s['total_pretally_exhausted'] = exhaust_totals[InactiveType.PRETALLY_EXHAUST]
 
-            posttally = sum(self._contest_stat_table[f'posttally_exhausted{iTab}'] * weight)
+            posttally = sum(weight[self._contest_stat_table[f'posttally_exhausted{iTab}'].to_numpy()], zero)
             s['total_posttally_exhausted'] = posttally
 
-            posttally_overvote = sum(self._contest_stat_table[f'posttally_exhausted_by_overvote{iTab}'] * weight)
-            s['total_posttally_exhausted_by_overvote'] = posttally_overvote
-
-            posttally_skipped = sum(self._contest_stat_table[f'posttally_exhausted_by_repeated_skipped_rankings{iTab}'] * weight)
-            s['total_posttally_exhausted_by_skipped_rankings'] = posttally_skipped
+            s['total_posttally_exhausted_by_overvote'] = exhaust_totals[InactiveType.POSTTALLY_EXHAUSTED_BY_OVERVOTE]
+            s['total_posttally_exhausted_by_skipped_rankings'] = \
+                exhaust_totals[InactiveType.POSTTALLY_EXHAUSTED_BY_REPEATED_SKIPPED_RANKING]
+            s['total_posttally_exhausted_by_abstention'] = exhaust_totals[InactiveType.POSTTALLY_EXHAUSTED_BY_ABSTENTION]
+            s['total_posttally_exhausted_by_duplicate_rankings'] = \
+                exhaust_totals[InactiveType.POSTTALLY_EXHAUSTED_BY_DUPLICATE_RANKING]
 
-            posttally_abstention = sum(self._contest_stat_table[f'posttally_exhausted_by_abstention{iTab}'] * weight)
-            s['total_posttally_exhausted_by_abstention'] = posttally_abstention
-
-            posttally_duplicate = sum(self._contest_stat_table[f'posttally_exhausted_by_duplicate_rankings{iTab}'] * weight)
-            s['total_posttally_exhausted_by_duplicate_rankings'] = posttally_duplicate
-
-            posttally_rank_limit = sum(self._contest_stat_table[f'posttally_exhausted_by_rank_limit{iTab}'] * weight)
+            posttally_rank_limit = exhaust_totals[InactiveType.POSTTALLY_EXHAUSTED_BY_RANK_LIMIT]
             s['total_posttally_exhausted_by_rank_limit'] = posttally_rank_limit
 
-            posttally_rank_limit_full = sum(self._contest_stat_table[f'posttally_exhausted_by_rank_limit_fully_ranked{iTab}'] * weight)
+            rank_limit_full = self._contest_stat_table[f'posttally_exhausted_by_rank_limit_fully_ranked{iTab}'].to_numpy()
+            posttally_rank_limit_full = sum(weight[rank_limit_full], zero)
             s['total_posttally_exhausted_by_rank_limit_fully_ranked'] = posttally_rank_limit_full
             s['total_posttally_exhausted_by_rank_limit_partially_ranked'] = posttally_rank_limit - posttally_rank_limit_full
 
@@ -466,74 +451,78 @@ class RCV_stats:
 
             tabulation_stats.append(s.to_frame().transpose())
 
-        self._summary_contest_stat_tables = tabulation_stats
+        return tabulation_stats
 
-    def _compute_contest_split_stats(self, split_filter: List[bool]) -> pd.DataFrame:
-
-        tabulation_split_stats = []
-
-        filtered_stat_table = self._contest_stat_table.loc[split_filter, :]
+    def _exhaustion_weight_totals(self, stat_table: pd.DataFrame, tabulation_num: int = 1) -> Dict:
+        """
+        Total final weight of the ballots in each exhaustion category, from one grouped sum over the ballots.
+        Categories without ballots total zero.
+        """
+        weight = stat_table[f'final_weight{tabulation_num}'].to_numpy()
+        codes = stat_table[f'exhaust_type{tabulation_num}'].cat.codes.to_numpy()
 
-        for iTab in range(1, self._tab_num+1):
+        zero = weight[0] * 0 if len(weight) else 0
+        totals = util.group_sums(codes, weight, len(self.EXHAUSTION_TYPES), zero=zero)
+        return dict(zip(self.EXHAUSTION_TYPES, totals))
 
-            s = pd.Series()
+    @property
+    def _summary_contest_split_stat_tables(self) -> Optional[List[pd.DataFrame]]:
+        if 'summary_contest_split' not in self._stat_tables:
+            self._stat_tables['summary_contest_split'] = self._compute_summary_contest_split_stat_tables()
+        return self._stat_tables['summary_contest_split']
 
-            weight = filtered_stat_table[f'final_weight{iTab}']
+    def _compute_contest_split_stats(self, group_codes: np.ndarray, n_groups: int) -> List[pd.DataFrame]:
 
-            pretally = sum(filtered_stat_table[f'pretally_exhausted{iTab}'] * weight)
-            s['split_total_pretally_exhausted'] = pretally
+        tabulation_split_stats = []
 
-            posttally = sum(filtered_stat_table[f'posttally_exhausted{iTab}'] * weight)
-            s['split_total_posttally_exhausted'] = posttally
+        stat_table = self._contest_stat_table
 
-            posttally_overvote = sum(filtered_stat_table[f'posttally_exhausted_by_overvote{iTab}'] * weight)
-            s['split_total_posttally_exhausted_by_overvote'] = posttally_overvote
+        for iTab in range(1, self._tab_num+1):
 
-            posttally_skipped = sum(filtered_stat_table[f'posttally_exhausted_by_repeated_skipped_rankings{iTab}'] * weight)
-            s['split_total_posttally_exhausted_by_skipped_rankings'] = posttally_skipped
+            weight = stat_table[f'final_weight{iTab}'].to_numpy()
 
-            posttally_abstention = sum(filtered_stat_table[f'posttally_exhausted_by_abstention{iTab}'] * weight)
-            s['split_total_posttally_exhausted_by_abstention'] = posttally_abstention
+            def weight_sums(column):
+                return util.group_sums(group_codes, stat_table[f'{column}{iTab}'].to_numpy() * weight, n_groups)
 
-            posttally_rank_limit = sum(filtered_stat_table[f'posttally_exhausted_by_rank_limit{iTab}'] * weight)
-            s['split_total_posttally_exhausted_by_rank_limit'] = posttally_rank_limit
+            split_stats = {
+                'split_total_pretally_exhausted': weight_sums('pretally_exhausted'),
+                'split_total_posttally_exhausted': weight_sums('posttally_exhausted'),
+                'split_total_posttally_exhausted_by_overvote': weight_sums('posttally_exhausted_by_overvote'),
+                'split_total_posttally_exhausted_by_skipped_rankings':
+                    weight_sums('posttally_exhausted_by_repeated_skipped_rankings'),
+                'split_total_posttally_exhausted_by_abstention': weight_sums('posttally_exhausted_by_abstention')
+            }
 
-            posttally_rank_limit_full = sum(filtered_stat_table[f'posttally_exhausted_by_rank_limit_fully_ranked{iTab}'] * weight)
-            s['split_total_posttally_exhausted_by_rank_limit_fully_ranked'] = posttally_rank_limit_full
-            s['split_total_posttally_exhausted_by_rank_limit_partially_ranked'] = posttally_rank_limit - posttally_rank_limit_full
+            posttally_rank_limit = weight_sums('posttally_exhausted_by_rank_limit')
+            posttally_rank_limit_full = weight_sums('posttally_exhausted_by_rank_limit_fully_ranked')
+            split_stats['split_total_posttally_exhausted_by_rank_limit'] = posttally_rank_limit
+            split_stats['split_total_posttally_exhausted_by_rank_limit_fully_ranked'] = posttally_rank_limit_full
+            split_stats['split_total_posttally_exhausted_by_rank_limit_partially_ranked'] = \
+                [total - full for total, full in zip(posttally_rank_limit, posttally_rank_limit_full)]
 
-            posttally_duplicate = sum(filtered_stat_table[f'posttally_exhausted_by_duplicate_rankings{iTab}'] * weight)
-            s['split_total_posttally_exhausted_by_duplicate_rankings'] = posttally_duplicate
+            split_stats['split_total_posttally_exhausted_by_duplicate_rankings'] = \
+                weight_sums('posttally_exhausted_by_duplicate_rankings')
 
-            tabulation_split_stats.append(s.to_frame().transpose())
+            tabulation_split_stats.append(pd.DataFrame(split_stats, dtype=object))
 
         return tabulation_split_stats
 
-    def _compute_summary_contest_split_stat_tables(self) -> None:
+    def _compute_summary_contest_split_stat_tables(self) -> Optional[List[pd.DataFrame]]:
 
-        if not self._split_filter_dict:
-            return
+        split_groups = self._split_groups()
+        if not split_groups:
+            return None
 
         split_tabulation_stat_df_list = [[] for _ in range(self._tab_num)]
 
-        for field in self._split_filter_dict:
-            field_clean = self._clean_string(field)
-
-            for unique_val in self._split_filter_dict[field]:
-                val_clean = self._clean_string(unique_val)
-                split_id = field_clean + "-" + val_clean
+        for field, (group_codes, unique_vals) in split_groups.items():
 
-                split_id_df = pd.DataFrame({
-                    'split_field': [field],
-                    'split_value': [unique_val],
-                    'split_id': [split_id]
-                    })
-                split_stat_df_list = self._compute_contest_split_stats(self._split_filter_dict[field][unique_val])
+            split_id_df = self._split_id_df(field, unique_vals)
+            split_stat_df_list = self._compute_contest_split_stats(group_codes, len(unique_vals))
 
-                for split_stat_df_idx, split_stat_df in enumerate(split_stat_df_list):
-                    split_tabulation_stat_df_list[split_stat_df_idx].append(
-                        pd.concat([split_id_df, split_stat_df], axis='columns'))
+            for split_stat_df_idx, split_stat_df in enumerate(split_stat_df_list):
+                split_tabulation_stat_df_list[split_stat_df_idx].append(
+                    pd.concat([split_id_df, split_stat_df], axis='columns'))
 
-        summary_contest_split_stat_tables = [pd.concat(split_stat_list, axis=0, ignore_index=True, sort=False)
-                                             for split_stat_list in split_tabulation_stat_df_list]
-        self._summary_contest_split_stat_tables = summary_contest_split_stat_tables
+        return [pd.concat(split_stat_list, axis=0, ignore_index=True, sort=False)
+                for split_stat_list in split_tabulation_stat_df_list]
@@ -30,24 +30,12 @@ class RCV_tables:
         # candidate_set = BallotMarks.remove_mark(candidate_set, BallotMarks.WRITEIN)
         candidate_set = sorted(candidate_set.unique_candidates)
 
-        cleaned_dict = self.get_cvr_dict(self._contest_rule_set_name)
-        ballot_set = [{'ranks': ranks.marks, 'weight': weight}
-                      for ranks, weight in zip(cleaned_dict['ballot_marks'], cleaned_dict['weight'])]
+        preferred_df, ranked_either_df = self.get_pairwise_matrix(self._contest_rule_set_name)
 
         # create data frame that will be populated and output
         condorcet_percent_df = pd.DataFrame(util.NAN, index=candidate_set, columns=candidate_set)
         condorcet_count_df = pd.DataFrame(util.NAN, index=candidate_set, columns=candidate_set)
 
-        # turn ballot-lists into ballot-dict with
-        # key 'id' containing a unique integer id for the ballot
-        # key 'ranks' containing the original ballot-list
-        ballot_dicts = [{'id': ind, 'ballot': ballot} for ind, ballot in enumerate(ballot_set)]
-
-        # make dictionary with candidate as key, and value as list of ballot-dicts
-        # that contain their name in any rank
-        cand_ballot_dict = {cand: [ballot for ballot in ballot_dicts if cand in ballot['ballot']['ranks']]
-                            for cand in candidate_set}
-
         # all candidate pairs
         cand_pairs = itertools.combinations(candidate_set, 2)
 
@@ -55,22 +43,12 @@ class RCV_tables:
             cand1 = pair[0]
             cand2 = pair[1]
 
-            # get the union of their ballots
-            combined_ballot_list = cand_ballot_dict[cand1] + cand_ballot_dict[cand2]
-            uniq_pair_ballots = list({v['id']: v['ballot'] for v in combined_ballot_list}.values())
-
-            uniq_pair_ballots_weights = [ballot['weight'] for ballot in uniq_pair_ballots]
-            sum_weighted_ballots = sum(uniq_pair_ballots_weights)
-
-            # which ballots rank cand1 above cand2?
-            cand1_vs_cand2 = [util.index_inf(b['ranks'], cand1) < util.index_inf(b['ranks'], cand2) for b in uniq_pair_ballots]
-            cand1_vs_cand2_weightsum = sum(weight * flag for weight, flag
-                                           in zip(uniq_pair_ballots_weights, cand1_vs_cand2))
+            # weight of ballots that rank either candidate
+            sum_weighted_ballots = ranked_either_df.at[cand1, cand2]
 
-            # the remainder then must rank cand2 over cand1
-            cand2_vs_cand1 = [not i for i in cand1_vs_cand2]
-            cand2_vs_cand1_weightsum = sum(weight * flag for weight, flag
-                                           in zip(uniq_pair_ballots_weights, cand2_vs_cand1))
+            # which ballots rank cand1 above cand2, and the reverse
+            cand1_vs_cand2_weightsum = preferred_df.at[cand1, cand2]
+            cand2_vs_cand1_weightsum = preferred_df.at[cand2, cand1]
 
             # add counts to df
             condorcet_count_df.loc[cand1, cand2] = cand1_vs_cand2_weightsum
@@ -220,7 +198,7 @@ class RCV_tables:
         candidate_set = sorted(candidate_set.unique_candidates)
 
         # ballot rank limit
-        ballot_length = self.stats()[0]['rank_limit'].item()
+        ballot_length = self.get_rank_limit()
 
         # get cleaned ballots
         cleaned_dict = self.get_cvr_dict(self._contest_rule_set_name)
@@ -274,7 +252,7 @@ class RCV_tables:
             return None
 
         winner = winner[0]
-        rank_limit = self.stats()[0]['rank_limit'].item()
+        rank_limit = self.get_rank_limit()
         winner_final_round_count = self._final_round_winner_vote(tabulation_num=tabulation_num)
         final_weight_distrib = self.get_final_weight_distrib(tabulation_num=tabulation_num)
 
@@ -532,10 +510,11 @@ class RCV_tables:
 
             outcomes = self.get_candidate_outcomes(tabulation_num=iTab)
 
-            json_dict = {'config': {'notes': self.stats()[iTab-1]['notes'].item(),
-                                    'date': self.stats()[iTab-1]['date'].item(),
-                                    'jurisdiction': self.stats()[iTab-1]['jurisdiction'].item(),
-                                    'office': self.stats()[iTab-1]['office'].item(),
+            id_info = self.get_id_info()
+            json_dict = {'config': {'notes': id_info['notes'],
+                                    'date': id_info['date'],
+                                    'jurisdiction': id_info['jurisdiction'],
+                                    'office': id_info['office'],
                                     'threshold': '50%'},
                         'results': []}
 
@@ -570,7 +549,7 @@ class RCV_tables:
                      'tally': tally_dict,
                      'tallyResults': transfer_list})
 
-            uid = self.stats()[iTab-1]['unique_id'].item()
+            uid = id_info['unique_id']
 
             save_path = pathlib.Path(save_dir) / 'round_by_round_json'
             save_path.mkdir(exist_ok=True)
@@ -583,7 +562,7 @@ class RCV_tables:
 
         # set up vars
         contest_candidates = self._contest_candidates.unique_candidates
-        rank_limit = self._summary_cvr_stat_table['rank_limit'].item()
+        rank_limit = self.get_rank_limit()
         candidate_outcomes = {dikt['name']: dikt for dikt in self.get_candidate_outcomes(tabulation_num=1)}
         first_round_dict = self.get_round_tally_dict(round_num=1, tabulation_num=1)
         first_round_leader = sorted(first_round_dict.items(), key=lambda x: -x[1])[0][0]
@@ -618,8 +597,8 @@ class RCV_tables:
         # fill precomputed columns
         df['contestID'] = self._id_df['unique_id'].item()
         df['rank_limit'] = rank_limit
-        df['n_rounds'] = self._summary_contest_stat_tables[0]['n_rounds'].item()
-        df['rcv_type'] = self._summary_contest_stat_tables[0]['rcv_type'].item()
+        df['n_rounds'] = self.n_rounds(tabulation_num=1)
+        df['rcv_type'] = self.__class__.__name__
         df['winner'] = [True if candidate in self._tabulation_winner(tabulation_num=1) else False
                         for candidate in df.index]
         df['round_elected'] = [candidate_outcomes[candidate]['round_elected'] for candidate in df.index]
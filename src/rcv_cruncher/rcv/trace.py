@@ -0,0 +1,106 @@
+from typing import (List)
+
+import numpy as np
+
+
+class BallotTrace:
+    """
+    Round by round record of the candidate each ballot counts towards and the weight it carries, for one tabulation.
+
+    Allocations are coded as one small integer array per round. Weights are kept as the first round list plus,
+    for each later round, only the ballots whose weight changed. The trace level sets what is kept:
+
+    * 'full' - every round.
+    * 'final_only' - the allocation of the latest round, first and latest round weights.
+    * 'none' - first and latest round weights only (needed for initial and final ballot weights).
+    """
+
+    LEVELS = ['full', 'final_only', 'none']
+
+    def __init__(self, level: str = 'full') -> None:
+
+        if level not in self.LEVELS:
+            raise RuntimeError(f'trace level "{level}" is not one of {self.LEVELS}')
+
+        self.level = level
+        self.n_rounds = 0
+
+        self.labels = ['exhaust']
+        self.label_codes = {'exhaust': 0}
+
+        self._round_allocations = []
+        self._latest_allocation = None
+
+        self._first_weights = None
+        self._latest_weights = None
+        self._weight_changes = []
+
+    def add_round(self, allocation: List[str], weights: List) -> None:
+        """
+        Record a round. allocation holds a candidate (or 'exhaust') per ballot (it may be None with level 'none'),
+        weights its weight. Both lists are kept as given and must not be modified afterwards, except that the
+        same weights list may be passed again for a round in which no weight changed. With level 'final_only',
+        where only the latest allocation is kept, the allocation may be a list updated in place for the next round.
+        """
+        self.n_rounds += 1
+
+        if self.level == 'full':
+            self._round_allocations.append(self._encode(allocation))
+            if self._latest_weights is weights:
+                self._weight_changes.append((np.array([], dtype=np.int64), []))
+            elif self._latest_weights is not None:
+                changed = [idx for idx, (old, new) in enumerate(zip(self._latest_weights, weights)) if old != new]
+                self._weight_changes.append((np.array(changed, dtype=np.int64), [weights[idx] for idx in changed]))
+        elif self.level == 'final_only':
+            self._latest_allocation = allocation
+
+        if self._first_weights is None:
+            self._first_weights = weights
+        self._latest_weights = weights
+
+    def _encode(self, allocation: List[str]) -> np.ndarray:
+        codes = [self.label_codes.get(candidate) for candidate in allocation]
+        if None in codes:
+            for candidate in allocation:
+                if candidate not in self.label_codes:
+                    self.label_codes[candidate] = len(self.labels)
+                    self.labels.append(candidate)
+            codes = [self.label_codes[candidate] for candidate in allocation]
+        dtype = np.int16 if len(self.labels) <= np.iinfo(np.int16).max else np.int32
+        return np.array(codes, dtype=dtype)
+
+    def _check_round(self, round_num: int) -> None:
+        if not 1 <= round_num <= self.n_rounds:
+            raise RuntimeError(f'round {round_num} is not one of the {self.n_rounds} tabulated rounds')
+
+    def allocation(self, round_num: int) -> List[str]:
+
+        self._check_round(round_num)
+
+        if self.level == 'full':
+            labels = self.labels
+            return [labels[code] for code in self._round_allocations[round_num-1].tolist()]
+
+        if self.level == 'final_only' and round_num == self.n_rounds:
+            return list(self._latest_allocation)
+
+        raise RuntimeError(f'round {round_num} ballot allocations are not kept with trace_level="{self.level}"')
+
+    def weights(self, round_num: int) -> List:
+
+        self._check_round(round_num)
+
+        if round_num == 1:
+            return list(self._first_weights)
+
+        if round_num == self.n_rounds:
+            return list(self._latest_weights)
+
+        if self.level != 'full':
+            raise RuntimeError(f'round {round_num} ballot weights are not kept with trace_level="{self.level}"')
+
+        weights = list(self._first_weights)
+        for changed, changed_weights in self._weight_changes[:round_num-1]:
+            for idx, weight in zip(changed.tolist(), changed_weights):
+                weights[idx] = weight
+        return weights
@@ -7,6 +7,7 @@ import decimal
 
 from rcv_cruncher.marks import BallotMarks
 from rcv_cruncher.rcv.base import RCV
+from rcv_cruncher.rcv.piles import RCV_piles
 
 
 def get_rcv_dict():
@@ -23,7 +24,7 @@ def get_rcv_dict():
     }
 
 
-class SingleWinner(RCV):
+class SingleWinner(RCV_piles, RCV):
     """
     Single winner rcv contest.
     - Winner is candidate to first achieve more than half the active round votes.
@@ -51,48 +52,6 @@ class SingleWinner(RCV):
         if round_tallies[0]*2 > sum(round_tallies):
             self._round_winners = [round_candidates[0]]
 
-    def _calc_round_transfer(self) -> None:
-        """
-        This function should append a dictionary to self.transfers containing:
-        candidate names as keys, plus one key for 'exhaust' and any other keys for transfer categories
-        values as round transfer flows.
-
-        rules:
-        - transfer votes from round loser
-        """
-        candidates = self._contest_candidates.unique_candidates.union({'exhaust'})
-
-        # calculate transfer
-        by_candidate_transfer_dict = {
-            from_cand: {to_cand: 0 for to_cand in candidates if to_cand != from_cand}
-            for from_cand in candidates if from_cand != 'exhaust'
-            }
-        summary_transfer_dict = {cand: 0 for cand in candidates}
-
-        for b in self._contest_cvr_ld:
-            if len(b['ballot_marks'].marks) > 0 and b['ballot_marks'].marks[0] == self._round_loser:
-                if len(b['ballot_marks'].marks) > 1:
-                    transfer_to_candidate = b['ballot_marks'].marks[1]
-                    summary_transfer_dict[transfer_to_candidate] += b['weight']
-                    by_candidate_transfer_dict[self._round_loser][transfer_to_candidate] += b['weight']
-                else:
-                    summary_transfer_dict['exhaust'] += b['weight']
-                    by_candidate_transfer_dict[self._round_loser]['exhaust'] += b['weight']
-
-        summary_transfer_dict[self._round_loser] = sum(summary_transfer_dict.values()) * -1
-        self._tabulations[self._tab_num-1]['summary_transfers'].append(summary_transfer_dict)
-
-        # remove candidates with no transfer
-        by_candidate_transfer_dict = {
-            from_cand: {
-                to_cand: transfer_count for to_cand, transfer_count in transfers.items()
-                if transfer_count != 0
-                }
-            for from_cand, transfers in by_candidate_transfer_dict.items()
-            if sum(transfers.values()) != 0
-        }
-        self._tabulations[self._tab_num-1]['by_candidate_transfers'].append(by_candidate_transfer_dict)
-
     def _contest_not_complete(self) -> bool:
         """
         This function should return True if another round should be evaluated and False
@@ -238,6 +197,11 @@ class STV(RCV, abc.ABC):
 class STVWholeBallot(STV):
 
     def __init__(self, *args, **kwargs) -> None:
+
+        if kwargs.get('compress_ballots'):
+            # whole ballot surplus transfers pick individual ballots, see _removal_ballots
+            raise RuntimeError('compress_ballots is not supported for STVWholeBallot')
+
         super().__init__(*args, **kwargs)
 
         weights = set(b['weight'] for b in self._contest_cvr_ld)
@@ -258,7 +222,7 @@ class STVWholeBallot(STV):
             return to_remove
 
         thresh = self._win_threshold()
-        ballot_weight = self._contest_cvr_ld[0]['weight']  # assuming equal weighted ballots
+        ballot_weight = self._numeric.to_external(self._contest_cvr_ld[0]['weight'])  # assuming equal weighted ballots
         continuing_candidates = set(self._contest_candidates) - set(self._inactive_candidates)
 
         # total and surplus
@@ -465,6 +429,8 @@ class STVFractionalBallot(STV):
     - Any winner is eliminated and has their surplus redistributed. Percent of each
     ballot redistributed is equal to (# of votes winner has -- minus the threshold)/(# of votes winner has).
     - If no winners in round, candidate with least votes in a round is eliminated and has votes transferred.
+    - With the "fixed" numeric backend, the surplus share of each winner ballot is rounded down to the fixed point
+    precision and the winner keeps the remainder. The "int" backend cannot split ballots and is rejected.
     """
     def __init__(self, *args, **kwargs) -> None:
         super().__init__(*args, **kwargs)
@@ -478,16 +444,17 @@ class STVFractionalBallot(STV):
         - reduce weights of ballots ranking the winner by the amount
         """
 
-        round_dict = self.get_round_tally_dict(self._round_num, tabulation_num=self._tab_num)
-        threshold = self._win_threshold()
+        # tallies and threshold in numeric backend units
+        round_dict = dict(zip(*self._tabulations[self._tab_num-1]['rounds'][self._round_num-1]))
+        threshold = self._numeric.to_internal(decimal.Decimal(self._win_threshold()))
 
         for winner in self._round_winners:
 
             # fractional surplus to transfer from each winner ballot
-            surplus_percent = (round_dict[winner] - threshold) / round_dict[winner]
+            surplus = round_dict[winner] - threshold
 
             # if surplus to transfer is non-zero
-            if surplus_percent:
+            if surplus:
 
                 # which ballots had the winner on top
                 # and need to be fractionally split
@@ -495,13 +462,10 @@ class STVFractionalBallot(STV):
                 for b in self._contest_cvr_ld:
                     if b['ballot_marks'].marks and b['ballot_marks'].marks[0] == winner:
 
-                        # record ballot weight allotted to winner
-                        winner_weight = b['weight'] * (1 - surplus_percent)
+                        # split ballot weight into the part allotted to winner and the remaining weight
+                        winner_weight, remaining_weight = self._numeric.split_weight(b['weight'], surplus, round_dict[winner])
                         new_weight_distrib = b['weight_distrib'] + [(winner, winner_weight)]
 
-                        # remaining weight
-                        remaining_weight = b['weight'] * surplus_percent
-
                         # adjust ballot's current weight
                         new.append(
                             {
@@ -569,7 +533,7 @@ class STVFractionalBallot(STV):
         self._tabulations[self._tab_num-1]['by_candidate_transfers'].append(by_candidate_transfer_dict)
 
 
-class BottomsUpThresh(RCV):
+class BottomsUpThresh(RCV_piles, RCV):
     """
     Multi winner contest. When all candidates in a round have more than X% of the round votes, they are all winners.
     - In a no winner round, the candidate with least votes is eliminated and ballots transferred.
@@ -589,49 +553,6 @@ class BottomsUpThresh(RCV):
         if all(i > threshold for i in round_tallies):
             self._round_winners = list(round_candidates)
 
-    def _calc_round_transfer(self) -> None:
-        """
-        This function should append a dictionary to self.transfers containing:
-        candidate names as keys, plus one key for 'exhaust' and any other keys for transfer categories
-        values as round transfer flows.
-
-        rules:
-        - transfer votes from round loser
-        """
-
-        candidates = self._contest_candidates.unique_candidates.union({'exhaust'})
-
-        # calculate transfer
-        by_candidate_transfer_dict = {
-            from_cand: {to_cand: 0 for to_cand in candidates if to_cand != from_cand}
-            for from_cand in candidates if from_cand != 'exhaust'
-            }
-        transfer_dict = {cand: 0 for cand in self._candidate_set.union({'exhaust'})}
-
-        for b in self._contest_cvr_ld:
-            if len(b['ballot_marks'].marks) > 0 and b['ballot_marks'].marks[0] == self._round_loser:
-                if len(b['ballot_marks'].marks) > 1:
-                    transfer_to = b['ballot_marks'].marks[1]
-                    transfer_dict[transfer_to] += b['weight']
-                    by_candidate_transfer_dict[self._round_loser][transfer_to] += b['weight']
-                else:
-                    transfer_dict['exhaust'] += b['weight']
-                    by_candidate_transfer_dict[self._round_loser]['exhaust'] += b['weight']
-
-        transfer_dict[self._round_loser] = sum(transfer_dict.values()) * -1
-        self._tabulations[self._tab_num-1]['summary_transfers'].append(transfer_dict)
-
-        # remove candidates with no transfer
-        by_candidate_transfer_dict = {
-            from_cand: {
-                to_cand: transfer_count for to_cand, transfer_count in transfers.items()
-                if transfer_count != 0
-                }
-            for from_cand, transfers in by_candidate_transfer_dict.items()
-            if sum(transfers.values()) != 0
-        }
-        self._tabulations[self._tab_num-1]['by_candidate_transfers'].append(by_candidate_transfer_dict)
-
     def _contest_not_complete(self) -> None:
         """
         This function should return True if another round should be evaluated and False
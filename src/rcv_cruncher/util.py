@@ -3,6 +3,8 @@ import os
 import pathlib
 import csv
 
+import numpy as np
+
 from rcv_cruncher.marks import BallotMarks
 
 ###############################################################
@@ -53,6 +55,27 @@ class CSVLogger:
         self.file.close()
 
 
+class ListLogger:
+    """
+    Same interface as CSVLogger but keeps rows in memory, so a worker process can hand them back to
+    the parent to be written out.
+    """
+
+    def __init__(self, header_list):
+        self.row_length = len(header_list)
+        self.rows = []
+
+    def write(self, row_list):
+        if len(row_list) != self.row_length:
+            msg = f"ListLogger.write row list has length {len(row_list)}, "
+            msg += f"doesn't match header list length ({self.row_length})"
+            raise RuntimeError(msg)
+        self.rows.append(row_list)
+
+    def close(self):
+        pass
+
+
 def before(victor, loser, ballot):
     """
         Used to calculate condorcet stats. Each ballot passed through this
@@ -115,15 +138,94 @@ def decimal2float(stat, round_places=3):
         stat (any): Any value.
 
     Returns:
-        any type not Decimal: If the stat passed is type Decimal, it is converted to float.
+        any type not Decimal: If the stat passed is type Decimal or float (including numpy floats, which are
+        what ratios of integer numeric backend values produce), it is rounded and returned as float.
+        numpy integers are converted to int.
     """
 
-    if isinstance(stat, decimal.Decimal):
+    if isinstance(stat, (decimal.Decimal, float, np.floating)):
         return round(float(stat), round_places)
+    elif isinstance(stat, np.integer):
+        return int(stat)
     else:
         return stat
 
 
+def weighted_median(values, weights):
+    """Weighted median of values, computed in the weights' own number type (such as Decimal) so that a
+    cumulative weight landing exactly on the midpoint is found without float rounding.
+
+    Args:
+        values (list or array): Numbers to take the median of.
+        weights (list or array): Weight of each value. Non-positive weights are ignored.
+
+    Returns:
+        The value at which the cumulative weight, taken in value then weight order, first passes half the total
+        weight. If it reaches exactly half, the mean of the two values either side of that point (a float, as
+        with the weightedstats package this replaces). None if no weight is positive.
+    """
+    values = np.asarray(values)
+    weights = np.asarray(weights, dtype=object)
+
+    positive = (weights > 0).astype(bool)
+    if not positive.any():
+        return None
+    values, weights = values[positive], weights[positive]
+
+    order = np.argsort(values, kind='stable')
+    values, weights = values[order], weights[order]
+
+    # total weight per distinct value, accumulated in increasing value order
+    starts = np.flatnonzero(np.concatenate([[True], values[1:] != values[:-1]]))
+    unique_values = values[starts].tolist()
+    cumulative_weights = np.cumsum(np.add.reduceat(weights, starts))
+    midpoint = cumulative_weights[-1] / 2
+
+    idx = int(np.argmax((cumulative_weights > midpoint).astype(bool)))
+    below_midpoint = cumulative_weights[idx-1] if idx > 0 else 0
+    if below_midpoint == midpoint:
+        return (unique_values[idx-1] + unique_values[idx]) / 2
+
+    # the midpoint may also fall between two weights of the value that passes it
+    group_end = starts[idx+1] if idx + 1 < len(starts) else len(weights)
+    for weight in sorted(weights[starts[idx]:group_end])[:-1]:
+        below_midpoint += weight
+        if below_midpoint == midpoint:
+            return (unique_values[idx] + unique_values[idx]) / 2
+        if below_midpoint > midpoint:
+            break
+
+    return unique_values[idx]
+
+
+def group_sums(group_codes, values, n_groups, zero=0):
+    """Sum values by group in a single pass over the values sorted by group code.
+
+    Args:
+        group_codes (array): Group code (0 to n_groups - 1) of each value.
+        values (list or array): Numbers to sum, such as Decimal weights.
+        n_groups (int): Number of groups.
+        zero (any): Total of a group without values.
+
+    Returns:
+        list: The total of each group, in group code order.
+    """
+    group_codes = np.asarray(group_codes)
+    values = np.asarray(values)
+
+    totals = [zero] * n_groups
+    if not len(values):
+        return totals
+
+    order = np.argsort(group_codes, kind='stable')
+    sorted_codes = group_codes[order]
+    starts = np.flatnonzero(np.concatenate([[True], sorted_codes[1:] != sorted_codes[:-1]]))
+    for code, total in zip(sorted_codes[starts].tolist(), np.add.reduceat(values[order], starts)):
+        totals[code] = total
+
+    return totals
+
+
 def DL2LD(dl):
     return [dict(zip(dl, t)) for t in zip(*dl.values())]
 
@@ -0,0 +1,165 @@
+
+import pytest
+import itertools
+
+import numpy as np
+
+from rcv_cruncher.marks import BallotMarks
+from rcv_cruncher.matrix import BallotMatrix
+
+
+ballots = [
+    ['A', BallotMarks.WRITEIN, 'write-in', BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.OVERVOTE, 'A', 'B'],
+    [BallotMarks.OVERVOTE, 'Tuwi', BallotMarks.WRITEIN, 'A', 'B', 'B', 'C', BallotMarks.SKIPPED],
+    [BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.SKIPPED,
+     BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.SKIPPED],
+    [BallotMarks.SKIPPED, BallotMarks.SKIPPED, 'C', 'UWI', 'uwi', BallotMarks.SKIPPED, BallotMarks.SKIPPED, 'B'],
+    ['B', 'B', 'B', BallotMarks.OVERVOTE, BallotMarks.OVERVOTE, BallotMarks.SKIPPED, 'A', BallotMarks.SKIPPED],
+    [BallotMarks.OVERVOTE, BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.SKIPPED,
+     BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.SKIPPED]
+]
+
+
+def test_from_rank_lists():
+
+    b = BallotMatrix.from_rank_lists(ballots)
+
+    assert b.ranks.shape == (len(ballots), 8)
+    assert b.codes[:3] == [BallotMarks.SKIPPED, BallotMarks.OVERVOTE, BallotMarks.WRITEIN]
+    assert b.ranks[0, 3] == BallotMatrix.SKIPPED_CODE
+    assert b.ranks[1, 0] == BallotMatrix.OVERVOTE_CODE
+    assert b.ranks[0, 1] == BallotMatrix.WRITEIN_CODE
+    assert b.to_lists() == ballots
+    assert b.unique_candidates() == {'A', 'B', 'C', BallotMarks.WRITEIN, 'write-in', 'Tuwi', 'UWI', 'uwi'}
+
+
+def test_from_rank_lists_errors():
+
+    with pytest.raises(RuntimeError):
+        BallotMatrix.from_rank_lists([['A'], ['A', 'B']])
+
+
+def test_from_mark_index():
+
+    # a mark list with repeated and unused marks, indexed by small blocks of ballots
+    marks = list(itertools.chain.from_iterable(ballots)) + ['unused', 'A']
+    mark_index = np.array([[marks.index(mark) for mark in ballot] for ballot in ballots])
+    mark_index[:, -1] = np.where(np.array(ballots)[:, -1] == 'A', len(marks) - 1, mark_index[:, -1])
+
+    for block_rows in [1, 2, 1024]:
+        b = BallotMatrix.from_mark_index(mark_index, marks, block_rows=block_rows)
+        expected = BallotMatrix.from_rank_lists(ballots)
+        assert b.to_lists() == ballots
+        assert b.codes == expected.codes
+        assert np.array_equal(b.ranks, expected.ranks)
+
+    with pytest.raises(TypeError):
+        BallotMatrix.from_mark_index(np.arange(3), marks)
+
+
+params = [
+    ({
+        'input': 'combine',
+        'expected': [BallotMarks.combine_writein_marks(BallotMarks(b)).marks for b in ballots]
+    }),
+    ({
+        'input': 'remove',
+        'expected': [BallotMarks.remove_mark(BallotMarks(b), [BallotMarks.SKIPPED, BallotMarks.OVERVOTE]).marks
+                     for b in ballots]
+    }),
+    ({
+        'input': 'duplicate',
+        'expected': [BallotMarks.remove_duplicate_candidate_marks(BallotMarks(b)).marks for b in ballots]
+    })
+]
+
+
+@pytest.mark.parametrize("param", params)
+def test_static_methods(param):
+
+    b = BallotMatrix.from_rank_lists(ballots)
+    input_ranks = b.ranks.copy()
+
+    if param['input'] == 'combine':
+        computed = BallotMatrix.combine_writein_codes(b)
+    elif param['input'] == 'remove':
+        computed = BallotMatrix.remove_codes(b, [BallotMatrix.SKIPPED_CODE, BallotMatrix.OVERVOTE_CODE])
+    else:
+        computed = BallotMatrix.remove_duplicate_candidate_codes(b)
+
+    assert computed.to_lists() == param['expected']
+    assert np.array_equal(b.ranks, input_ranks)
+
+
+rule_names = list(BallotMarks.new_rule_set().keys())
+params = [dict(zip(rule_names, flags)) for flags in itertools.product([False, True], repeat=len(rule_names))][::7]
+
+
+@pytest.mark.parametrize("rules", params)
+def test_apply_rules(rules):
+
+    expected = [BallotMarks(b) for b in ballots]
+    for b in expected:
+        b.apply_rules(**rules)
+
+    computed = BallotMatrix.from_rank_lists(ballots)
+    computed.apply_rules(**rules)
+
+    assert computed.to_lists() == [b.marks for b in expected]
+    assert computed.inactive_types() == [b.inactive_type for b in expected]
+    assert computed.rules == rules
+
+    with pytest.raises(RuntimeError):
+        computed.apply_rules(**rules)
+
+
+def test_apply_rules_random_ballots():
+
+    rng = np.random.default_rng(12)
+    mark_choices = ['A', 'B', 'C', 'write-in', 'UWI', BallotMarks.WRITEIN,
+                    BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.OVERVOTE]
+    random_ballots = [[mark_choices[i] for i in row] for row in rng.integers(0, len(mark_choices), size=(60, 6))]
+
+    for flags in itertools.product([False, True], repeat=len(rule_names)):
+        rules = dict(zip(rule_names, flags))
+
+        expected = [BallotMarks(b) for b in random_ballots]
+        for b in expected:
+            b.apply_rules(**rules)
+
+        computed = BallotMatrix.from_rank_lists(random_ballots)
+        computed.apply_rules(**rules)
+
+        assert computed.to_lists() == [b.marks for b in expected]
+        assert computed.inactive_types() == [b.inactive_type for b in expected]
+
+
+def test_copy_on_write():
+
+    b = BallotMatrix.from_rank_lists(ballots)
+    input_ranks = b.ranks.copy()
+
+    # copies share the rank array, which can not be written in place
+    copy_b = b.copy()
+    assert np.shares_memory(copy_b.ranks, b.ranks)
+    with pytest.raises(ValueError):
+        copy_b.ranks[0, 0] = BallotMatrix.SKIPPED_CODE
+
+    # only the ballots changed by rules are stored apart from the shared array
+    rules = {'exhaust_on_duplicate_candidate_marks': True}
+    expected = [BallotMarks(ballot) for ballot in ballots]
+    for ballot in expected:
+        ballot.apply_rules(**rules)
+    changed = [ballot != marks.marks for ballot, marks in zip(ballots, expected)]
+
+    copy_b.apply_rules(**rules)
+    assert copy_b.n_changed == sum(changed) == 3
+    assert copy_b.to_lists() == [marks.marks for marks in expected]
+    assert copy_b.copy().to_lists() == copy_b.to_lists()
+    assert np.array_equal(b.ranks, input_ranks)
+
+    # rules that change nothing keep the shared array
+    copy_b = b.copy()
+    copy_b.apply_rules()
+    assert copy_b.n_changed == 0
+    assert np.shares_memory(copy_b.ranks, b.ranks)
@@ -0,0 +1,157 @@
+import pytest
+
+from rcv_cruncher.marks import BallotMarks
+from rcv_cruncher.rcv.variants import BottomsUpThresh
+
+
+params = [
+    ({
+        'input': {
+            'parsed_cvr': {
+                'ranks': [
+                    ['A', 'B', BallotMarks.SKIPPED],
+                    ['A', 'C', BallotMarks.SKIPPED],
+                    ['B', 'A', BallotMarks.SKIPPED],
+                    ['B', BallotMarks.SKIPPED, BallotMarks.SKIPPED],
+                    ['C', 'B', BallotMarks.SKIPPED],
+                    ['C', 'B', BallotMarks.SKIPPED],
+                    ['D', 'C', BallotMarks.SKIPPED]
+                ]
+            },
+            'bottoms_up_threshold': 0.2
+        },
+        'expected': {
+            'n_tabulation': 1,
+            'n_round': 2,
+            'rounds': [
+                {
+                    'A': 2,
+                    'B': 2,
+                    'C': 2,
+                    'D': 1
+                },
+                {
+                    'A': 2,
+                    'B': 2,
+                    'C': 3,
+                    'D': 0
+                }
+            ],
+            'transfers': [
+                {
+                    'A': 0,
+                    'B': 0,
+                    'C': 1,
+                    'D': -1,
+                    'exhaust': 0
+                }
+            ],
+            'by_candidate_transfers': [
+                {
+                    'D': {'C': 1}
+                }
+            ],
+            'winners': ['A', 'B', 'C']
+        }
+    }),
+    ({
+        'input': {
+            'parsed_cvr': {
+                'ranks': [
+                    ['A', 'B', BallotMarks.SKIPPED],
+                    ['A', 'C', BallotMarks.SKIPPED],
+                    ['A', BallotMarks.SKIPPED, BallotMarks.SKIPPED],
+                    ['B', 'D', BallotMarks.SKIPPED],
+                    ['B', BallotMarks.SKIPPED, BallotMarks.SKIPPED],
+                    ['C', 'D', 'A'],
+                    ['D', BallotMarks.SKIPPED, BallotMarks.SKIPPED],
+                    ['D', BallotMarks.SKIPPED, BallotMarks.SKIPPED]
+                ]
+            },
+            'bottoms_up_threshold': 0.25
+        },
+        'expected': {
+            'n_tabulation': 1,
+            'n_round': 3,
+            'rounds': [
+                {
+                    'A': 3,
+                    'B': 2,
+                    'C': 1,
+                    'D': 2
+                },
+                {
+                    'A': 3,
+                    'B': 2,
+                    'C': 0,
+                    'D': 3
+                },
+                {
+                    'A': 3,
+                    'B': 0,
+                    'C': 0,
+                    'D': 4
+                }
+            ],
+            'transfers': [
+                {
+                    'A': 0,
+                    'B': 0,
+                    'C': -1,
+                    'D': 1,
+                    'exhaust': 0
+                },
+                {
+                    'A': 0,
+                    'B': -2,
+                    'C': 0,
+                    'D': 1,
+                    'exhaust': 1
+                }
+            ],
+            'by_candidate_transfers': [
+                {
+                    'C': {'D': 1}
+                },
+                {
+                    'B': {'D': 1, 'exhaust': 1}
+                }
+            ],
+            'winners': ['A', 'D']
+        }
+    })
+]
+
+
+@pytest.mark.parametrize("param", params)
+def test_tabulation(param):
+    rcv = BottomsUpThresh(**param['input'])
+
+    # confirm tabulation num
+    n_tabulations = rcv.n_tabulations()
+    assert n_tabulations == param['expected']['n_tabulation']
+
+    # confirm round num
+    n_round = rcv.n_rounds(tabulation_num=1)
+    assert n_round == param['expected']['n_round']
+
+    # confirm round tallies
+    tally_dict = [rcv.get_round_tally_dict(round_num=i) for i in range(1, n_round + 1)]
+    tally_dict = [{k: float(v) for k, v in d.items()} for d in tally_dict]
+    assert tally_dict == param['expected']['rounds']
+
+    # confirm transfers, excluding the final round
+    transfer_dict = [rcv.get_round_transfer_dict(round_num=i) for i in range(1, n_round)]
+    transfer_dict = [{k: float(v) for k, v in d.items()} for d in transfer_dict]
+    assert transfer_dict == param['expected']['transfers']
+
+    by_candidate_transfer_dict = [rcv.get_round_transfer_dict(round_num=i, candidate_netted=False)
+                                  for i in range(1, n_round)]
+    by_candidate_transfer_dict = [{from_cand: {to_cand: float(v) for to_cand, v in d.items()}
+                                   for from_cand, d in transfers.items()}
+                                  for transfers in by_candidate_transfer_dict]
+    assert by_candidate_transfer_dict == param['expected']['by_candidate_transfers']
+
+    # confirm winners
+    winners = sorted(d['name'] for d in rcv.get_candidate_outcomes() if d['round_elected'] is not None)
+    assert winners == param['expected']['winners']
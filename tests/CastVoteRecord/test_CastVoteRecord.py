@@ -5,6 +5,8 @@ import decimal
 import pandas as pd
 import numpy as np
 
+import rcv_cruncher.util as util
+
 from rcv_cruncher.cvr.base import CastVoteRecord
 from rcv_cruncher.marks import BallotMarks
 
@@ -2028,3 +2030,170 @@ def test_split_median_rankings_used(param):
     cast_vote_record = CastVoteRecord(parsed_cvr=param['input']['cvr'], split_fields=['split'])
     computed_stat = cast_vote_record.stats(add_split_stats=True)['split_median_rankings_used'].tolist()
     assert param['expected']['stat'] == computed_stat
+
+
+def test_get_ballot_matrix():
+
+    cvr = CastVoteRecord(parsed_cvr={'ranks': add_rule_set_ballots})
+    cvr.add_rule_set('test', BallotMarks.new_rule_set(exclude_skipped_marks=True))
+
+    ballot_matrix = cvr.get_ballot_matrix('test')
+    cvr_dict = cvr.get_cvr_dict('test')
+
+    assert ballot_matrix.n_ranks == 8
+    assert ballot_matrix.to_lists() == [b.marks for b in cvr_dict['ballot_marks']]
+    assert ballot_matrix.inactive_types() == [b.inactive_type for b in cvr_dict['ballot_marks']]
+    assert cvr.get_ballot_matrix().to_lists() == add_rule_set_ballots
+
+
+def test_get_pairwise_matrix():
+
+    cvr = CastVoteRecord(parsed_cvr={
+        'ranks': [
+            ['A', 'B', 'C'],
+            ['B', 'A', BallotMarks.SKIPPED],
+            ['C', BallotMarks.OVERVOTE, 'A'],
+            ['A', 'A', 'D'],
+            [BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.SKIPPED]
+        ],
+        'weight': [1, 2, 3, 4, 5]
+    })
+    cvr.add_rule_set('test', BallotMarks.new_rule_set(exclude_overvote_marks=True, exclude_skipped_marks=True))
+
+    preferred_df, ranked_either_df = cvr.get_pairwise_matrix('test')
+
+    # A over B: ballots 1, 3 (B not ranked) and 4, B over A: ballot 2
+    assert preferred_df.at['A', 'B'] == 8
+    assert preferred_df.at['B', 'A'] == 2
+    # C over A only on ballot 3, A over C on ballots 1, 2 and 4
+    assert preferred_df.at['C', 'A'] == 3
+    assert preferred_df.at['A', 'C'] == 7
+    # D is only ranked on ballot 4, after A
+    assert preferred_df.at['D', 'A'] == 0
+    assert preferred_df.at['D', 'B'] == 4
+
+    assert ranked_either_df.at['A', 'B'] == 10
+    assert ranked_either_df.at['C', 'D'] == 8
+    assert ranked_either_df.at['A', 'A'] == 10
+
+    # symmetric pairs always add up to the ballots ranking either candidate
+    for cand1 in ['A', 'B', 'C', 'D']:
+        for cand2 in ['A', 'B', 'C', 'D']:
+            if cand1 != cand2:
+                assert preferred_df.at[cand1, cand2] + preferred_df.at[cand2, cand1] == ranked_either_df.at[cand1, cand2]
+
+    # cached per rule set
+    assert cvr.get_pairwise_matrix('test')[0] is preferred_df
+
+
+def test_stats_cache():
+
+    cvr = CastVoteRecord(jurisdiction='Town', date='11/3/2020', office='Mayor',
+                         parsed_cvr={'ranks': add_rule_set_ballots})
+
+    first = cvr.stats()
+    first['rank_limit'] = -1
+
+    # memoized result is returned as a copy
+    second = cvr.stats()
+    assert second['rank_limit'].item() == 8
+    assert cvr.stats(add_id_info=False).shape[1] == second.shape[1] - len(cvr.get_id_info())
+    assert len(cvr._stats_cache) == 2
+
+    # changing rule sets invalidates
+    cvr.add_rule_set('test', BallotMarks.new_rule_set(exclude_skipped_marks=True))
+    assert not cvr._stats_cache
+
+    assert cvr.get_rank_limit() == 8
+    assert cvr.get_id_info() == {
+        'jurisdiction': 'Town',
+        'state': '',
+        'date': '11/3/2020',
+        'year': '',
+        'office': 'Mayor',
+        'notes': '',
+        'unique_id': 'Town_11032020_Mayor'
+    }
+
+
+def test_cvr_stat_table():
+
+    rng = np.random.default_rng(3)
+    mark_choices = ['A', 'B', 'C', 'write-in', BallotMarks.WRITEIN,
+                    BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.OVERVOTE]
+    ballots = [[mark_choices[i] for i in row] for row in rng.integers(0, len(mark_choices), size=(200, 4))]
+
+    stat_table = CastVoteRecord(parsed_cvr={'ranks': ballots})._cvr_stat_table
+
+    for ballot, (_, row) in zip(ballots, stat_table.iterrows()):
+
+        candidate_marks = [mark for mark in ballot if mark not in [BallotMarks.SKIPPED, BallotMarks.OVERVOTE]]
+        no_skips_or_duplicates = BallotMarks.SKIPPED not in ballot and \
+            len(candidate_marks) == len(set(candidate_marks))
+        ranked_all = {'A', 'B', 'C'} <= set(candidate_marks)
+        first_marks = [mark for mark in ballot if mark != BallotMarks.SKIPPED]
+
+        assert row['valid_ranks_used'] == len(set(candidate_marks))
+        assert row['used_last_rank'] == (ballot[-1] != BallotMarks.SKIPPED)
+        assert row['undervote'] == (set(ballot) == {BallotMarks.SKIPPED})
+        assert row['first_round'] == (first_marks[0] if first_marks else 'NA')
+        assert row['contains_skip'] == any(x == BallotMarks.SKIPPED and y != BallotMarks.SKIPPED
+                                           for x, y in zip(ballot, ballot[1:]))
+        assert row['contains_duplicate'] == (len(candidate_marks) != len(set(candidate_marks)))
+        assert row['fully_ranked_incl_overvotes'] == (ranked_all or no_skips_or_duplicates)
+        assert row['fully_ranked_excl_overvotes'] == \
+            (ranked_all or (no_skips_or_duplicates and BallotMarks.OVERVOTE not in ballot))
+
+
+def test_weighted_median():
+
+    # decimal weights are summed and compared with the midpoint exactly
+    weights = [decimal.Decimal('0.1')] * 3 + [decimal.Decimal('0.3')]
+    assert util.weighted_median([1, 1, 1, 2], weights) == 1.5
+    assert util.weighted_median([3, 1, 2], [1, 1, 5]) == 2
+    assert util.weighted_median([2, 2], [1, 1]) == 2.0
+    assert util.weighted_median([1, 2], [0, 0]) is None
+
+
+def test_group_sums():
+
+    weights = [decimal.Decimal('0.5'), decimal.Decimal('1'), decimal.Decimal('2'), decimal.Decimal('0.25')]
+    assert util.group_sums(np.array([2, 0, 2, 0]), weights, 4) == [decimal.Decimal('1.25'), 0, decimal.Decimal('2.5'), 0]
+    assert util.group_sums(np.array([], dtype=int), [], 2, zero=decimal.Decimal('0')) == [0, 0]
+
+
+def test_split_stats_groups():
+
+    cvr = {
+        'ranks': [
+            ['A', 'B', 'C'],
+            [BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.SKIPPED],
+            ['B', BallotMarks.SKIPPED, 'A'],
+            ['C', BallotMarks.OVERVOTE, BallotMarks.SKIPPED],
+            ['A', 'B', BallotMarks.SKIPPED]
+        ],
+        'weight': [1, 2, 1, 3, 1],
+        'Precinct': ['P 2', 'P 10', 'P 2', 'P 1', 'P 1']
+    }
+    cast_vote_record = CastVoteRecord(parsed_cvr=dict(cvr), split_fields=['precinct'])
+    split_stats = cast_vote_record.stats(add_split_stats=True)
+
+    # one row per precinct in sorted order, the field matched without case
+    assert split_stats['split_field'].tolist() == ['Precinct'] * 3
+    assert split_stats['split_value'].tolist() == ['P 1', 'P 10', 'P 2']
+    assert split_stats['split_id'].tolist() == ['Precinct-P_1', 'Precinct-P_10', 'Precinct-P_2']
+
+    assert split_stats['split_total_ballots'].tolist() == [4, 2, 2]
+    assert split_stats['split_total_undervote'].tolist() == [0, 2, 0]
+    assert split_stats['split_includes_skipped_ranking'].tolist() == [0, 0, 1]
+
+    # a precinct of undervotes only has no mean or median rankings used
+    assert split_stats['split_mean_rankings_used'].isna().tolist() == [False, True, False]
+    assert split_stats['split_mean_rankings_used'].iloc[[0, 2]].tolist() == [1.25, 2.5]
+    assert split_stats['split_median_rankings_used'].iloc[[0, 2]].tolist() == [1, 2.5]
+
+    # ballots without a precinct are split out together
+    cvr['Precinct'] = ['P 2', None, 'P 2', float('nan'), None]
+    split_stats = CastVoteRecord(parsed_cvr=cvr, split_fields=['precinct']).stats(add_split_stats=True)
+    assert split_stats['split_value'].iloc[0] == 'P 2' and pd.isna(split_stats['split_value'].iloc[1])
+    assert split_stats['split_total_ballots'].tolist() == [2, 6]
@@ -3,6 +3,7 @@ import pytest
 
 from rcv_cruncher.marks import BallotMarks
 from rcv_cruncher.rcv.variants import SingleWinner
+from rcv_cruncher.util import InactiveType
 
 # testing:
 
@@ -2147,3 +2148,45 @@ params = [
 def test_split_total_posttally_exhausted_by_duplicate_rankings(param):
     rcv = SingleWinner(**param['input'])
     assert rcv.stats(add_split_stats=True)[0]['split_total_posttally_exhausted_by_duplicate_rankings'].tolist() == param['expected']['stat']
+
+
+def test_stats_cache():
+
+    rcv = SingleWinner(parsed_cvr={'ranks': [['A', 'B'], ['B', 'A'], ['A', BallotMarks.SKIPPED]]})
+
+    first = rcv.stats()
+    first[0]['winner'] = 'B'
+
+    assert rcv.stats()[0]['winner'].item() == 'A'
+    assert rcv.stats(keep_decimal_type=True)[0]['winner'].item() == 'A'
+    assert len(rcv._stats_cache) == 2
+
+
+@pytest.mark.parametrize("compress", [False, True])
+def test_exhaustion_categories(compress):
+
+    # A wins after D then C are eliminated, the rank limit of 2 is restrictive with 4 candidates
+    ballots = [
+        (['A', 'B'], 6, InactiveType.NOT_EXHAUSTED),
+        (['B', 'A'], 5, InactiveType.NOT_EXHAUSTED),
+        (['C', BallotMarks.OVERVOTE], 1, InactiveType.POSTTALLY_EXHAUSTED_BY_OVERVOTE),
+        (['C', BallotMarks.SKIPPED], 2, InactiveType.POSTTALLY_EXHAUSTED_BY_ABSTENTION),
+        (['D', 'D'], 1, InactiveType.POSTTALLY_EXHAUSTED_BY_DUPLICATE_RANKING),
+        (['D', 'C'], 1, InactiveType.POSTTALLY_EXHAUSTED_BY_RANK_LIMIT),
+        ([BallotMarks.SKIPPED, BallotMarks.SKIPPED], 1, InactiveType.UNDERVOTE),
+        ([BallotMarks.OVERVOTE, 'A'], 1, InactiveType.PRETALLY_EXHAUST)
+    ]
+    ranks = [b for b, count, _ in ballots for _ in range(count)]
+    expected = [exhaust_type for _, count, exhaust_type in ballots for _ in range(count)]
+
+    rcv = SingleWinner(parsed_cvr={'ranks': ranks}, compress_ballots=compress,
+                       exhaust_on_overvote_marks=True, exhaust_on_duplicate_candidate_marks=True)
+    computed = [rcv.EXHAUSTION_TYPES[code] for code in rcv._exhaustion_categories(tabulation_num=1).tolist()]
+    assert computed == expected
+
+    stats = rcv.stats()[0]
+    assert stats['winner'].item() == 'A'
+    assert stats['total_pretally_exhausted'].item() == 1
+    assert stats['total_posttally_exhausted'].item() == 5
+    assert stats['total_posttally_exhausted_by_abstention'].item() == 2
+    assert stats['total_posttally_exhausted_by_rank_limit'].item() == 1
@@ -0,0 +1,46 @@
+
+import random
+import decimal
+
+import numpy as np
+
+from rcv_cruncher.marks import BallotMarks
+
+
+def random_cvr(seed, n_ballots=300, n_ranks=5, n_candidates=5, n_patterns=None, weighted=False):
+    """
+    Parsed cvr dict of random ballots drawn from a skewed mark distribution, with a 'precinct' split field.
+    If n_patterns is given, ballots repeat that many distinct rankings. Weighted ballots get weights in quarter steps.
+    """
+
+    rng = np.random.default_rng(seed)
+    candidates = [chr(ord('A') + i) for i in range(n_candidates)]
+    mark_choices = candidates + ['write-in', BallotMarks.SKIPPED, BallotMarks.OVERVOTE]
+    mark_p = rng.random(len(mark_choices)) ** 2
+    mark_p /= mark_p.sum()
+
+    n_rows = n_patterns or n_ballots
+    rows = [[mark_choices[i] for i in row] for row in rng.choice(len(mark_choices), size=(n_rows, n_ranks), p=mark_p)]
+    if n_patterns:
+        rows = [rows[i] for i in rng.integers(0, n_patterns, size=n_ballots)]
+
+    cvr = {
+        'ranks': rows,
+        'precinct': rng.integers(0, 4, size=n_ballots).tolist()
+    }
+    if weighted:
+        cvr['weight'] = [decimal.Decimal(int(i)) / 4 for i in rng.integers(1, 40, size=n_ballots)]
+    return cvr
+
+
+def crunch_each(rcv_class, seed, option, values, cvr_kwargs=None, **kwargs):
+    """
+    Run rcv_class on the same random cvr once per value of the keyword option, reseeding the tie breaks each time,
+    so each run can be compared against the first.
+    """
+    results = []
+    for value in values:
+        random.seed(seed)
+        cvr = random_cvr(seed, **(cvr_kwargs or {}))
+        results.append(rcv_class(parsed_cvr=cvr, **{option: value}, **kwargs))
+    return results
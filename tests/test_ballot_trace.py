@@ -0,0 +1,111 @@
+
+import pytest
+
+from rcv_cruncher.rcv.trace import BallotTrace
+from rcv_cruncher.rcv.variants import SingleWinner, Sequential, STVFractionalBallot
+
+from random_ballots import crunch_each
+
+
+params = [
+    (SingleWinner, {}, 1, False),
+    (SingleWinner, {}, 2, True),
+    (Sequential, {'n_winners': 2}, 3, False),
+    (STVFractionalBallot, {'n_winners': 2}, 4, False),
+    (STVFractionalBallot, {'n_winners': 2}, 5, True),
+]
+
+
+@pytest.mark.parametrize("rcv_class, kwargs, seed, compress", params)
+def test_trace_levels(rcv_class, kwargs, seed, compress):
+
+    cvr_kwargs = {'n_ballots': 200, 'n_ranks': 4, 'weighted': True}
+    results = dict(zip(BallotTrace.LEVELS, crunch_each(rcv_class, seed, 'trace_level', BallotTrace.LEVELS,
+                                                       cvr_kwargs=cvr_kwargs, compress_ballots=compress, **kwargs)))
+
+    full = results['full']
+    for iTab in range(1, full.n_tabulations() + 1):
+
+        n_rounds = full.n_rounds(tabulation_num=iTab)
+        round_elected = {outcome['name']: outcome['round_elected'] for outcome in full.get_candidate_outcomes(tabulation_num=iTab)}
+
+        for round_num in range(1, n_rounds + 1):
+            allocation = full.get_round_allocation(round_num, tabulation_num=iTab)
+            weights = full.get_round_weights(round_num, tabulation_num=iTab)
+            assert len(allocation) == len(weights) == 200
+
+            # the round allocation recovers the round tally,
+            # apart from the quota kept by candidates elected in earlier rounds
+            tally = {}
+            for candidate, weight in zip(allocation, weights):
+                if candidate != 'exhaust':
+                    tally[candidate] = tally.get(candidate, 0) + weight
+            expected_tally = full.get_round_tally_dict(round_num, tabulation_num=iTab)
+            assert tally == pytest.approx({cand: v for cand, v in expected_tally.items()
+                                           if v and (round_elected[cand] or n_rounds) >= round_num})
+
+        for trace_level, rcv in results.items():
+            assert rcv.get_initial_weights(tabulation_num=iTab) == full.get_initial_weights(tabulation_num=iTab)
+            assert rcv.get_final_weights(tabulation_num=iTab) == full.get_final_weights(tabulation_num=iTab)
+            assert rcv.get_final_ranks(tabulation_num=iTab) == full.get_final_ranks(tabulation_num=iTab)
+
+        final_allocation = results['final_only'].get_round_allocation(n_rounds, tabulation_num=iTab)
+        assert final_allocation == full.get_round_allocation(n_rounds, tabulation_num=iTab)
+
+        if n_rounds > 2:
+            with pytest.raises(RuntimeError):
+                results['final_only'].get_round_weights(2, tabulation_num=iTab)
+        with pytest.raises(RuntimeError):
+            results['none'].get_round_allocation(n_rounds, tabulation_num=iTab)
+
+    for rcv in results.values():
+        assert rcv.stats()[0].equals(full.stats()[0])
+
+
+def test_final_only_piles(monkeypatch):
+
+    allocations = []
+    add_round = BallotTrace.add_round
+
+    def spy_add_round(trace, allocation, weights):
+        allocations.append(allocation)
+        add_round(trace, allocation, weights)
+
+    monkeypatch.setattr(BallotTrace, 'add_round', spy_add_round)
+
+    full, final_only = crunch_each(SingleWinner, 6, 'trace_level', ['full', 'final_only'],
+                                   cvr_kwargs={'n_ballots': 200, 'n_ranks': 4})
+    n_rounds = final_only.n_rounds()
+    assert n_rounds > 2
+
+    # the piles engine hands over its live allocation list every round instead of a copy
+    final_only_allocations = allocations[n_rounds:]
+    assert all(allocation is final_only_allocations[0] for allocation in final_only_allocations)
+
+    # no allocation is held for intermediate rounds
+    trace = final_only._tabulations[0]['ballot_trace']
+    assert not trace._round_allocations
+    for round_num in range(1, n_rounds):
+        with pytest.raises(RuntimeError):
+            final_only.get_round_allocation(round_num)
+    assert final_only.get_round_allocation(n_rounds) == full.get_round_allocation(n_rounds)
+
+
+def test_ballot_trace():
+
+    trace = BallotTrace()
+    weights = [1, 1, 1]
+    trace.add_round(['A', 'B', 'A'], weights)
+    trace.add_round(['A', 'A', 'A'], weights)
+    trace.add_round(['A', 'A', 'exhaust'], [1, 0.5, 1])
+
+    assert trace.allocation(1) == ['A', 'B', 'A']
+    assert trace.allocation(3) == ['A', 'A', 'exhaust']
+    assert trace.weights(2) == [1, 1, 1]
+    assert trace.weights(3) == [1, 0.5, 1]
+
+    with pytest.raises(RuntimeError):
+        trace.weights(4)
+
+    with pytest.raises(RuntimeError):
+        BallotTrace('some')
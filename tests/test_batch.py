@@ -0,0 +1,163 @@
+
+import copy
+import csv
+import io
+import os
+import pathlib
+import random
+
+import rcv_cruncher.batch as batch
+import rcv_cruncher.parsers as parsers
+import rcv_cruncher.util as util
+from rcv_cruncher.rcv.variants import SingleWinner
+
+dir_path = pathlib.Path(os.path.dirname(os.path.realpath(__file__)))
+
+
+def test_grouped_contests():
+
+    cvr_path = dir_path / 'parser_test_files/dominion5_10/test1'
+
+    contest_set = [
+        {'rcv_type': SingleWinner, 'office': office, 'parser_func': parsers.dominion5_10,
+         'parser_args': {'cvr_path': cvr_path, 'office': office}}
+        for office in ['Mayor', 'Council', 'Mayor']
+    ]
+    batch.group_contests(contest_set)
+
+    assert all(contest['contest_group'][1] == ['Mayor', 'Council', 'Mayor'] for contest in contest_set)
+
+    for contest in contest_set:
+        rcv = batch.new_rcv_contest(contest)
+        expected = SingleWinner(office=contest['office'],
+                                parser_func=parsers.dominion5_10,
+                                parser_args=contest['parser_args'])
+        cvr_dict, expected_cvr_dict = rcv.get_cvr_dict(), expected.get_cvr_dict()
+        assert [bm.marks for bm in cvr_dict.pop('ballot_marks')] == \
+            [bm.marks for bm in expected_cvr_dict.pop('ballot_marks')]
+        assert {k: list(v) for k, v in cvr_dict.items()} == {k: list(v) for k, v in expected_cvr_dict.items()}
+        assert rcv.get_round_tally_tuple(1) == expected.get_round_tally_tuple(1)
+
+    # every grouped contest has been built, so the shared parse is released
+    assert not batch.parsed_contest_groups
+
+
+def test_ungrouped_contests():
+
+    cvr_path = dir_path / 'parser_test_files/dominion5_10/test1'
+
+    contest_set = [
+        {'rcv_type': SingleWinner, 'parser_func': parsers.dominion5_10,
+         'parser_args': {'cvr_path': cvr_path, 'office': 'Mayor'}},
+        {'rcv_type': SingleWinner, 'parser_func': parsers.dominion5_10,
+         'parser_args': {'cvr_path': cvr_path / 'other', 'office': 'Council'}}
+    ]
+    batch.group_contests(contest_set)
+
+    assert not any('contest_group' in contest for contest in contest_set)
+
+
+def test_crunch_steps_lazy_stats(tmp_path):
+
+    cvr_path = dir_path / 'parser_test_files/dominion5_10/test1'
+    contest = {'rcv_type': SingleWinner, 'jurisdiction': 'j', 'date': 'd', 'office': 'Mayor',
+               'parser_func': parsers.dominion5_10, 'parser_args': {'cvr_path': cvr_path, 'office': 'Mayor'}}
+
+    # round by round output alone does not need any stat table
+    steps = batch.CrunchSteps(contest, {'round_by_round_json': True}, tmp_path, tmp_path, '', quiet=True)
+    steps.run_steps()
+    rcv = steps.return_results()['rcv_object']
+
+    assert steps.return_results()['n_errors'] == 0
+    assert list((tmp_path / 'round_by_round_json').iterdir())
+    assert not rcv._stat_tables
+
+    # stats are computed on first use
+    stats = rcv.stats()[0]
+    assert set(rcv._stat_tables) == {'cvr', 'summary_cvr', 'contest', 'summary_contest'}
+    assert stats.equals(batch.new_rcv_contest(contest).stats()[0])
+
+
+def test_crunch_contest_set_jobs(tmp_path, monkeypatch):
+
+    # inputs/ needs the installed package metadata and holds run times, neither of which is compared here
+    monkeypatch.setattr(batch, 'write_input_dir', lambda *args: None)
+    # the long path prefix is windows only, forked worker processes inherit the patch
+    if os.name != 'nt':
+        monkeypatch.setattr(util, 'longname', lambda path: pathlib.Path(path).resolve())
+
+    cvr_dir = tmp_path / 'cvr'
+    cvr_dir.mkdir()
+    (cvr_dir / 'ward-1.csv').write_text('rank1,rank2,rank3\nA,B,C\nB,A,\nC,,A\nA,C,B\nB,C,A\n')
+
+    contest_set_dir = tmp_path / 'contest_set'
+    contest_set_dir.mkdir()
+    outputs = ['per_rcv_type_stats', 'per_rcv_group_stats', 'candidate_details', 'round_by_round_table',
+               'round_by_round_json', 'first_choice_to_finalist', 'condorcet', 'rank_usage',
+               'winner_choice_position_distribution']
+    (contest_set_dir / 'run_config.txt').write_text(
+        ''.join(f'{output} = true\n' for output in outputs) + f'cvr_path_root = {cvr_dir}\n')
+
+    # the two dominion contests share one parse and are crunched together, around an erroring contest
+    dominion_path = dir_path / 'parser_test_files/dominion5_10/test1'
+    (contest_set_dir / 'contest_set.csv').write_text(
+        'jurisdiction,state,date,year,office,rcv_type,parser_func,cvr_path,notes,extra_parser_args\n'
+        f'City,ST,11/2/2021,2021,Mayor,SingleWinner,dominion5_10,{dominion_path},x,office=Mayor;\n'
+        'City,ST,11/2/2021,2021,Ward 1,SingleWinner,rank_column,ward-1.csv,x,;\n'
+        'City,ST,11/2/2021,2021,Ward 2,SingleWinner,rank_column,missing.csv,x,;\n'
+        f'City,ST,11/2/2021,2021,Council,SingleWinner,dominion5_10,{dominion_path},x,office=Council;\n')
+
+    contest_set, run_config = batch.read_contest_set(contest_set_dir)
+    assert [contest['office'] for contest in contest_set if contest.get('contest_group')] == ['Mayor', 'Council']
+
+    def crunch(jobs):
+        output_dir = tmp_path / f'output_{jobs}'
+        output_dir.mkdir()
+        batch.crunch_contest_set(copy.deepcopy(contest_set), run_config, output_dir, jobs=jobs)
+        return {str(fpath.relative_to(output_dir)): fpath.read_bytes()
+                for fpath in sorted(output_dir.rglob('*')) if fpath.is_file()}
+
+    serial, parallel = crunch(1), crunch(2)
+    assert serial == parallel
+
+    # aggregated stats follow the contest set order, with the grouped contests apart
+    stat_rows = list(csv.DictReader(io.StringIO(serial['results/SingleWinner.csv'].decode('utf8'))))
+    assert [row['office'] for row in stat_rows] == ['Mayor', 'Ward 1', 'Council']
+
+    # only the contest with a missing cvr fails, its rows are logged once and in step order
+    error_rows = list(csv.reader(io.StringIO(serial['results/error_log.csv'].decode('utf8'))))[1:]
+    assert [row[:2] for row in error_rows] == [['City_11/2/2021_Ward 2', step]
+                                               for step in ['init_rcv', 'condorcet', 'rank_usage']]
+    assert any(fpath.startswith('results/round_by_round_json') for fpath in serial)
+
+
+def test_crunch_contest_set_ties(tmp_path, monkeypatch):
+
+    monkeypatch.setattr(batch, 'write_input_dir', lambda *args: None)
+    if os.name != 'nt':
+        monkeypatch.setattr(util, 'longname', lambda path: pathlib.Path(path).resolve())
+
+    # B and C tie for last, whichever is eliminated hands the win to the other
+    cvr_dir = tmp_path / 'cvr'
+    cvr_dir.mkdir()
+    (cvr_dir / 'tie.csv').write_text('rank1,rank2\nA,\nA,\nA,\nB,C\nB,C\nC,B\nC,B\n')
+
+    contest_set_dir = tmp_path / 'contest_set'
+    contest_set_dir.mkdir()
+    (contest_set_dir / 'run_config.txt').write_text(f'per_rcv_type_stats = true\ncvr_path_root = {cvr_dir}\n')
+    (contest_set_dir / 'contest_set.csv').write_text(
+        'jurisdiction,state,date,year,office,rcv_type,parser_func,cvr_path,notes,extra_parser_args\n' +
+        ''.join(f'City,ST,11/2/2021,2021,Ward {ward},SingleWinner,rank_column,tie.csv,x,;\n' for ward in range(8)))
+    contest_set, run_config = batch.read_contest_set(contest_set_dir)
+
+    def winners(jobs, seed):
+        output_dir = tmp_path / f'output_{jobs}_{seed}'
+        output_dir.mkdir()
+        random.seed(seed)
+        batch.crunch_contest_set(copy.deepcopy(contest_set), run_config, output_dir, jobs=jobs)
+        with open(output_dir / 'results/SingleWinner.csv', encoding='utf8') as stats_file:
+            return [row['winner'] for row in csv.DictReader(stats_file)]
+
+    serial = winners(1, 0)
+    assert set(serial) <= {'B', 'C'}
+    assert winners(1, 1) == winners(2, 2) == serial
@@ -0,0 +1,52 @@
+
+import pytest
+import pandas as pd
+
+from rcv_cruncher.rcv.variants import SingleWinner, Sequential, Until2, BottomsUpThresh, STVFractionalBallot, STVWholeBallot
+
+from random_ballots import crunch_each, random_cvr
+
+
+params = [
+    (SingleWinner, {}, 1, False),
+    (SingleWinner, {'exhaust_on_overvote_marks': True, 'exhaust_on_repeated_skipped_marks': True}, 2, True),
+    (Until2, {'exhaust_on_duplicate_candidate_marks': True}, 3, True),
+    (Sequential, {'n_winners': 3}, 4, True),
+    (STVFractionalBallot, {'n_winners': 2}, 5, True),
+    (BottomsUpThresh, {'bottoms_up_threshold': 0.15}, 6, False),
+    (BottomsUpThresh, {'bottoms_up_threshold': 0.1}, 7, True),
+]
+
+
+@pytest.mark.parametrize("rcv_class, rules, seed, weighted", params)
+def test_compressed_ballots(rcv_class, rules, seed, weighted):
+
+    results = crunch_each(rcv_class, seed, 'compress_ballots', [False, True],
+                          cvr_kwargs={'n_patterns': 40, 'weighted': weighted}, split_fields=['precinct'], **rules)
+
+    expected, computed = results
+    assert computed.n_tabulations() == expected.n_tabulations()
+
+    for iTab in range(1, expected.n_tabulations() + 1):
+
+        assert computed.get_candidate_outcomes(tabulation_num=iTab) == expected.get_candidate_outcomes(tabulation_num=iTab)
+        assert computed.get_initial_ranks(tabulation_num=iTab) == expected.get_initial_ranks(tabulation_num=iTab)
+        assert computed.get_final_ranks(tabulation_num=iTab) == expected.get_final_ranks(tabulation_num=iTab)
+        assert computed.get_initial_weights(tabulation_num=iTab) == expected.get_initial_weights(tabulation_num=iTab)
+        assert computed.get_final_weights(tabulation_num=iTab) == pytest.approx(expected.get_final_weights(tabulation_num=iTab))
+
+        for round_num in range(1, expected.n_rounds(tabulation_num=iTab) + 1):
+            expected_tally = expected.get_round_tally_dict(round_num, tabulation_num=iTab)
+            computed_tally = computed.get_round_tally_dict(round_num, tabulation_num=iTab)
+            assert {k: float(v) for k, v in computed_tally.items()} == \
+                pytest.approx({k: float(v) for k, v in expected_tally.items()})
+
+    for expected_df, computed_df in zip(expected.stats(add_split_stats=True), computed.stats(add_split_stats=True)):
+        pd.testing.assert_frame_equal(computed_df, expected_df)
+
+
+def test_compressed_whole_ballot_stv():
+
+    # whole ballot transfers need individual ballots, so compression is refused even with unit weights
+    with pytest.raises(RuntimeError, match='compress_ballots'):
+        STVWholeBallot(parsed_cvr=random_cvr(8, n_patterns=40), n_winners=2, compress_ballots=True)
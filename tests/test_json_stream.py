@@ -0,0 +1,57 @@
+
+import json
+
+import pytest
+
+from rcv_cruncher.json_stream import (PrefetchReader, iter_json_array)
+
+sessions = [
+    {'RecordId': 1, 'ImageMask': 'D:\\NAS\\Images\\00001_00001_000001*.*', 'Weight': 1.25, 'Marks': []},
+    {'RecordId': 22, 'Text': 'quote " and brace } inside a string', 'Marks': [{'Rank': 1, 'IsAmbiguous': False}]},
+    {'RecordId': 333, 'Nested': {'Sessions': [1, 2]}, 'Value': None, 'Flag': True},
+    12345,
+    'last'
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64, 1 << 20])
+@pytest.mark.parametrize("indent", [None, 2])
+def test_iter_json_array(tmp_path, chunk_size, indent):
+
+    export = {'Version': '5.10', 'Count': 10, 'Sessions': sessions, 'After': {'x': [1, 2, 3]}}
+    fpath = tmp_path / 'CvrExport.json'
+    fpath.write_text(json.dumps(export, indent=indent), encoding='utf8')
+
+    assert list(iter_json_array(fpath, 'Sessions', chunk_size=chunk_size)) == sessions
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 20])
+def test_iter_json_array_edges(tmp_path, chunk_size):
+
+    fpath = tmp_path / 'CvrExport.json'
+
+    fpath.write_text('\ufeff{"Sessions": []}', encoding='utf8')
+    assert list(iter_json_array(fpath, 'Sessions', chunk_size=chunk_size)) == []
+
+    fpath.write_text('{"Version": 1}', encoding='utf8')
+    with pytest.raises(KeyError):
+        list(iter_json_array(fpath, 'Sessions', chunk_size=chunk_size))
+
+    fpath.write_text('{"Sessions": [{"a": 1}, {"a": 2}', encoding='utf8')
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_json_array(fpath, 'Sessions', chunk_size=chunk_size))
+
+
+def test_prefetch_reader(tmp_path):
+
+    fpath = tmp_path / 'CvrExport.json'
+    fpath.write_text(json.dumps({'Sessions': sessions}), encoding='utf8')
+
+    with PrefetchReader(open(fpath, encoding='utf8'), chunk_size=5, depth=2) as f:
+        assert list(iter_json_array(f, 'Sessions')) == sessions
+
+    # closing before the file is read to the end stops the read ahead thread
+    reader = PrefetchReader(open(fpath, encoding='utf8'), chunk_size=1, depth=1)
+    assert next(iter_json_array(reader, 'Sessions')) == sessions[0]
+    reader.close()
+    assert not reader.thread.is_alive()
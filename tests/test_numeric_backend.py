@@ -0,0 +1,105 @@
+
+import pytest
+import decimal
+
+import pandas as pd
+
+from rcv_cruncher.numeric import get_numeric_backend
+from rcv_cruncher.rcv.variants import SingleWinner, Sequential, Until2, BottomsUpThresh, STVFractionalBallot
+
+from random_ballots import crunch_each, random_cvr
+
+
+def test_backends():
+
+    weight = decimal.Decimal('2.5')
+
+    assert get_numeric_backend('decimal').to_internal(weight) == weight
+    assert get_numeric_backend('int').to_internal(decimal.Decimal('3')) == 3
+    assert get_numeric_backend('fixed', fixed_point_places=3).to_internal(weight) == 2500
+    assert get_numeric_backend('fixed', fixed_point_places=3).to_external(2500) == weight
+    assert get_numeric_backend('fixed', fixed_point_places=0).to_internal(weight) == 2
+
+    # fixed point splits round the passed on share down and never lose weight
+    kept, passed_on = get_numeric_backend('fixed').split_weight(1000000, 1, 3)
+    assert (kept, passed_on) == (666667, 333333)
+
+    with pytest.raises(RuntimeError):
+        get_numeric_backend('float')
+
+    with pytest.raises(RuntimeError):
+        get_numeric_backend('int').to_internal(weight)
+
+    with pytest.raises(RuntimeError):
+        get_numeric_backend('int').split_weight(1, 1, 2)
+
+
+params = [
+    (SingleWinner, {}, 'int', False, 1),
+    (Until2, {}, 'int', False, 2),
+    (Sequential, {'n_winners': 3}, 'int', False, 3),
+    (BottomsUpThresh, {'bottoms_up_threshold': 0.15}, 'int', False, 4),
+    (SingleWinner, {}, 'fixed', True, 5),
+    (Sequential, {'n_winners': 2, 'compress_ballots': True}, 'fixed', True, 6),
+]
+
+
+@pytest.mark.parametrize("rcv_class, kwargs, numeric_backend, weighted, seed", params)
+def test_whole_ballot_backends_match_decimal(rcv_class, kwargs, numeric_backend, weighted, seed):
+
+    results = crunch_each(rcv_class, seed, 'numeric_backend', ['decimal', numeric_backend],
+                          cvr_kwargs={'n_candidates': 6, 'weighted': weighted}, split_fields=['precinct'], **kwargs)
+    expected, computed = results
+
+    assert computed.n_tabulations() == expected.n_tabulations()
+    for iTab in range(1, expected.n_tabulations() + 1):
+
+        assert computed.get_candidate_outcomes(tabulation_num=iTab) == expected.get_candidate_outcomes(tabulation_num=iTab)
+        assert computed.get_final_weights(tabulation_num=iTab) == expected.get_final_weights(tabulation_num=iTab)
+        assert computed.get_final_weight_distrib(tabulation_num=iTab) == \
+            expected.get_final_weight_distrib(tabulation_num=iTab)
+
+        for round_num in range(1, expected.n_rounds(tabulation_num=iTab) + 1):
+            assert computed.get_round_tally_dict(round_num, tabulation_num=iTab) == \
+                expected.get_round_tally_dict(round_num, tabulation_num=iTab)
+
+        for round_num in range(1, expected.n_rounds(tabulation_num=iTab)):
+            assert computed.get_round_transfer_dict(round_num, tabulation_num=iTab) == \
+                expected.get_round_transfer_dict(round_num, tabulation_num=iTab)
+            assert computed.get_round_transfer_dict(round_num, candidate_netted=False, tabulation_num=iTab) == \
+                expected.get_round_transfer_dict(round_num, candidate_netted=False, tabulation_num=iTab)
+
+    # integer backends report whole number stats as ints rather than floats
+    for expected_df, computed_df in zip(expected.stats(add_split_stats=True), computed.stats(add_split_stats=True)):
+        pd.testing.assert_frame_equal(computed_df, expected_df, check_dtype=False)
+
+
+def test_fixed_fractional_stv():
+
+    results = crunch_each(STVFractionalBallot, 7, 'numeric_backend', ['decimal', 'fixed'],
+                          cvr_kwargs={'n_candidates': 6, 'weighted': True}, n_winners=3, fixed_point_places=8)
+    expected, computed = results
+
+    for computed_outcome, expected_outcome in zip(computed.get_candidate_outcomes(), expected.get_candidate_outcomes()):
+        assert computed_outcome['name'] == expected_outcome['name']
+        assert computed_outcome['round_elected'] == expected_outcome['round_elected']
+        assert computed_outcome['round_eliminated'] == expected_outcome['round_eliminated']
+
+    # no weight is lost when splitting ballots
+    for weight_distrib, initial_weight in zip(computed.get_final_weight_distrib(), computed.get_initial_weights()):
+        assert sum(weight for _, weight in weight_distrib) == initial_weight
+
+    for round_num in range(1, expected.n_rounds() + 1):
+        expected_tally = expected.get_round_tally_dict(round_num)
+        computed_tally = computed.get_round_tally_dict(round_num)
+        assert {k: float(v) for k, v in computed_tally.items()} == \
+            pytest.approx({k: float(v) for k, v in expected_tally.items()}, abs=1e-5)
+
+
+def test_int_backend_errors():
+
+    with pytest.raises(RuntimeError):
+        SingleWinner(parsed_cvr=random_cvr(8, weighted=True), numeric_backend='int')
+
+    with pytest.raises(RuntimeError):
+        STVFractionalBallot(parsed_cvr=random_cvr(8), n_winners=3, numeric_backend='int')
@@ -0,0 +1,149 @@
+
+import decimal
+import importlib
+import math
+import os
+import pathlib
+import sys
+
+import rcv_cruncher.batch as batch
+import rcv_cruncher.parse_cache as parse_cache
+import rcv_cruncher.parsers as parsers
+from rcv_cruncher.marks import BallotMarks
+from rcv_cruncher.matrix import BallotMatrix
+from rcv_cruncher.rcv.variants import SingleWinner
+
+dir_path = pathlib.Path(os.path.dirname(os.path.realpath(__file__)))
+
+
+def test_round_trip(tmp_path):
+
+    parsed_cvr = {
+        'ranks': [['A', 'B', BallotMarks.SKIPPED], ['B', BallotMarks.OVERVOTE, 'C'], ['C', 'A', 'B']],
+        'weight': [decimal.Decimal('1'), decimal.Decimal('0.5'), decimal.Decimal('2.25')],
+        'precinct': ['P1', None, 'P1'],
+        'ballot_number': [1, 2, 3],
+        'score': [0.5, float('nan'), float('nan')],
+        'absentee': [True, False, True]
+    }
+
+    stored = parse_cache.save_parsed_cvr(tmp_path, 'key', parsed_cvr)
+    assert isinstance(stored['ranks'], BallotMatrix)
+
+    loaded = parse_cache.load_parsed_cvr(tmp_path, 'key')
+    assert loaded['ranks'].to_lists() == parsed_cvr['ranks']
+    assert loaded['weight'] == parsed_cvr['weight']
+    assert loaded['precinct'] == parsed_cvr['precinct']
+    assert loaded['ballot_number'] == parsed_cvr['ballot_number']
+    assert loaded['score'][0] == 0.5 and math.isnan(loaded['score'][1]) and math.isnan(loaded['score'][2])
+    assert loaded['absentee'] == parsed_cvr['absentee']
+
+    assert parse_cache.load_parsed_cvr(tmp_path, 'other_key') is None
+
+
+def test_uncacheable_columns(tmp_path):
+
+    parsed_cvr = {
+        'ranks': [['A', 'B'], ['B', 'A']],
+        'weight': [decimal.Decimal('1'), decimal.Decimal('1')],
+        'extra': [decimal.Decimal('1'), decimal.Decimal('2')]
+    }
+
+    assert parse_cache.save_parsed_cvr(tmp_path, 'key', parsed_cvr) is parsed_cvr
+    assert parse_cache.load_parsed_cvr(tmp_path, 'key') is None
+
+
+def test_cached_parse(tmp_path):
+
+    cvr_file = tmp_path / 'input' / 'cvr.csv'
+    cvr_file.parent.mkdir()
+    cvr_file.write_text('id,rank1,rank2\n1,A,B\n2,B,A\n3,A,C\n')
+
+    cache_dir = tmp_path / 'cache'
+    parser_args = {'cvr_path': cvr_file}
+
+    first = parse_cache.cached_parse(parsers.rank_column, parser_args, cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+
+    second = parse_cache.cached_parse(parsers.rank_column, parser_args, cache_dir)
+    assert second['ranks'].to_lists() == first['ranks'].to_lists() == [['A', 'B'], ['B', 'A'], ['A', 'C']]
+    assert list(second['id']) == first['id'].tolist() == [1, 2, 3]
+    assert len(os.listdir(cache_dir)) == 1
+
+    # changed input files give a new entry
+    cvr_file.write_text('rank1,rank2\nA,B\nB,A\nC,A\n')
+    os.utime(cvr_file, ns=(0, 0))
+    third = parse_cache.cached_parse(parsers.rank_column, parser_args, cache_dir)
+    assert third['ranks'].to_lists() == [['A', 'B'], ['B', 'A'], ['C', 'A']]
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_changed_parser_key(tmp_path, monkeypatch):
+
+    parser_file = tmp_path / 'changing_parser.py'
+    parser_file.write_text("def parse(cvr_path):\n    return {'ranks': [['UWI']]}\n")
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+    module = importlib.import_module('changing_parser')
+    parse = module.parse
+
+    cache_dir = tmp_path / 'cache'
+    parser_args = {'cvr_path': str(tmp_path / 'cvr.csv')}
+    key = parse_cache.cache_key(parse, parser_args)
+    assert parse_cache.cache_key(parse, parser_args) == key
+    assert parse_cache.cached_parse(parse, parser_args, cache_dir)['ranks'].to_lists() == [['UWI']]
+
+    # only a constant changes, the bytecode stays the same
+    parser_file.write_text("def parse(cvr_path):\n    return {'ranks': [['XYZ']]}\n")
+    changed_parse = importlib.reload(module).parse
+    assert changed_parse.__code__.co_code == parse.__code__.co_code
+    assert parse_cache.cache_key(changed_parse, parser_args) != key
+    assert parse_cache.cached_parse(changed_parse, parser_args, cache_dir)['ranks'].to_lists() == [['XYZ']]
+    assert len(os.listdir(cache_dir)) == 2
+
+    sys.modules.pop('changing_parser', None)
+
+    # the one line dominion wrappers are unchanged, but a decoding fix in the dominion module changes the key
+    key = parse_cache.cache_key(parsers.dominion5_10, parser_args)
+    fixed_dominion = tmp_path / 'dominion.py'
+    fixed_dominion.write_text(pathlib.Path(sys.modules['rcv_cruncher.dominion'].__file__).read_text() + '\n# fix\n')
+    monkeypatch.setattr(sys.modules['rcv_cruncher.dominion'], '__file__', str(fixed_dominion))
+
+    # fingerprints are computed once per parser and process
+    assert parse_cache.cache_key(parsers.dominion5_10, parser_args) == key
+    parse_cache.parser_fingerprint.cache_clear()
+    assert parse_cache.cache_key(parsers.dominion5_10, parser_args) != key
+
+    monkeypatch.undo()
+    parse_cache.parser_fingerprint.cache_clear()
+
+
+def test_cached_contests(tmp_path):
+
+    cvr_path = dir_path / 'parser_test_files/dominion5_10/test1'
+
+    def make_contest_set(cache_dir):
+        contest_set = [
+            {'rcv_type': SingleWinner, 'office': office, 'parser_func': parsers.dominion5_10,
+             'parser_args': {'cvr_path': cvr_path, 'office': office}, 'cvr_cache_dir': cache_dir}
+            for office in ['Mayor', 'Council']
+        ]
+        batch.group_contests(contest_set)
+        return contest_set
+
+    expected = [batch.new_rcv_contest(contest) for contest in make_contest_set(None)]
+
+    # the first run fills the cache from the grouped parse, the second reads it
+    for _ in range(2):
+        for contest, expected_rcv in zip(make_contest_set(tmp_path), expected):
+            rcv = batch.new_rcv_contest(contest)
+            assert rcv.cvr_table().equals(expected_rcv.cvr_table())
+            assert rcv.get_round_tally_tuple(1) == expected_rcv.get_round_tally_tuple(1)
+
+    assert len(os.listdir(tmp_path)) == 2
+
+    # ungrouped contests share the entries
+    contest = make_contest_set(tmp_path)[0]
+    del contest['contest_group']
+    assert batch.new_rcv_contest(contest).cvr_table().equals(expected[0].cvr_table())
+    assert len(os.listdir(tmp_path)) == 2
@@ -1,14 +1,28 @@
 
 import pytest
+import decimal
+import json
 import os
 import pathlib
+import zipfile
 
+import numpy as np
+import pandas as pd
+
+from rcv_cruncher.cvr.base import CastVoteRecord
 from rcv_cruncher.marks import BallotMarks
+from rcv_cruncher.matrix import BallotMatrix
 import rcv_cruncher.parsers as parsers
+import rcv_cruncher.dominion as dominion
 
 dir_path = pathlib.Path(os.path.dirname(os.path.realpath(__file__)))
 
 
+def ballot_lists(ballot_dict):
+    # parsers may return array columns (e.x. categorical fields), compare them as plain lists
+    return {col: list(values) for col, values in ballot_dict.items()}
+
+
 def test_candidate_column():
 
     expected_ballots = [
@@ -28,4 +42,299 @@ def test_candidate_column():
     test_cvr_path = dir_path / 'parser_test_files/candidate_column/test1'
     calc_ballot_dict = parsers.candidate_column(test_cvr_path)
 
-    assert expected_ballots == calc_ballot_dict['ranks']
+    assert expected_ballots == calc_ballot_dict['ranks'].to_lists()
+
+
+def test_surveyUSA(tmp_path):
+
+    (tmp_path / 'candidate_codes.csv').write_text('code,candidate\n1,A\n2,B\n3,Undecided\n')
+    (tmp_path / 'cvr.csv').write_text('ballotID,weight,rank1,rank2,rank3\n'
+                                      '1,1.5,1,2,\n'
+                                      '2,1,2,3,\n'
+                                      '3,0.5,,1,2\n'
+                                      '4,1,3,1,2\n')
+
+    # ranks end at the first empty rank, undecided ranks are skipped
+    calc_ballot_dict = parsers.surveyUSA(tmp_path)
+    assert calc_ballot_dict['ranks'].to_lists() == [
+        ['A', 'B', BallotMarks.SKIPPED],
+        ['B', BallotMarks.SKIPPED, BallotMarks.SKIPPED],
+        [BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.SKIPPED],
+        [BallotMarks.SKIPPED, 'A', 'B']
+    ]
+    assert calc_ballot_dict['weight'].tolist() == [1.5, 1, 0.5, 1]
+    assert calc_ballot_dict['ballotID'].tolist() == [1, 2, 3, 4]
+
+    # a candidate after an undecided rank, before the ranks end
+    (tmp_path / 'cvr.csv').write_text('ballotID,weight,rank1,rank2,rank3\n'
+                                      '1,1,3,1,\n')
+    with pytest.raises(RuntimeError):
+        parsers.surveyUSA(tmp_path)
+
+    # unknown candidate code
+    (tmp_path / 'cvr.csv').write_text('ballotID,weight,rank1,rank2,rank3\n'
+                                      '1,1,1,4,\n')
+    with pytest.raises(KeyError):
+        parsers.surveyUSA(tmp_path)
+
+
+def test_rank_column(tmp_path):
+
+    cvr_file = tmp_path / 'cvr.csv'
+    cvr_file.write_text('id,rank1,rank2,rank3,precinct\n'
+                        '1,1,2,,P1\n'
+                        '2,2,over,UWI,P2\n'
+                        '3,3,,1,\n'
+                        '4,X,3,skipped,P1\n')
+    (tmp_path / 'candidate_codes.csv').write_text('code,candidate\n1,A\n2,B\n3,C\n')
+
+    expected_ranks = [
+        ['A', 'B', BallotMarks.SKIPPED],
+        ['B', BallotMarks.OVERVOTE, BallotMarks.WRITEIN],
+        ['C', BallotMarks.SKIPPED, 'A'],
+        ['X', 'C', BallotMarks.SKIPPED]
+    ]
+
+    # chunks are read separately, values are converted as if the whole file was read at once
+    for chunksize in [1, 3, 100000]:
+        calc_ballot_dict = parsers.rank_column(cvr_file, chunksize=chunksize)
+        assert list(calc_ballot_dict) == ['ranks', 'id', 'precinct', 'weight']
+        assert calc_ballot_dict['ranks'].to_lists() == expected_ranks
+        assert calc_ballot_dict['ranks'].codes == BallotMatrix.from_rank_lists(expected_ranks).codes
+        assert calc_ballot_dict['id'].dtype == np.int64
+        assert calc_ballot_dict['id'].tolist() == [1, 2, 3, 4]
+        assert calc_ballot_dict['precinct'].tolist() == ['P1', 'P2', BallotMarks.SKIPPED, 'P1']
+        assert calc_ballot_dict['weight'] == [decimal.Decimal('1')] * 4
+
+    # numbers in a column that holds text elsewhere read as text, a rank column with blanks reads as floats
+    cvr_file.write_text('ward,rank1,rank2\n'
+                        '1,1,\n'
+                        '2,01,2\n'
+                        ',2,1\n'
+                        'W3,1.0,\n')
+    for chunksize in [1, 2, 100000]:
+        calc_ballot_dict = parsers.rank_column(cvr_file, chunksize=chunksize)
+        assert calc_ballot_dict['ward'].tolist() == ['1', '2', BallotMarks.SKIPPED, 'W3']
+        assert calc_ballot_dict['ranks'].to_lists() == [
+            ['A', BallotMarks.SKIPPED],
+            ['A', 'B'],
+            ['B', 'A'],
+            ['A', BallotMarks.SKIPPED]
+        ]
+
+    # a count column is folded into the weights
+    cvr_file.write_text('rank1,rank2,weight,count\n'
+                        '1,2,1,3\n'
+                        '2,,0.5,4\n')
+    calc_ballot_dict = parsers.rank_column(cvr_file)
+    assert list(calc_ballot_dict) == ['ranks', 'weight']
+    assert calc_ballot_dict['ranks'].to_lists() == [['A', 'B'], ['B', BallotMarks.SKIPPED]]
+    assert calc_ballot_dict['weight'] == [decimal.Decimal('3'), decimal.Decimal('2')]
+
+
+def test_minneapolis2009(tmp_path):
+
+    (tmp_path / 'convert.csv').write_text('Mayor\tA\t1\n'
+                                          'Mayor\tB\t2\n'
+                                          'Council\tX\t1\n')
+    cvr_file = tmp_path / 'cvr.csv'
+    cvr_file.write_text('precinct,rank1,rank2,rank3,count\n'
+                        'P1,1,2,XXX,3\n'
+                        'P1,2,XXX,XXX,1.0\n'
+                        'P2,1,2,XXX,2\n'
+                        'P1,1,2,XXX,1\n'
+                        'P2,2,1,XXX,0\n')
+
+    # rows stay aggregated, one record per precinct and ranking
+    calc_ballot_dict = parsers.minneapolis2009(cvr_file, 'Mayor')
+    assert calc_ballot_dict == {
+        'ranks': [['A', 'B', BallotMarks.SKIPPED],
+                  ['B', BallotMarks.SKIPPED, BallotMarks.SKIPPED],
+                  ['A', 'B', BallotMarks.SKIPPED]],
+        'weight': [decimal.Decimal('4'), decimal.Decimal('1'), decimal.Decimal('2')],
+        'precinct': ['P1', 'P1', 'P2']
+    }
+
+    # same statistics as the ballots written out one by one
+    expanded_ballot_dict = {'ranks': [], 'precinct': []}
+    for ranks, weight, precinct in zip(*calc_ballot_dict.values()):
+        expanded_ballot_dict['ranks'] += [ranks] * int(weight)
+        expanded_ballot_dict['precinct'] += [precinct] * int(weight)
+
+    weighted_stats = CastVoteRecord(parsed_cvr=calc_ballot_dict, split_fields=['precinct'])
+    expanded_stats = CastVoteRecord(parsed_cvr=expanded_ballot_dict, split_fields=['precinct'])
+    pd.testing.assert_frame_equal(weighted_stats.stats(add_split_stats=True),
+                                  expanded_stats.stats(add_split_stats=True), check_dtype=False)
+
+    with pytest.raises(RuntimeError):
+        parsers.minneapolis2009(cvr_file, 'Sheriff')
+
+
+def test_optech1(tmp_path):
+
+    expected_ballot_dict = {
+        'ranks': [
+            ['A', 'B', 'C'],
+            [BallotMarks.OVERVOTE, 'A', BallotMarks.SKIPPED],
+            [BallotMarks.WRITEIN, BallotMarks.SKIPPED, 'B'],
+            [BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.SKIPPED]
+        ],
+        'precinct': ['Pct 101', 'Pct 102', 'Pct 102', 'Pct 101'],
+        'tally_type': ['Election Day', 'Vote by Mail', 'Election Day', 'Vote by Mail'],
+        'ballotID': ['000000001', '000000002', '000000003', '000000004'],
+        'weight': [decimal.Decimal('1')] * 4
+    }
+
+    test_cvr_path = dir_path / 'parser_test_files/optech1/test1'
+    assert parsers.optech1(test_cvr_path, 'Mayor') == expected_ballot_dict
+
+    # lines of uneven length are read line by line, with the same result
+    (tmp_path / 'MasterLookup.txt').write_text((test_cvr_path / 'MasterLookup.txt').read_text())
+    ballot_image = (test_cvr_path / 'BallotImage.txt').read_text().split('\n')
+    ballot_image[0] += '  '
+    (tmp_path / 'BallotImage.txt').write_text('\n'.join(ballot_image))
+    assert parsers.optech1(tmp_path, 'Mayor') == expected_ballot_dict
+
+    # a rank recorded twice
+    ballot_image.append(ballot_image[1])
+    (tmp_path / 'BallotImage.txt').write_text('\n'.join(ballot_image))
+    with pytest.raises(RuntimeError):
+        parsers.optech1(tmp_path, 'Mayor')
+
+
+def test_unisyn(tmp_path):
+
+    expected_ranks = [
+        ['A', BallotMarks.OVERVOTE],
+        [BallotMarks.SKIPPED, 'C'],
+        ['C', 'B']
+    ]
+
+    test_cvr_path = dir_path / 'parser_test_files/unisyn/test1'
+    for n_workers in [1, 2]:
+        calc_ballot_dict = parsers.unisyn(test_cvr_path, n_workers=n_workers)
+        assert calc_ballot_dict['ranks'].to_lists() == expected_ranks
+        assert calc_ballot_dict['weight'] == [decimal.Decimal('1')] * 3
+
+    with pytest.raises(RuntimeError):
+        parsers.unisyn(tmp_path)
+
+    # each rank contest must hold every ballot
+    (tmp_path / 'cvr_01.xml').write_text((test_cvr_path / 'cvr_01.xml').read_text())
+    cvr_02 = (test_cvr_path / 'cvr_02.xml').read_text()
+    second_cvr = cvr_02.index('  <CVR>', cvr_02.index('</CVR>'))
+    (tmp_path / 'cvr_02.xml').write_text(cvr_02[:second_cvr] + cvr_02[cvr_02.index('  <Election'):])
+    with pytest.raises(RuntimeError):
+        parsers.unisyn(tmp_path)
+
+
+def test_dominion5_10():
+
+    expected_ranks = {
+        'Mayor': [
+            ['A', 'B', 'C'],
+            [BallotMarks.OVERVOTE, 'A', BallotMarks.SKIPPED],
+            ['C', BallotMarks.SKIPPED, 'B'],
+            [BallotMarks.SKIPPED, BallotMarks.SKIPPED, BallotMarks.SKIPPED]
+        ],
+        'Council': [
+            ['Y', BallotMarks.SKIPPED],
+            ['X', 'Y'],
+            [BallotMarks.SKIPPED, 'X'],
+            [BallotMarks.SKIPPED, BallotMarks.SKIPPED]
+        ]
+    }
+
+    test_cvr_path = dir_path / 'parser_test_files/dominion5_10/test1'
+
+    for office, ranks in expected_ranks.items():
+        assert parsers.dominion5_10(test_cvr_path, office)['ranks'] == ranks
+
+    with pytest.raises(RuntimeError):
+        parsers.dominion5_10(test_cvr_path, 'Sheriff')
+
+
+def test_dominion5_10_contests():
+
+    test_cvr_path = dir_path / 'parser_test_files/dominion5_10/test1'
+    contest_ballot_dicts = parsers.dominion5_10_contests(test_cvr_path, ['Mayor', 'Council', 'Sheriff'])
+
+    assert sorted(contest_ballot_dicts) == ['Council', 'Mayor']
+    for office, ballot_dict in contest_ballot_dicts.items():
+        assert ballot_lists(ballot_dict) == ballot_lists(parsers.dominion5_10(test_cvr_path, office))
+
+    # session fields stay coded
+    mayor = contest_ballot_dicts['Mayor']
+    for col in dominion.Dominion5_10.fields:
+        assert isinstance(mayor[col], pd.Categorical)
+        assert len(mayor[col]) == len(mayor['ranks'])
+
+    with pytest.raises(TypeError):
+        dominion.DominionVersion()
+
+    assert parsers.get_multi_contest_parser(parsers.dominion5_10) is parsers.dominion5_10_contests
+    assert parsers.get_multi_contest_parser(parsers.rank_column) is None
+
+
+def test_dominion5_10_zip(tmp_path):
+
+    test_cvr_path = dir_path / 'parser_test_files/dominion5_10/test1'
+
+    # exports are often zipped with a top level folder
+    zip_path = tmp_path / 'export.zip'
+    with zipfile.ZipFile(zip_path, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for fpath in test_cvr_path.iterdir():
+            zf.write(fpath, f'CVR_Export/{fpath.name}')
+
+    zip_ballot_dicts = parsers.dominion5_10_contests(zip_path, ['Mayor', 'Council'])
+    for office, ballot_dict in parsers.dominion5_10_contests(test_cvr_path, ['Mayor', 'Council']).items():
+        assert ballot_lists(zip_ballot_dicts[office]) == ballot_lists(ballot_dict)
+
+
+def test_dominion5_10_workers():
+
+    test_cvr_path = dir_path / 'parser_test_files/dominion5_10/test1'
+
+    worker_ballot_dicts = parsers.dominion5_10_contests(test_cvr_path, ['Mayor', 'Council'], n_workers=2)
+    for office, ballot_dict in parsers.dominion5_10_contests(test_cvr_path, ['Mayor', 'Council']).items():
+        assert ballot_lists(worker_ballot_dicts[office]) == ballot_lists(ballot_dict)
+
+
+def test_dominion5_4(tmp_path):
+
+    test_cvr_path = dir_path / 'parser_test_files/dominion5_10/test1'
+
+    # same export as a single CvrExport.json
+    sessions = []
+    for fpath in sorted(test_cvr_path.iterdir()):
+        if fpath.name.startswith('CvrExport'):
+            sessions += json.loads(fpath.read_text(encoding='utf8'))['Sessions']
+        else:
+            (tmp_path / fpath.name).write_text(fpath.read_text(encoding='utf8'), encoding='utf8')
+    (tmp_path / 'CvrExport.json').write_text(json.dumps({'Version': '5.4', 'Sessions': sessions}), encoding='utf8')
+
+    calc_ballot_dict = parsers.dominion5_4(tmp_path, 'Mayor')
+    expected_ballot_dict = parsers.dominion5_10(test_cvr_path, 'Mayor')
+
+    assert list(calc_ballot_dict) == ['ranks', 'weight', 'ballotID', 'precinctPortion', 'ballot_type',
+                                      'countingGroup', 'precinct']
+    for col in calc_ballot_dict:
+        assert list(calc_ballot_dict[col]) == list(expected_ballot_dict[col])
+
+
+def test_dominion_bucket_marks():
+
+    contest = {'rank_limit': 3, 'candidates': {1: 'A', 2: 'B'}}
+    marks = [
+        {'CandidateId': 1, 'Rank': 1, 'IsAmbiguous': False},
+        {'CandidateId': 1, 'Rank': 1, 'IsAmbiguous': False},
+        {'CandidateId': 2, 'Rank': 2, 'IsAmbiguous': True},
+        {'CandidateId': 2, 'Rank': 3, 'IsAmbiguous': False},
+        {'CandidateId': 1, 'Rank': 3, 'IsAmbiguous': False}
+    ]
+
+    # v5.4 and later count every mark, v5.2 counts repeated marks for a candidate once
+    assert dominion._bucket_marks(marks, contest, distinct_candidates=False) == \
+        [BallotMarks.OVERVOTE, BallotMarks.SKIPPED, BallotMarks.OVERVOTE]
+    assert dominion._bucket_marks(marks, contest, distinct_candidates=True) == \
+        ['A', BallotMarks.SKIPPED, BallotMarks.OVERVOTE]